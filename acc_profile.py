@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+# Reads the per-rank profiles of the OpenACC tracer (openacc_trace.cpp, written by
+# event_table_write_profile) and merges them into one report per kernel, data region
+# and other event site, e.g. for a job with 512 ranks:
+#   python acc_profile.py openacc_profile.*.accprof --top 20
+# The files are read by a pool of processes, the sites are grouped with NumPy.
+# test_acc_profile.py compares the merge of synthetic profiles with a direct summation.
+#
+# Binary .accprof format, all numbers little-endian:
+#   magic (8 bytes), header length (uint32), header (UTF-8 JSON with mpi_rank, host,
+#   n_strings, n_events and the numbers of the DATA, LAUNCH and OTHER kinds),
+#   the string table (per string its length as uint32 and its UTF-8 bytes)
+#   and n_events records of RECORD_DTYPE. Names are indices into the string table, -1 for none.
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+PROFILE_MAGIC = b"ACCPROF\x01"
+RECORD_DTYPE = np.dtype([("total_duration", "<u8"), ("total_bytes", "<u8"), ("n_calls", "<i8"),
+                         ("kind", "<i4"), ("kernel_name", "<i4"), ("src_file", "<i4"), ("func_name", "<i4"),
+                         ("line_start", "<i4"), ("line_end", "<i4"),
+                         ("func_line_start", "<i4"), ("func_line_end", "<i4")])
+KINDS = ["LAUNCH", "DATA", "OTHER"]
+NAME_FIELDS = ["kernel_name", "src_file", "func_name"]
+LINE_FIELDS = ["line_start", "line_end", "func_line_start", "func_line_end"]
+
+class accProfile():
+  # The profile of one rank. records is a structured array of RECORD_DTYPE,
+  # whose names index strings and whose kinds are those of the header.
+  def __init__(self, filename):
+    with open(filename, "rb") as f:
+      data = f.read()
+    if data[:len(PROFILE_MAGIC)] != PROFILE_MAGIC:
+      raise ValueError("%s is not an OpenACC profile" % filename)
+    offset = len(PROFILE_MAGIC)
+    header_size, = struct.unpack_from("<I", data, offset)
+    offset += 4
+    header = json.loads(data[offset:offset + header_size])
+    offset += header_size
+    self.mpi_rank = header["mpi_rank"]
+    self.host = header["host"]
+    self.kinds = header["kinds"]
+    self.strings = []
+    for _ in range(header["n_strings"]):
+      length, = struct.unpack_from("<I", data, offset)
+      self.strings.append(data[offset + 4:offset + 4 + length].decode(errors="replace"))
+      offset += 4 + length
+    self.records = np.frombuffer(data, dtype=RECORD_DTYPE, count=header["n_events"], offset=offset)
+
+def write_profile (filename, mpi_rank, host, strings, records, kinds=None):
+  # Same layout as event_table_write_profile, for tests and synthetic profiles.
+  kinds = kinds or {name: i for i, name in enumerate(KINDS)}
+  header = json.dumps({"mpi_rank": mpi_rank, "host": host, "n_strings": len(strings),
+                       "n_events": len(records), "kinds": kinds}).encode()
+  with open(filename, "wb") as f:
+    f.write(PROFILE_MAGIC + struct.pack("<I", len(header)) + header)
+    for s in strings:
+      encoded = s.encode()
+      f.write(struct.pack("<I", len(encoded)) + encoded)
+    f.write(np.asarray(records, dtype=RECORD_DTYPE).tobytes())
+
+def read_for_merge (filename):
+  # Runs in the pool. Returns the rank, the strings and the records with the kinds
+  # replaced by their index in KINDS (-1 for unknown kinds).
+  profile = accProfile(filename)
+  records = profile.records.copy()
+  kind_codes = np.full(len(records), -1, dtype=np.int32)
+  for code, name in enumerate(KINDS):
+    if name in profile.kinds: kind_codes[records["kind"] == profile.kinds[name]] = code
+  records["kind"] = kind_codes
+  return profile.mpi_rank, profile.strings, records
+
+class mergedProfile():
+  # One entry per event site, i.e. per kind, names and line ranges, over all ranks.
+  # The arrays are ordered like sites. per_rank_duration holds the duration of each site
+  # on each rank in ranks, 0 where a rank has not called it. Durations are in ns.
+  def __init__(self, strings, sites, ranks, n_calls, total_bytes, per_rank_duration, n_ranks_called):
+    self.strings = strings
+    self.sites = sites
+    self.ranks = ranks
+    self.n_calls = n_calls
+    self.total_bytes = total_bytes
+    self.per_rank_duration = per_rank_duration
+    self.total_duration = per_rank_duration.sum(axis=1)
+    self.min_duration = per_rank_duration.min(axis=1)
+    self.max_duration = per_rank_duration.max(axis=1)
+    self.mean_duration = per_rank_duration.mean(axis=1)
+    self.n_ranks_called = n_ranks_called
+    # Max over mean: 1 if all ranks spend the same time on the site.
+    with np.errstate(invalid="ignore", divide="ignore"):
+      self.imbalance = np.where(self.mean_duration > 0, self.max_duration / self.mean_duration, 1.0)
+
+  def kind (self, i):
+    return KINDS[self.sites[i, 0]] if self.sites[i, 0] >= 0 else "UNKNOWN"
+
+  def name (self, i, field):
+    index = self.sites[i, 1 + NAME_FIELDS.index(field)]
+    return self.strings[index] if index >= 0 else None
+
+  def lines (self, i):
+    return tuple(int(line) for line in self.sites[i, 1 + len(NAME_FIELDS):])
+
+def group_rows (keys):
+  # The distinct rows of keys, sorted, and for each row of keys the index of its distinct row.
+  # Like np.unique(keys, axis=0, return_inverse=True), which is much slower for many rows.
+  order = np.lexsort(keys.T[::-1])
+  sorted_keys = keys[order]
+  first = np.ones(len(keys), dtype=bool)
+  first[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+  index = np.empty(len(keys), dtype=np.int64)
+  index[order] = np.cumsum(first) - 1
+  return sorted_keys[first], index
+
+def merge_profiles (filenames, n_jobs=None):
+  n_jobs = n_jobs or os.cpu_count()
+  if n_jobs > 1 and len(filenames) > 1:
+    with ProcessPoolExecutor(min(n_jobs, len(filenames))) as pool:
+      profiles = list(pool.map(read_for_merge, filenames, chunksize=max(1, len(filenames) // (4 * n_jobs))))
+  else:
+    profiles = [read_for_merge(filename) for filename in filenames]
+
+  # The string tables of the ranks are mapped onto one, so that equal sites have equal keys.
+  string_ids = {}
+  keys, ranks, n_calls, total_bytes, durations = [], [], [], [], []
+  for mpi_rank, strings, records in profiles:
+    # The last entry maps -1 (no name) to -1.
+    remap = np.array([string_ids.setdefault(s, len(string_ids)) for s in strings] + [-1], dtype=np.int64)
+    columns = [records["kind"].astype(np.int64)] + [remap[records[field]] for field in NAME_FIELDS]
+    columns += [records[field].astype(np.int64) for field in LINE_FIELDS]
+    keys.append(np.stack(columns, axis=1))
+    ranks.append(np.full(len(records), mpi_rank, dtype=np.int64))
+    n_calls.append(records["n_calls"])
+    total_bytes.append(records["total_bytes"])
+    durations.append(records["total_duration"])
+
+  width = 1 + len(NAME_FIELDS) + len(LINE_FIELDS)
+  keys = np.concatenate(keys) if keys else np.empty((0, width), dtype=np.int64)
+  ranks = np.concatenate(ranks) if ranks else np.empty(0, dtype=np.int64)
+  sites, site_index = group_rows(keys)
+  rank_values, rank_index = np.unique(ranks, return_inverse=True)
+  n_sites = len(sites)
+
+  site_calls = np.zeros(n_sites, dtype=np.int64)
+  np.add.at(site_calls, site_index, np.concatenate(n_calls) if n_calls else [])
+  site_bytes = np.zeros(n_sites, dtype=np.uint64)
+  np.add.at(site_bytes, site_index, np.concatenate(total_bytes) if total_bytes else np.empty(0, np.uint64))
+  per_rank = np.bincount(site_index * len(rank_values) + rank_index,
+                         weights=np.concatenate(durations) if durations else None,
+                         minlength=n_sites * len(rank_values)).reshape(n_sites, len(rank_values))
+  n_ranks_called = np.bincount(site_index, minlength=n_sites)
+
+  strings = [None] * len(string_ids)
+  for s, i in string_ids.items(): strings[i] = s
+  return mergedProfile(strings, sites, rank_values, site_calls, site_bytes, per_rank, n_ranks_called)
+
+def report (merged, top=None, out=sys.stdout):
+  out.write("%d ranks, %d event sites\n" % (len(merged.ranks), len(merged.sites)))
+  for code, kind in enumerate(KINDS):
+    indices = np.flatnonzero(merged.sites[:, 0] == code)
+    if len(indices) == 0: continue
+    indices = indices[np.argsort(-merged.total_duration[indices], kind="stable")]
+    total = merged.total_duration[indices].sum()
+    out.write("\n%s: %d sites, %.6f s summed over all ranks\n" % (kind, len(indices), total * 1e-9))
+    header = "%10s %12s %7s %11s %11s %11s %9s" % ("calls", "total [s]", "share", "min [s]", "mean [s]",
+                                                   "max [s]", "max/mean")
+    if kind == "DATA": header += " %14s" % "bytes"
+    out.write(header + "  site\n")
+    for i in indices[:top]:
+      row = "%10d %12.6f %6.2f%% %11.6f %11.6f %11.6f %9.2f" % (
+            merged.n_calls[i], merged.total_duration[i] * 1e-9,
+            100 * merged.total_duration[i] / total if total > 0 else 0,
+            merged.min_duration[i] * 1e-9, merged.mean_duration[i] * 1e-9, merged.max_duration[i] * 1e-9,
+            merged.imbalance[i])
+      if kind == "DATA": row += " %14d" % merged.total_bytes[i]
+      line_start, line_end, func_line_start, func_line_end = merged.lines(i)
+      site = "%s in %s (%s:%d-%d)" % (merged.name(i, "kernel_name") or "-", merged.name(i, "func_name"),
+                                      merged.name(i, "src_file"), line_start, line_end)
+      if merged.n_ranks_called[i] < len(merged.ranks):
+        site += ", on %d ranks" % merged.n_ranks_called[i]
+      out.write(row + "  " + site + "\n")
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Merge the per-rank profiles of the OpenACC tracer.")
+  parser.add_argument("filenames", nargs="+", help="The .accprof files of the ranks.")
+  parser.add_argument("--jobs", dest="n_jobs", type=int, default=None,
+                      help="Nr. of processes which read the files, default: all cores.")
+  parser.add_argument("--top", dest="top", type=int, default=None,
+                      help="Show only the sites with the longest durations of each kind.")
+  args = parser.parse_args()
+
+  report(merge_profiles(args.filenames, args.n_jobs), args.top)
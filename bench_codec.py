@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# Compares the bytes per sample and the encoding time of the delta-encoded sample
+# blocks (sample_codec.py) with the text format of the first .hwout files, the binary
+# .hwout records and the plain float32 batches of the cluster protocol, for a
+# synthetic stream or a recorded .hwout file:
+#   python bench_codec.py --gpus 8 --samples 100000 --block 60
+#   python bench_codec.py --input node1_2024_01_01_00_00_00.hwout
+# The round trips are verified by test_sample_codec.py.
+
+import argparse
+import io
+import time
+
+import numpy as np
+
+import cluster
+import file_writer
+import sample_codec
+
+def synthetic_samples (n, num_gpus, n_host, rng):
+  # Slowly changing counters like those of an idle or steadily loaded node.
+  t = 1.7e9 + np.arange(n) * 0.1 + rng.normal(0, 2e-5, n)
+  values = np.empty((n, num_gpus, 8))
+  steps = lambda p, scale: np.cumsum(rng.random((n, num_gpus)) < p, axis=0) % scale
+  values[:, :, 0] = 40 + steps(0.01, 20)                                   # Temperature
+  values[:, :, 1] = 1410 - 15 * steps(0.005, 4)                            # Frequency
+  values[:, :, 2] = rng.integers(0, 5000, (n, num_gpus)) * (rng.random((n, num_gpus)) < 0.2)  # PCIE
+  values[:, :, 3] = np.round(60 + 5 * steps(0.05, 10) + rng.random((n, num_gpus)), 3)   # Power
+  values[:, :, 4] = 10 * steps(0.02, 10)                                   # GPU-Util
+  values[:, :, 5] = 5 * steps(0.02, 10)                                    # Memory-Util
+  values[:, :, 6] = 1024 + 256 * steps(0.001, 16)                          # Memory-Used
+  values[:, :, 7] = values[:, :, 1]                                        # SM-Clock
+  host_values = rng.random((n, n_host)) * 100                              # CPU
+  return t, values, host_values
+
+def text_hwout (t, values):
+  # The text records of the first .hwout files.
+  out = io.StringIO()
+  n_keys = values.shape[2]
+  for t_row, y_line in zip(t, values.reshape(len(t), -1)):
+    out.write("%.2f: " % t_row)
+    for i, y in enumerate(y_line):
+      if i > 0 and i % n_keys == 0: out.write("|| ")
+      out.write("%d " % y)
+    out.write("\n")
+  return out.getvalue().encode()
+
+def binary_hwout (t, values, host_values):
+  records = np.empty(len(t), dtype=file_writer.record_dtype(values[0].size, host_values.shape[1]))
+  records["t"] = t
+  records["values"] = values.reshape(len(t), -1)
+  if host_values.shape[1] > 0:
+    records["host"] = host_values
+  return records.tobytes()
+
+def blocks (block_size, t, values, host_values, encode):
+  return [encode(t[i:i + block_size], values[i:i + block_size], host_values[i:i + block_size])
+          for i in range(0, len(t), block_size)]
+
+def timed (function):
+  t_start = time.perf_counter()
+  result = function()
+  return result, time.perf_counter() - t_start
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Benchmark the delta-encoded sample blocks.")
+   parser.add_argument("--input", dest="filename", default=None,
+                       help="Take the samples from this .hwout file instead of a synthetic stream.")
+   parser.add_argument("--samples", dest="n_samples", type=int, default=20000)
+   parser.add_argument("--gpus", dest="num_gpus", type=int, default=4)
+   parser.add_argument("--host-keys", dest="n_host", type=int, default=3)
+   parser.add_argument("--block", dest="block_size", type=int, default=60,
+                       help="Nr. of samples per block, e.g. one batch of an agent.")
+   args = parser.parse_args()
+
+   rng = np.random.default_rng(0)
+
+   if args.filename is not None:
+      recording = file_writer.hwoutRecording(args.filename)
+      t = np.array(recording.t)
+      values = np.array(recording.values, dtype=np.float64)
+      host_values = np.array(recording.host_values, dtype=np.float64)
+   else:
+      t, values, host_values = synthetic_samples(args.n_samples, args.num_gpus, args.n_host, rng)
+   n = len(t)
+   print ("%d samples of %d GPUs x %d keys and %d host keys, blocks of %d samples"
+          % (n, values.shape[1], values.shape[2], host_values.shape[1], args.block_size))
+
+   text, t_text = timed(lambda: text_hwout(t, values))
+   binary, t_binary = timed(lambda: binary_hwout(t, values, host_values))
+   batches, t_batches = timed(lambda: blocks(args.block_size, t, values, host_values, cluster.encode_samples))
+   encoded, t_encode = timed(lambda: blocks(args.block_size, t, values, host_values, sample_codec.encode_block))
+   _, t_decode = timed(lambda: [sample_codec.decode_block(block) for block in encoded])
+
+   print ("                     bytes/sample   encode [samples/s]")
+   for name, size, seconds in [("text .hwout (old)", len(text), t_text),
+                               ("binary .hwout", len(binary), t_binary),
+                               ("float32 batches", sum(map(len, batches)), t_batches),
+                               ("delta blocks", sum(map(len, encoded)), t_encode)]:
+      print ("  %-18s %12.1f %18.0f" % (name, size / n, n / seconds))
+   print ("  delta blocks decode: %.0f samples/s" % (n / t_decode))
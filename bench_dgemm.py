@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+# Sweeps the DGEMM matrix size on one GPU to find the size with the highest GF/s.
+# All sizes run in one nvml.dgemmContext, so the cuBLAS handle and the matrices
+# are set up once for the largest size which fits and reused for the others.
+# The larger sizes are reported as OOM, e.g.
+#   python bench_dgemm.py --gpu 1 --sizes 2000 4000 8000 16000 --repeats 5
+
+import argparse
+
+import nvml
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Measure the DGEMM GF/s for several matrix sizes.")
+   parser.add_argument("--gpu", dest="gpu_id", type=int, default=0,
+                       help="The GPU to run on.")
+   parser.add_argument("--sizes", dest="sizes", type=int, nargs="+",
+                       default=[1000, 2000, 4000, 8000, 12000, 16000],
+                       help="Matrix sizes N.")
+   parser.add_argument("--repeats", dest="n_repeats", type=int, default=5,
+                       help="Nr. of timed DGEMMs per size.")
+   args = parser.parse_args()
+
+   context = nvml.dgemmContext(args.gpu_id)
+   results = context.sweep(args.sizes, args.n_repeats)
+   context.release()
+
+   print ("%8s %8s %10s %10s %10s %10s" % ("N", "Status", "Avg", "Min", "Max", "Stddev"))
+   for result in results:
+      print ("%8d %8s %10.1f %10.1f %10.1f %10.1f" % (result["N"], result["Status"], result["Avg"],
+                                                    result["Min"], result["Max"], result["Stddev"]))
+   ok = [result for result in results if result["Status"] == "OK"]
+   if ok:
+      best = max(ok, key=lambda result: result["Avg"])
+      print ("Best: N = %d with %.1f GF/s" % (best["N"], best["Avg"]))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+# Compares the payload size and time to generate the plot data for all traces
+# with and without min/max downsampling, for a synthetic history.
+
+import argparse
+import time
+
+import numpy as np
+import plotly
+
+import downsampling
+
+def payload (x, y):
+  traces = [{'x': x[:, i], 'y': y[:, i]} for i in range(y.shape[1])]
+  return plotly.io.json.to_json_plotly(traces)
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Benchmark the downsampling of the live plots.")
+   parser.add_argument("--buffer-size", dest="buffer_size", type=int, default=100000,
+                       help="Nr. of stored data points.")
+   parser.add_argument("--gpus", dest="num_gpus", type=int, default=8)
+   parser.add_argument("--keys", dest="num_keys", type=int, default=7)
+   parser.add_argument("--plot-width", dest="plot_width", type=int, default=600)
+   args = parser.parse_args()
+
+   rng = np.random.default_rng()
+   n = args.buffer_size
+   m = args.num_gpus * args.num_keys
+   t = np.arange(n) * 0.1
+   y = rng.integers(0, 100, size=(n, m)).astype(np.float64)
+   print ("%d traces with %d points each" % (m, n))
+
+   t_start = time.perf_counter()
+   s = payload(t[:, None].repeat(m, axis=1), y)
+   t_full = time.perf_counter() - t_start
+   print ("Full:        %10d bytes, %8.1f ms" % (len(s), t_full * 1e3))
+
+   downsampler = downsampling.minMaxDownsampler(n, args.plot_width // 2)
+   t_start = time.perf_counter()
+   x_red, y_red, n_done = downsampler.reduce(t, y, 0)
+   s = payload(x_red, y_red)
+   t_reduced = time.perf_counter() - t_start
+   print ("Downsampled: %10d bytes, %8.1f ms" % (len(s), t_reduced * 1e3))
+
+   # A steady update, where only the rows of one new bucket have to be processed.
+   n_new = downsampler.bucket_size
+   t_start = time.perf_counter()
+   x_red, y_red, n_done = downsampler.reduce(t[:n_new], y[:n_new], 0)
+   s = payload(x_red, y_red)
+   t_update = time.perf_counter() - t_start
+   print ("Update:      %10d bytes, %8.1f ms" % (len(s), t_update * 1e3))
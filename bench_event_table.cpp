@@ -0,0 +1,174 @@
+// Feeds synthetic OpenACC activity records into the event table of the tracer
+// (event_table.cpp) and, for comparison, into a list which is searched linearly
+// with strcmp, as register_event did before. Needs neither CUPTI nor a GPU:
+//
+//    g++ -std=c++17 -O2 -o bench_event_table bench_event_table.cpp event_table.cpp
+//    ./bench_event_table [n_sites] [n_records] [profile]
+//
+// With a filename, the table is also written as a profile of rank 0, in which the synthetic
+// kinds 0, 1 and 2 are DATA, LAUNCH and OTHER (see acc_profile.py).
+//
+// The records come from n_sites distinct event sites (default 5000) in 50 source files,
+// in a random order. Each record has its own copy of the names, like the records of
+// CUPTI, so neither variant can compare the name pointers.
+
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+#include <time.h>
+
+#include "event_table.h"
+
+#define N_KINDS 3
+#define DATA_KIND 0
+
+typedef struct {
+   int kind;
+   char kernelName[64];
+   char srcFile[64];
+   char funcName[64];
+   int line_start, line_end;
+   int func_line_start, func_line_end;
+   uint64_t duration;
+   uint64_t bytes;
+} synthetic_record_t;
+
+typedef struct list_event_st {
+   event_t event;
+   struct list_event_st *next;
+} list_event_t;
+
+static double now () {
+   struct timespec ts;
+   clock_gettime(CLOCK_MONOTONIC, &ts);
+   return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+static void fill_site (synthetic_record_t *r, int site) {
+   r->kind = site % N_KINDS;
+   const int line = 10 * (site / N_KINDS) + 1;
+   snprintf (r->srcFile, sizeof(r->srcFile), "/home/user/app/src/module_%d.F90", site % 50);
+   snprintf (r->funcName, sizeof(r->funcName), "compute_step_%d", site / 20);
+   if (r->kind == 1) {
+      snprintf (r->kernelName, sizeof(r->kernelName), "compute_step_%d_%d_gpu", site / 20, line);
+   } else {
+      r->kernelName[0] = '\0';
+   }
+   r->line_start = line;
+   r->line_end = line + 5;
+   r->func_line_start = 10 * (site / 20);
+   r->func_line_end = 10 * (site / 20) + 200;
+   r->duration = 1000 + site % 997;
+   r->bytes = r->kind == DATA_KIND ? 8 * (site + 1) : 0;
+}
+
+static const char *kernel_name (const synthetic_record_t *r) {
+   return r->kernelName[0] ? r->kernelName : NULL;
+}
+
+static bool list_matches (const event_t *ev, const synthetic_record_t *r) {
+   bool match = ev->kind == r->kind;
+   match &= !strcmp(ev->srcFile, r->srcFile);
+   match &= !strcmp(ev->funcName, r->funcName);
+   if (kernel_name(r) != NULL && ev->kernelName != NULL) {
+      match &= !strcmp(ev->kernelName, r->kernelName);
+   }
+   match &= ev->line_start == r->line_start;
+   match &= ev->line_end == r->line_end;
+   match &= ev->func_line_start == r->func_line_start;
+   match &= ev->func_line_end == r->func_line_end;
+   return match;
+}
+
+static void list_add (list_event_t **list, const synthetic_record_t *r) {
+   list_event_t *ev = *list;
+   for (; ev != NULL; ev = ev->next) {
+      if (list_matches(&ev->event, r)) {
+         ev->event.n_calls++;
+         ev->event.total_duration += r->duration;
+         ev->event.total_bytes += r->bytes;
+         return;
+      }
+   }
+   ev = (list_event_t*)calloc(1, sizeof(list_event_t));
+   ev->event.kind = r->kind;
+   ev->event.n_calls = 1;
+   ev->event.total_duration = r->duration;
+   ev->event.total_bytes = r->bytes;
+   ev->event.kernelName = kernel_name(r) ? strdup(r->kernelName) : NULL;
+   ev->event.srcFile = strdup(r->srcFile);
+   ev->event.funcName = strdup(r->funcName);
+   ev->event.line_start = r->line_start;
+   ev->event.line_end = r->line_end;
+   ev->event.func_line_start = r->func_line_start;
+   ev->event.func_line_end = r->func_line_end;
+   ev->next = *list;
+   *list = ev;
+}
+
+int main (int argc, char *argv[]) {
+   const int n_sites = argc > 1 ? atoi(argv[1]) : 5000;
+   const int n_records = argc > 2 ? atoi(argv[2]) : 200000;
+
+   // Every site occurs at least once, the others are random.
+   synthetic_record_t *records = (synthetic_record_t*)malloc(n_records * sizeof(synthetic_record_t));
+   srand(1234);
+   for (int i = 0; i < n_records; i++) {
+      fill_site (&records[i], i < n_sites ? i : rand() % n_sites);
+   }
+
+   event_table_t table;
+   event_table_init (&table);
+   double t_start = now();
+   for (int i = 0; i < n_records; i++) {
+      const synthetic_record_t *r = &records[i];
+      event_table_add (&table, r->kind, kernel_name(r), r->srcFile, r->funcName, r->line_start, r->line_end,
+                       r->func_line_start, r->func_line_end, r->duration, r->bytes);
+   }
+   const double t_table = now() - t_start;
+
+   list_event_t *list = NULL;
+   t_start = now();
+   for (int i = 0; i < n_records; i++) {
+      list_add (&list, &records[i]);
+   }
+   const double t_list = now() - t_start;
+
+   // Both have to arrive at the same totals.
+   int n_list = 0;
+   long long calls_list = 0, calls_table = 0;
+   unsigned long long bytes_list = 0, bytes_table = 0;
+   for (list_event_t *ev = list; ev != NULL; ev = ev->next) {
+      n_list++;
+      calls_list += ev->event.n_calls;
+      bytes_list += ev->event.total_bytes;
+   }
+   for (int i = 0; i < table.n_events; i++) {
+      calls_table += table.events[i].n_calls;
+      bytes_table += table.events[i].total_bytes;
+   }
+   bool ok = n_list == table.n_events && calls_list == calls_table && bytes_list == bytes_table
+              && n_list == n_sites && calls_table == n_records;
+
+   printf ("%d records from %d event sites\n", n_records, n_sites);
+   printf ("  Hash table: %10.1f ns/record\n", t_table / n_records * 1e9);
+   printf ("  List:       %10.1f ns/record\n", t_list / n_records * 1e9);
+   printf ("  Totals %s\n", ok ? "agree" : "DIFFER");
+
+   if (argc > 3 && !event_table_write_profile (&table, argv[3], 0, "synthetic", 0, 1, 2)) {
+      printf ("Could not write %s\n", argv[3]);
+      ok = false;
+   }
+
+   event_table_free (&table);
+   while (list != NULL) {
+      list_event_t *next = list->next;
+      free((void*)list->event.kernelName);
+      free((void*)list->event.srcFile);
+      free((void*)list->event.funcName);
+      free(list);
+      list = next;
+   }
+   free(records);
+   return ok ? 0 : 1;
+}
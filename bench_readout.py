@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+# Measures the latency of one deviceManager.readOut() sample or, with --sampler,
+# the rate and timing jitter of the background sampler.
+# Without a GPU, run it against the stub library (see stub_nvml.cpp):
+#   LD_LIBRARY_PATH=. STUB_NVML_DEVICES=8 python bench_readout.py
+#   LD_LIBRARY_PATH=. STUB_NVML_DEVICES=8 python bench_readout.py --sampler 0.005
+
+import argparse
+import array
+import sys
+import time
+
+import nvml
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Benchmark the per-sample readOut latency.")
+   parser.add_argument("--samples", dest="n_samples", type=int, default=1000,
+                       help="Nr. of timed readOut calls.")
+   parser.add_argument("--sampler", dest="period", type=float, default=None,
+                       help="Run the background sampler with this period in seconds instead.")
+   parser.add_argument("--duration", dest="duration", type=float, default=2.0,
+                       help="How long the background sampler runs, in seconds.")
+   args = parser.parse_args()
+
+   t_start = time.perf_counter()
+   device = nvml.deviceManager()
+   t_init = time.perf_counter() - t_start
+
+   if args.period is not None:
+      n_max = int(args.duration / args.period) + 16
+      samples = array.array('d', bytes(8 * n_max * (1 + device.getNumDevices() * len(device.getItemNames()))))
+      device.startSampler(args.period, n_max)
+      time.sleep(args.duration)
+      device.stopSampler()
+      n = device.drainSamples(samples)
+      row_size = len(samples) // n_max
+      t = [samples[i * row_size] for i in range(n)]
+      dt = sorted([t2 - t1 for t1, t2 in zip(t[:-1], t[1:])])
+      print ("Sampler with period %.1f us: %d samples in %.2f s" % (args.period * 1e6, n, args.duration))
+      print ("  Rate: %8.1f Hz" % ((n - 1) / (t[-1] - t[0])))
+      print ("  Drift:%8.1f us" % ((t[-1] - t[0] - (n - 1) * args.period) * 1e6))
+      print ("  Min interval: %8.1f us" % (dt[0] * 1e6))
+      print ("  Max interval: %8.1f us" % (dt[-1] * 1e6))
+      sys.exit(0)
+
+   device.readOut()
+   timings = []
+   for i in range(args.n_samples):
+      t_start = time.perf_counter()
+      device.readOut()
+      timings.append(time.perf_counter() - t_start)
+   timings.sort()
+
+   n = len(timings)
+   print ("Init:   %8.1f us" % (t_init * 1e6))
+   print ("readOut over %d samples:" % n)
+   print ("  Avg:  %8.1f us" % (sum(timings) / n * 1e6))
+   print ("  Min:  %8.1f us" % (timings[0] * 1e6))
+   print ("  Med:  %8.1f us" % (timings[n // 2] * 1e6))
+   print ("  P99:  %8.1f us" % (timings[min(n - 1, int(n * 0.99))] * 1e6))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# Backends which run the DGEMM and STREAM benchmarks of benchmark_queue and the tabs.
+# Each backend has
+#   dgemm(gpu_id, matrix_size, n_repeats)  -> {"Status", "Avg", "Min", "Max", "Stddev"} in GF/s
+#   stream(gpu_id, vector_size, n_repeats) -> {"Status", "Copy", "Scale", "Add", "Triad"} in GB/s
+#   dgemm_max_size(memory), stream_max_size(memory) and available_memory(deviceProps, gpu_id)
+#   memory_label, which says whose memory that is
+# "Status" is "OK" or an error, in which case the values are left out (STREAM) or 0 (DGEMM).
+# Without at least one repetition, there is nothing to measure and the status is INVALID_REPEATS.
+#   cuda: nvml.performDgemm and nvml.performStream on the GPU.
+#   host: NumPy (its BLAS) for DGEMM and a threaded STREAM in host memory, which gives the
+#         host baseline to compare the GPUs against and runs without CUDA, e.g. in CI:
+#           python benchmark_backend.py --backend host --matrix-size 500 --vector-size 1000000
+
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+import math
+import sys
+import time
+
+# As in stream.h and dgemm.cpp.
+SCALE_SCALAR = 3.0
+TRIAD_SCALAR = 3.0
+DOUBLE_SIZE = 8
+
+def dgemm_max_size (memory):
+  # Three N x N matrices of doubles.
+  return int(math.floor(math.sqrt(memory / 3 / DOUBLE_SIZE)))
+
+def stream_max_size (memory):
+  return math.floor(memory / (10 * DOUBLE_SIZE))
+
+def dgemm_flops (N):
+  # Counted like dgemm.cpp, i.e. including the addition of beta * C.
+  return N * N * (N + 1) * 2
+
+def stream_bytes (vector_size):
+  return {"Copy": 2 * DOUBLE_SIZE * vector_size, "Scale": 2 * DOUBLE_SIZE * vector_size,
+          "Add": 3 * DOUBLE_SIZE * vector_size, "Triad": 3 * DOUBLE_SIZE * vector_size}
+
+def gflops_statistics (gflops):
+  # Running mean and variance with the same update and normalization as dgemm.cpp.
+  if not gflops: return {"Avg": 0.0, "Min": 0.0, "Max": 0.0, "Stddev": 0.0}
+  avg, var = 0, 0
+  for r, value in enumerate(gflops):
+    if r > 0: var += (r * (value - avg)) ** 2 / (r * (r + 1))
+    avg = (value + r * avg) / (r + 1)
+  return {"Avg": avg, "Min": min(gflops), "Max": max(gflops),
+          "Stddev": math.sqrt(var / (len(gflops) + 1))}
+
+def stream_expected (n_repeats):
+  # The values of a, b and c after the repetitions, like check_results in stream.cu.
+  a, b, c = 2.0, 2.0, 0.0
+  for _ in range(n_repeats):
+    c = a
+    b = SCALE_SCALAR * c
+    c = a + b
+    a = b + TRIAD_SCALAR * c
+  return a, b, c
+
+class cudaBackend():
+  name = "cuda"
+  memory_label = "GPU"
+
+  def dgemm (self, gpu_id, matrix_size, n_repeats):
+    import nvml
+    return nvml.performDgemm(matrix_size, n_repeats, gpu_id)
+
+  def stream (self, gpu_id, vector_size, n_repeats):
+    import nvml
+    return nvml.performStream(vector_size, n_repeats, gpu_id)
+
+  def dgemm_max_size (self, memory):
+    return dgemm_max_size(memory)
+
+  def stream_max_size (self, memory):
+    return stream_max_size(memory)
+
+  def available_memory (self, deviceProps, gpu_id):
+    return deviceProps.total_mem[gpu_id]
+
+class hostBackend():
+  # The GPU ID is ignored, all jobs run on the host. The STREAM kernels are split into
+  # n_threads contiguous slices, whose NumPy operations release the GIL. The triad needs
+  # two operations, which run on blocks of block_size elements, so that the second one
+  # reads a from the cache and the memory traffic is the same as that of one pass.
+  name = "host"
+  memory_label = "Host"
+
+  def __init__(self, n_threads=None, block_size=1 << 15):
+    self.n_threads = n_threads or len(os.sched_getaffinity(0))
+    self.block_size = block_size
+
+  def dgemm (self, gpu_id, matrix_size, n_repeats, alpha=1.0, beta=1.0):
+    import numpy as np
+    if n_repeats < 1:
+      return {"Status": "INVALID_REPEATS", "Avg": 0.0, "Min": 0.0, "Max": 0.0, "Stddev": 0.0}
+    N = matrix_size
+    try:
+      row = 1.0 / (2.0 + np.sin(np.arange(N, dtype=np.float64)))
+      mA = np.ones((N, N))
+      mB = np.broadcast_to(row, (N, N)).copy()
+      mC = np.zeros((N, N))
+      product = np.empty((N, N))
+    except MemoryError:
+      return {"Status": "OOM", "Avg": 0.0, "Min": 0.0, "Max": 0.0, "Stddev": 0.0}
+    gflops = []
+    for _ in range(n_repeats):
+      t_start = time.perf_counter()
+      np.matmul(mA, mB, out=product)
+      if alpha != 1.0: product *= alpha
+      if beta != 1.0: mC *= beta
+      mC += product
+      gflops.append(dgemm_flops(N) / (time.perf_counter() - t_start) / 1e9)
+    result = {"Status": "OK"}
+    result.update(gflops_statistics(gflops))
+    return result
+
+  def stream (self, gpu_id, vector_size, n_repeats):
+    import numpy as np
+    if n_repeats < 1:
+      return {"Status": "INVALID_REPEATS"}
+    try:
+      a = np.full(vector_size, 2.0)
+      b = np.full(vector_size, 2.0)
+      c = np.zeros(vector_size)
+    except MemoryError:
+      return {"Status": "OOM_HOST"}
+    bounds = np.linspace(0, vector_size, self.n_threads + 1).astype(int)
+    slices = [slice(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+    block_size = self.block_size
+
+    def copy (s): np.copyto(c[s], a[s])
+    def scale (s): np.multiply(c[s], SCALE_SCALAR, out=b[s])
+    def add (s): np.add(a[s], b[s], out=c[s])
+    def triad (s):
+      for start in range(s.start, s.stop, block_size):
+        block = slice(start, min(start + block_size, s.stop))
+        np.multiply(c[block], TRIAD_SCALAR, out=a[block])
+        np.add(a[block], b[block], out=a[block])
+
+    kernels = {"Copy": copy, "Scale": scale, "Add": add, "Triad": triad}
+    min_times = dict.fromkeys(kernels, math.inf)
+    with ThreadPoolExecutor(len(slices)) as pool:
+      for _ in range(n_repeats):
+        for name, kernel in kernels.items():
+          t_start = time.perf_counter()
+          # list() waits for all slices, like cudaDeviceSynchronize.
+          list(pool.map(kernel, slices))
+          min_times[name] = min(min_times[name], time.perf_counter() - t_start)
+
+    expected = stream_expected(n_repeats)
+    for values, value in zip((a, b, c), expected):
+      if np.mean(np.abs(values - value)) > 1e-13 * abs(value):
+        return {"Status": "INVALID"}
+    result = {"Status": "OK"}
+    for name, n_bytes in stream_bytes(vector_size).items():
+      result[name] = n_bytes / min_times[name] * 1e-9
+    return result
+
+  def dgemm_max_size (self, memory):
+    return dgemm_max_size(memory)
+
+  def stream_max_size (self, memory):
+    return stream_max_size(memory)
+
+  def available_memory (self, deviceProps, gpu_id):
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+BACKENDS = {"cuda": cudaBackend, "host": hostBackend}
+
+def get_backend (name):
+  if name not in BACKENDS:
+    raise ValueError("Unknown benchmark backend: " + name)
+  return BACKENDS[name]()
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Run DGEMM and STREAM once with a benchmark backend.")
+  parser.add_argument("--backend", dest="backend", choices=list(BACKENDS), default="host")
+  parser.add_argument("--gpu", dest="gpu_id", type=int, default=0)
+  parser.add_argument("--matrix-size", dest="matrix_size", type=int, default=2000)
+  parser.add_argument("--vector-size", dest="vector_size", type=int, default=10000000)
+  parser.add_argument("--repeats", dest="n_repeats", type=int, default=5)
+  args = parser.parse_args()
+
+  backend = get_backend(args.backend)
+  dgemm = backend.dgemm(args.gpu_id, args.matrix_size, args.n_repeats)
+  print ("DGEMM N = %d: %s" % (args.matrix_size, dgemm["Status"]))
+  for key in ("Avg", "Min", "Max", "Stddev"):
+    print ("  %-6s %10.1f GF/s" % (key, dgemm[key]))
+  stream = backend.stream(args.gpu_id, args.vector_size, args.n_repeats)
+  print ("STREAM %d doubles: %s" % (args.vector_size, stream["Status"]))
+  for key in ("Copy", "Scale", "Add", "Triad"):
+    if key in stream: print ("  %-6s %10.1f GB/s" % (key, stream[key]))
+  sys.exit(0 if dgemm["Status"] == "OK" and stream["Status"] == "OK" else 1)
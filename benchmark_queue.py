@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+from collections import deque
+import multiprocessing
+import multiprocessing.connection
+import threading
+import time
+
+import benchmark_backend
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+def run_dgemm (backend, gpu_id, matrix_size, n_repeats):
+  return backend.dgemm(gpu_id, matrix_size, n_repeats)
+
+def run_stream (backend, gpu_id, vector_size, n_repeats):
+  return backend.stream(gpu_id, vector_size, n_repeats)
+
+# The benchmarks by name, called with the backend, the GPU and the parameters of a job.
+# They return a dict with the "Status" ("OK" or an error) and their values.
+BENCHMARKS = {"dgemm": run_dgemm, "stream": run_stream}
+
+def run_job (kind, backend_name, gpu_id, params, connection):
+  # Runs in a process of its own, which ends with the job, and sends the state and
+  # the result through the write end of the pipe of the job.
+  try:
+    result = BENCHMARKS[kind](benchmark_backend.get_backend(backend_name), gpu_id, **params)
+    state = DONE if result.get("Status") == "OK" else FAILED
+  except Exception as error:
+    result, state = {"Status": "%s: %s" % (type(error).__name__, error)}, FAILED
+  connection.send((state, result))
+  connection.close()
+
+class benchmarkQueue():
+  # Runs benchmark jobs with one slot per GPU, so that jobs on different GPUs run at
+  # the same time and jobs on the same GPU one after the other, in the order of submission.
+  # Each job runs in a new process, which is terminated if a running job is cancelled.
+  # The processes are spawned, since the dashboard process has already initialized CUDA.
+  # Every job sends its result through a pipe of its own, so that terminating one job
+  # cannot break the results of the others. A thread starts the jobs and collects their
+  # results, and a GPU is free again once the process of its job has ended. The dashboard
+  # only submits, cancels and reads snapshots of the jobs, none of which waits for a benchmark.
+  # The jobs run with the backend of this name, see benchmark_backend.BACKENDS.
+  def __init__(self, num_gpus, poll_s=0.2, backend="cuda"):
+    self.num_gpus = num_gpus
+    self.backend = benchmark_backend.get_backend(backend)
+    self.poll_s = poll_s
+    self.context = multiprocessing.get_context("spawn")
+    self.lock = threading.Lock()
+    self.jobs = {}
+    self.n_jobs = 0
+    self.n_groups = 0
+    # Incremented on every change of a job, so that views can skip unchanged snapshots.
+    self.version = 0
+    self.pending = [deque() for _ in range(num_gpus)]
+    # (job ID, process) on each GPU, and the same for the read end of the pipe of each process.
+    self.running = [None] * num_gpus
+    self.connections = {}
+    self.thread = threading.Thread(target=self.run, daemon=True)
+    self.thread.start()
+
+  def submit (self, kind, params, gpu_ids):
+    # Queues the benchmark on each of the GPUs. The jobs of one call form a group, e.g.
+    # to compare the GPUs. Returns the IDs of the jobs.
+    if kind not in BENCHMARKS:
+      raise ValueError("Unknown benchmark: " + kind)
+    invalid = [gpu_id for gpu_id in gpu_ids if not 0 <= gpu_id < self.num_gpus]
+    if invalid:
+      raise ValueError("Invalid GPU IDs: %s" % invalid)
+    with self.lock:
+      self.n_groups += 1
+      job_ids = []
+      for gpu_id in gpu_ids:
+        self.n_jobs += 1
+        self.jobs[self.n_jobs] = {"id": self.n_jobs, "group": self.n_groups, "kind": kind, "gpu": gpu_id,
+                                  "params": dict(params), "state": QUEUED, "result": None,
+                                  "submitted": time.time(), "started": None, "finished": None}
+        self.pending[gpu_id].append(self.n_jobs)
+        job_ids.append(self.n_jobs)
+      self.version += 1
+    self.start_jobs()
+    return job_ids
+
+  def cancel (self, job_id):
+    # Returns whether the job was still queued or running. The process of a running job
+    # is terminated, and its GPU takes the next job once the process has ended.
+    process = None
+    with self.lock:
+      job = self.jobs.get(job_id)
+      if job is None or job["state"] not in (QUEUED, RUNNING): return False
+      if job["state"] == QUEUED:
+        self.pending[job["gpu"]].remove(job_id)
+      else:
+        process = self.running[job["gpu"]][1]
+      self.finish(job, CANCELLED, None)
+    if process is not None:
+      process.terminate()
+    return True
+
+  def snapshot (self):
+    # Copies of all jobs in the order of submission, and the version they belong to.
+    with self.lock:
+      return [dict(job) for job in self.jobs.values()], self.version
+
+  def busy_gpus (self):
+    with self.lock:
+      return [gpu_id for gpu_id, running in enumerate(self.running) if running is not None]
+
+  def finish (self, job, state, result):
+    job["state"] = state
+    job["result"] = result
+    job["finished"] = time.time()
+    self.version += 1
+
+  def start_jobs (self):
+    with self.lock:
+      for gpu_id in range(self.num_gpus):
+        if self.running[gpu_id] is not None or not self.pending[gpu_id]: continue
+        job = self.jobs[self.pending[gpu_id].popleft()]
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=run_job, daemon=True,
+                                       args=(job["kind"], self.backend.name, gpu_id, job["params"], sender))
+        process.start()
+        # Only the child keeps the write end, so the read end sees EOF once the child has ended.
+        sender.close()
+        self.running[gpu_id] = (job["id"], process)
+        self.connections[receiver] = (job["id"], process)
+        job["state"] = RUNNING
+        job["started"] = time.time()
+        self.version += 1
+
+  def collect_result (self, connection):
+    # The result of the job of the connection, or its exit code if it ended without one.
+    # The connections are only read and closed by the thread of run.
+    try:
+      state, result = connection.recv()
+    except (EOFError, OSError):
+      state, result = FAILED, None
+    connection.close()
+    with self.lock:
+      job_id, process = self.connections.pop(connection)
+    process.join()
+    if result is None:
+      result = {"Status": "Exit code %d" % process.exitcode}
+    with self.lock:
+      job = self.jobs[job_id]
+      if self.running[job["gpu"]] is not None and self.running[job["gpu"]][0] == job_id:
+        self.running[job["gpu"]] = None
+      # A cancelled job keeps its state.
+      if job["state"] == RUNNING:
+        self.finish(job, state, result)
+
+  def run (self):
+    while True:
+      with self.lock:
+        connections = list(self.connections)
+      if connections:
+        for connection in multiprocessing.connection.wait(connections, self.poll_s):
+          self.collect_result(connection)
+      else:
+        time.sleep(self.poll_s)
+      self.start_jobs()
+
+def job_rows (jobs, kind, result_keys):
+  # Rows of strings for a table of the jobs of one benchmark, newest first:
+  # job, GPU, parameters, state and the result values. Jobs which ran on several GPUs
+  # at once also show the first result value relative to the best GPU of their group.
+  jobs = [job for job in jobs if job["kind"] == kind]
+  best = {}
+  for job in jobs:
+    if job["state"] == DONE:
+      best[job["group"]] = max(best.get(job["group"], 0), job["result"][result_keys[0]])
+  group_size = {}
+  for job in jobs:
+    group_size[job["group"]] = group_size.get(job["group"], 0) + 1
+  rows = []
+  for job in reversed(jobs):
+    params = ", ".join("%s=%s" % item for item in job["params"].items())
+    state = job["state"]
+    if state == FAILED: state += " (%s)" % job["result"]["Status"]
+    if state == RUNNING: state += " (%.0f s)" % (time.time() - job["started"])
+    values = ["%.1f" % job["result"][key] if job["state"] == DONE else "" for key in result_keys]
+    if group_size[job["group"]] > 1 and job["state"] == DONE and best[job["group"]] > 0:
+      relative = "%.0f %%" % (100 * job["result"][result_keys[0]] / best[job["group"]])
+    else:
+      relative = ""
+    rows.append([str(job["id"]), str(job["gpu"]), params, state] + values + [relative])
+  return rows
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+# Parts shared by the DGEMM and STREAM tabs, which run their benchmarks through a
+# benchmark_queue.benchmarkQueue.
+
+from dash import html
+
+import benchmark_queue
+
+ALL_GPUS = -1
+
+def gpu_options (deviceProps):
+  options = [{'label': "GPU %d: %s" % (gpu_id, name), 'value': gpu_id} for gpu_id, name in enumerate(deviceProps.names)]
+  if len(deviceProps.names) > 1:
+    options.append({'label': "All GPUs at once", 'value': ALL_GPUS})
+  return options
+
+def chosen_gpus (deviceProps, gpu_id):
+  return list(range(len(deviceProps.names))) if gpu_id == ALL_GPUS else [gpu_id]
+
+def jobs_table (jobs, kind, result_keys, unit):
+  header = ["Job", "GPU", "Parameters", "State"] + ["%s [%s]" % (key, unit) for key in result_keys] + ["vs. best GPU"]
+  rows = [html.Tr([html.Th(name) for name in header])]
+  for row in benchmark_queue.job_rows(jobs, kind, result_keys):
+    rows.append(html.Tr([html.Td(cell) for cell in row]))
+  return rows
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+
+# Agents and an aggregator for watching the GPUs of several nodes.
+# An agent (monitor_record.py --aggregator ADDRESS) sends the new rows of its
+# multiProcState to the aggregator (cluster_dashboard.py) in binary batches over
+# one persistent connection, and connects again after the connection is lost.
+# Addresses are HOST:PORT for TCP or unix:PATH for a Unix socket.
+#
+# Each message is a frame of a header (kind, length of the payload) and the payload:
+#   HELLO:   JSON with the node name, device names, keys and host keys. Sent first
+#            on every connection.
+#   SAMPLES: the number of rows, GPUs, keys and host keys, then the timestamps (wall
+#            clock, float64), the values (time x GPU x key) and the host values
+#            (time x host key), both float32.
+#   BLOCK:   the same rows as a delta-encoded and compressed block, see sample_codec.py.
+#            This is what the agents send.
+#
+# Backpressure: an agent reads the rows for the next batch only after the last one
+# has been handed to the socket (drain), and the aggregator reads one frame after the
+# other. If the aggregator or the network falls behind, the batches get larger instead
+# of queueing up, and rows which are older than the buffer of the agent's store are dropped.
+
+import asyncio
+import json
+import multiprocessing
+import struct
+import threading
+import time
+
+import numpy as np
+
+import sample_codec
+import sample_store
+
+HELLO = 1
+SAMPLES = 2
+BLOCK = 3
+
+FRAME_HEADER = struct.Struct("<BI")
+SAMPLES_HEADER = struct.Struct("<IHHH")
+# Larger frames are taken as a broken stream.
+MAX_FRAME_SIZE = 1 << 28
+
+def parse_address(address):
+  # ("unix", path) or ("tcp", host, port). An empty host listens on all interfaces.
+  if address.startswith("unix:"):
+    return ("unix", address[len("unix:"):])
+  host, sep, port = address.rpartition(":")
+  if not sep or not port.isdigit():
+    raise ValueError("Invalid address %s, expected HOST:PORT or unix:PATH" % address)
+  return ("tcp", host.strip("[]"), int(port))
+
+def frame(kind, payload):
+  return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+def encode_hello(node_name, device_names, keys, host_keys):
+  return frame(HELLO, json.dumps({"node": node_name, "devices": list(device_names),
+                                  "keys": list(keys), "host_keys": list(host_keys)}).encode())
+
+def encode_samples(t, values, host_values):
+  n, num_gpus, n_keys = values.shape
+  return frame(SAMPLES, SAMPLES_HEADER.pack(n, num_gpus, n_keys, host_values.shape[1])
+                        + np.ascontiguousarray(t, dtype="<f8").tobytes()
+                        + np.ascontiguousarray(values, dtype="<f4").tobytes()
+                        + np.ascontiguousarray(host_values, dtype="<f4").tobytes())
+
+def decode_samples(payload):
+  n, num_gpus, n_keys, n_host = SAMPLES_HEADER.unpack_from(payload)
+  offset = SAMPLES_HEADER.size
+  t = np.frombuffer(payload, dtype="<f8", count=n, offset=offset)
+  offset += 8 * n
+  values = np.frombuffer(payload, dtype="<f4", count=n * num_gpus * n_keys, offset=offset)
+  offset += 4 * n * num_gpus * n_keys
+  host_values = np.frombuffer(payload, dtype="<f4", count=n * n_host, offset=offset)
+  return t, values.reshape(n, num_gpus, n_keys), host_values.reshape(n, n_host)
+
+def wall_clock_offset():
+  # The timestamps of a store are relative to its start in CLOCK_MONOTONIC, the clock
+  # of the sampler (get_time_monotonic in common.cpp). Adding this gives the wall clock.
+  return time.time() - time.clock_gettime(time.CLOCK_MONOTONIC)
+
+async def read_frame(reader):
+  kind, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+  if length > MAX_FRAME_SIZE:
+    raise ConnectionError("Frame of %d bytes" % length)
+  return kind, await reader.readexactly(length)
+
+async def open_connection(address):
+  parsed = parse_address(address)
+  if parsed[0] == "unix":
+    return await asyncio.open_unix_connection(parsed[1])
+  return await asyncio.open_connection(parsed[1], parsed[2])
+
+class clusterAgent():
+  # Sends the rows of a multiProcState to the aggregator every period seconds from a
+  # thread with its own event loop. The writer of the store can be another process.
+  def __init__(self, state, device_names, node_name, address, period=1.0,
+               min_retry_s=0.5, max_retry_s=10.0):
+    self.state = state
+    self.device_names = device_names
+    self.node_name = node_name
+    self.address = address
+    parse_address(address)
+    self.period = period
+    self.min_retry_s = min_retry_s
+    self.max_retry_s = max_retry_s
+    self.n_sent = 0
+    self.n_connects = 0
+    self.loop = None
+    self.stopping = None
+    self.thread = None
+
+  def start(self):
+    started = threading.Event()
+    self.thread = threading.Thread(target=lambda: asyncio.run(self.run(started)), daemon=True)
+    self.thread.start()
+    started.wait()
+
+  def stop(self, timeout=5.0):
+    # Sends the remaining rows if the agent is connected.
+    self.loop.call_soon_threadsafe(self.stopping.set)
+    self.thread.join(timeout)
+
+  async def wait(self, seconds):
+    try:
+      await asyncio.wait_for(self.stopping.wait(), seconds)
+    except asyncio.TimeoutError:
+      pass
+
+  async def run(self, started):
+    self.loop = asyncio.get_running_loop()
+    self.stopping = asyncio.Event()
+    started.set()
+    retry_s = self.min_retry_s
+    while not self.stopping.is_set():
+      try:
+        reader, writer = await open_connection(self.address)
+      except OSError:
+        await self.wait(retry_s)
+        retry_s = min(2 * retry_s, self.max_retry_s)
+        continue
+      retry_s = self.min_retry_s
+      self.n_connects += 1
+      try:
+        writer.write(encode_hello(self.node_name, self.device_names, self.state.keys, self.state.host_keys))
+        await writer.drain()
+        while True:
+          await self.send_new_rows(writer)
+          if self.stopping.is_set(): break
+          await self.wait(self.period)
+      except (OSError, ConnectionError):
+        pass
+      finally:
+        writer.close()
+        try:
+          await writer.wait_closed()
+        except (OSError, ConnectionError):
+          pass
+
+  async def send_new_rows(self, writer):
+    if self.state.n_written.value < self.n_sent:
+      # The store has been reset.
+      self.n_sent = 0
+    t, values, host_values, n_written = self.state.get_since(self.n_sent)
+    if len(t) == 0: return
+    t_wall = t + self.state.start_time.value + wall_clock_offset()
+    writer.write(frame(BLOCK, sample_codec.encode_block(t_wall, values, host_values)))
+    await writer.drain()
+    self.n_sent = n_written
+
+class clusterNode():
+  # The store of one node at the aggregator, on the time axis of the cluster.
+  def __init__(self, name, device_names, keys, host_keys, buffer_size, start_time):
+    self.name = name
+    self.device_names = device_names
+    self.state = sample_store.multiProcState(keys, buffer_size, len(device_names), start_time, host_keys)
+    self.connected = False
+    self.last_seen = None
+
+  def same_layout(self, device_names, keys, host_keys):
+    return (device_names == self.device_names and keys == list(self.state.keys)
+            and host_keys == list(self.state.host_keys))
+
+  def latest(self, key):
+    # The last value of the key on each GPU, NaN if there is none yet.
+    n_written = self.state.n_written.value
+    if key not in self.state.keys or n_written == 0:
+      return np.full(self.state.num_gpus, np.nan)
+    _, values, _, _ = self.state.get_since(n_written - 1)
+    return values[-1, :, self.state.keys[key]].copy()
+
+class clusterAggregator():
+  # Accepts connections of agents and stores the rows of each node in its clusterNode.
+  # The event loop runs in a thread, so the dashboard of the same process can read the
+  # stores. The timestamps of all nodes are seconds since the aggregator was started.
+  def __init__(self, address, buffer_size=600):
+    self.address = address
+    parse_address(address)
+    self.buffer_size = buffer_size
+    self.start_time = multiprocessing.RawValue('d', time.time())
+    self.nodes = {}
+    self.connections = set()
+    self.handlers = set()
+    self.server = None
+    self.loop = None
+    self.stopping = None
+    self.thread = None
+
+  def start(self):
+    started = threading.Event()
+    errors = []
+    self.thread = threading.Thread(target=lambda: asyncio.run(self.run(started, errors)), daemon=True)
+    self.thread.start()
+    started.wait()
+    if errors: raise errors[0]
+
+  def stop(self, timeout=5.0):
+    # Closes the connections of the agents, which will try to connect again.
+    self.loop.call_soon_threadsafe(self.stopping.set)
+    self.thread.join(timeout)
+
+  async def run(self, started, errors):
+    self.loop = asyncio.get_running_loop()
+    self.stopping = asyncio.Event()
+    parsed = parse_address(self.address)
+    try:
+      if parsed[0] == "unix":
+        self.server = await asyncio.start_unix_server(self.handle, parsed[1])
+      else:
+        self.server = await asyncio.start_server(self.handle, parsed[1] or None, parsed[2])
+    except OSError as error:
+      errors.append(error)
+      started.set()
+      return
+    started.set()
+    await self.stopping.wait()
+    self.server.close()
+    for writer in list(self.connections):
+      writer.close()
+    await asyncio.gather(*self.handlers, return_exceptions=True)
+
+  def port(self):
+    # The TCP port, e.g. if the aggregator was started with port 0.
+    return self.server.sockets[0].getsockname()[1]
+
+  def node_list(self):
+    # The nodes in the order in which they connected first. Safe to call from other threads.
+    return list(self.nodes.values())
+
+  def add_node(self, hello):
+    name, device_names = hello["node"], hello["devices"]
+    keys, host_keys = hello["keys"], hello["host_keys"]
+    node = self.nodes.get(name)
+    if node is None or not node.same_layout(device_names, keys, host_keys):
+      node = clusterNode(name, device_names, keys, host_keys, self.buffer_size, self.start_time)
+      self.nodes[name] = node
+    return node
+
+  async def handle(self, reader, writer):
+    node = None
+    self.connections.add(writer)
+    self.handlers.add(asyncio.current_task())
+    try:
+      while True:
+        kind, payload = await read_frame(reader)
+        if kind == HELLO:
+          node = self.add_node(json.loads(payload))
+          node.connected = True
+        elif kind in (SAMPLES, BLOCK) and node is not None:
+          if kind == SAMPLES:
+            t, values, host_values = decode_samples(payload)
+          else:
+            t, values, host_values = sample_codec.decode_block(payload)
+          if values.shape[1:] != node.state.values.shape[1:] or host_values.shape[1] != len(node.state.host_keys):
+            raise ConnectionError("Samples of node %s do not match its keys" % node.name)
+          node.state.put_rows(t, values, host_values)
+          node.last_seen = time.time()
+        else:
+          raise ConnectionError("Unexpected message of kind %d" % kind)
+    except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+      pass
+    finally:
+      if node is not None: node.connected = False
+      writer.close()
+      self.connections.discard(writer)
+      self.handlers.discard(asyncio.current_task())
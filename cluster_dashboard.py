@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# Dashboard for the GPUs of several nodes. Each node runs an agent, e.g.
+#   monitor_record.py --no-record --aggregator <dashboard host>:9460 --rate 1
+# and this dashboard shows the latest values of all nodes and the plots of a chosen one.
+# It does not need GPUs or the nvml module itself.
+import argparse
+
+import dash
+from dash import html
+from dash import dcc
+
+import cluster
+import cluster_tab
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Launch the dashboard for the GPUs of several nodes.")
+   parser.add_argument("--listen", dest="address", default=":9460",
+                       help="Address for the agents, HOST:PORT or unix:PATH.")
+   parser.add_argument("--buffer-size", dest="buffer_size", type=int, default=600,
+                       help="Nr. of data points to be stored for each node.")
+   parser.add_argument("--update-time", dest="t_update", type=float, default=2.0,
+                       help="Time interval in seconds in which the views update themselves.")
+   args = parser.parse_args()
+
+   aggregator = cluster.clusterAggregator(args.address, args.buffer_size)
+   aggregator.start()
+
+   app = dash.Dash()
+   app.layout = html.Div(
+      dcc.Tabs([
+         cluster_tab.Tab(aggregator, args.t_update)
+      ]),
+   )
+   cluster_tab.register_callbacks(app, aggregator)
+
+   app.run_server()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import dash
+from dash import html
+from dash import dcc
+from dash.dependencies import Input, Output
+import plotly
+import time
+import numpy as np
+
+# One heatmap (node x GPU) of the latest values for each of these keys.
+HEATMAP_KEYS = ["GPU-Util", "Power"]
+# A node which has not sent samples for this many seconds is shown as stale.
+STALE_S = 10.0
+
+def node_label (node):
+  if not node.connected:
+    return node.name + " (offline)"
+  if node.last_seen is None or time.time() - node.last_seen > STALE_S:
+    return node.name + " (stale)"
+  return node.name
+
+def heatmap_figure (nodes, key, plot_width):
+  # Nodes with fewer GPUs than the largest one are padded with NaN, which is not drawn.
+  max_gpus = max([node.state.num_gpus for node in nodes], default=0)
+  z = np.full((len(nodes), max_gpus), np.nan)
+  text = []
+  for i, node in enumerate(nodes):
+    z[i, :node.state.num_gpus] = node.latest(key)
+    text.append(node.device_names + [""] * (max_gpus - node.state.num_gpus))
+  return {'data': [{'type': 'heatmap', 'z': z, 'text': text, 'colorscale': 'Viridis',
+                    'x': ["GPU %d" % gpu_id for gpu_id in range(max_gpus)],
+                    'y': [node_label(node) for node in nodes],
+                    'customdata': [[node.name] * max_gpus for node in nodes],
+                    'hovertemplate': '%{y} %{x} (%{text}): %{z}<extra></extra>',
+                    'colorbar': {'title': {'text': key}}}],
+          'layout': {'title': {'text': key}, 'width': plot_width,
+                     'height': 150 + 30 * len(nodes), 'yaxis': {'autorange': 'reversed'}}}
+
+def node_figure (node, plot_width):
+  # The stored values of all keys of one node, one subplot per key.
+  keys = list(node.state.keys)
+  t, values, _, _ = node.state.get_since(0)
+  fig = plotly.tools.make_subplots(rows=max(len(keys), 1), cols=1, vertical_spacing=0.2 / max(len(keys), 1))
+  for irow, key in enumerate(keys, start=1):
+    for gpu_id, device_name in enumerate(node.device_names):
+      fig.append_trace({'x': t, 'y': values[:, gpu_id, node.state.keys[key]], 'mode': 'lines',
+                        'name': "GPU%d (%s)" % (gpu_id, device_name), 'legendgroup': str(gpu_id),
+                        'showlegend': irow == 1}, irow, 1)
+    fig.update_yaxes(row=irow, col=1, title_text=key)
+  fig.update_xaxes(title_text="t [s]")
+  fig.update_layout(height=max(len(keys), 1) * 250, width=plot_width, title_text=node.name)
+  return fig
+
+def Tab (aggregator, t_update_s):
+  return dcc.Tab(
+           label='Cluster', children=[
+           html.H1('Cluster'),
+           html.P(id='cluster-nodes', children='Waiting for agents on %s' % aggregator.address),
+           html.Div(children=[dcc.Graph(id='cluster-heatmap-' + key, style={'display': 'inline-block'})
+                              for key in HEATMAP_KEYS]),
+           html.H2('Node:'),
+           dcc.Dropdown(id='cluster-choose-node', options=[], value=None),
+           dcc.Graph(id='cluster-node-graph'),
+           dcc.Interval(id='cluster-interval-component',
+                        interval = t_update_s * 1000,
+                        n_intervals = 0),
+           ],
+         )
+
+def register_callbacks (app, aggregator, plot_width=600):
+  # The heatmaps are only redrawn if a node has sent new samples or its state has changed.
+  heatmaps_shown = [None]
+
+  @app.callback(
+      [Output('cluster-heatmap-' + key, 'figure') for key in HEATMAP_KEYS]
+      + [Output('cluster-nodes', 'children'), Output('cluster-choose-node', 'options')],
+      Input('cluster-interval-component', 'n_intervals'))
+  def update_heatmaps(n):
+    nodes = aggregator.node_list()
+    shown = tuple((node.name, node_label(node), node.state.n_written.value) for node in nodes)
+    if shown == heatmaps_shown[0] or not nodes:
+      return [dash.no_update] * (len(HEATMAP_KEYS) + 2)
+    heatmaps_shown[0] = shown
+    n_online = len([node for node in nodes if node.connected])
+    status = "%d of %d nodes connected, %d GPUs" % (n_online, len(nodes), sum(node.state.num_gpus for node in nodes))
+    return ([heatmap_figure(nodes, key, plot_width) for key in HEATMAP_KEYS]
+            + [status, [node.name for node in nodes]])
+
+  @app.callback(
+      Output('cluster-choose-node', 'value'),
+      [Input('cluster-heatmap-' + key, 'clickData') for key in HEATMAP_KEYS],
+      prevent_initial_call=True)
+  def drill_down(*click_data):
+    clicked = dash.callback_context.triggered[0]['value']
+    if not clicked: return dash.no_update
+    return clicked['points'][0]['customdata']
+
+  node_shown = [None]
+
+  @app.callback(
+      Output('cluster-node-graph', 'figure'),
+      Input('cluster-choose-node', 'value'),
+      Input('cluster-interval-component', 'n_intervals'))
+  def update_node_graph(name, n):
+    node = aggregator.nodes.get(name)
+    if node is None: return dash.no_update
+    shown = (name, node.state.n_written.value)
+    if shown == node_shown[0]: return dash.no_update
+    node_shown[0] = shown
+    return node_figure(node, plot_width)
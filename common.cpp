@@ -1,8 +1,9 @@
 #include "time.h"
 
+// CLOCK_MONOTONIC, which is also the clock of the sampler thread and of time.monotonic().
 double get_time_monotonic () {
    struct timespec tp;
-   clock_gettime(CLOCK_MONOTONIC_RAW, &tp);
+   clock_gettime(CLOCK_MONOTONIC, &tp);
    return (double)tp.tv_sec + (double)tp.tv_nsec * 1e-9;
 }
 
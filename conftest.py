@@ -0,0 +1,2 @@
+# test_monitor.py is an interactive readout loop, not a test module.
+collect_ignore = ["test_monitor.py"]
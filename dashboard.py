@@ -6,18 +6,23 @@ from dash import html
 from dash import dcc
 import nvml
 
+import benchmark_backend
+import benchmark_queue
 import device_properties
 import host_reader
+import metrics
+import metrics_exporter
 import overview_tab
 import live_plots
 import dgemm_tab
 import stream_tab
 
 
-# Pay attention that the order of the keys corresponds to the one
-# in nvml.getItems. (get keys from C++?)
-keys = ["Temperature", "Frequency", "PCIE", "Power", "GPU-Util", "Memory-Util", "CPU"]
-labels = ["T [C]", "f [MHz]", "", "P [W]", "GPU-Util [%]", "Memory-Util [%]", "CPU [%]"]
+# The metrics which are shown by default, see metrics.default_registry for all of them.
+# CPU, Host-Memory and Load are read by the hostReader and stored once for the host.
+# Local-CPU and NUMA-Memory are the load of the cores and the memory node next to each GPU.
+default_metrics = ["Temperature", "Frequency", "PCIE", "Power", "GPU-Util", "Local-CPU", "NUMA-Memory",
+                   "Memory-Util", "CPU", "Host-Memory", "Load"]
 init_keys = ["GPU-Util", "Memory-Util"]
 
 if __name__ == '__main__':
@@ -31,13 +36,31 @@ if __name__ == '__main__':
    parser.add_argument("--logfile", action=argparse.BooleanOptionalAction,
                        dest="do_logfile", default=True,
                        help="Create / do not create a logfile")
+   parser.add_argument("--metrics", dest="metrics", default=",".join(default_metrics),
+                       help="Comma-separated list of the metrics to record, or 'all'. Available: "
+                            + ", ".join(metrics.default_registry().names()))
+   parser.add_argument("--max-cost", dest="max_cost", choices=metrics.COST_CLASSES, default="expensive",
+                       help="Leave out the metrics which are more expensive to query.")
+   parser.add_argument("--metric-period", dest="metric_periods", action="append", default=[],
+                       metavar="NAME=SECONDS",
+                       help="Read a metric only every SECONDS instead of at every sample. Can be repeated.")
+   parser.add_argument("--benchmark-backend", dest="benchmark_backend",
+                       choices=list(benchmark_backend.BACKENDS), default="cuda",
+                       help="Run the DGEMM and STREAM tabs on the GPUs (cuda) or in host memory (host).")
+   parser.add_argument("--metrics-port", dest="metrics_port", type=int, default=None,
+                       help="Serve the latest values at http://<host>:PORT/metrics for Prometheus.")
    args = parser.parse_args()
+   registry = metrics.default_registry()
+   registry.set_periods(args.metric_periods)
+   plot_metrics = registry.select(None if args.metrics == "all" else args.metrics.split(","), args.max_cost)
 
    device = nvml.deviceManager()
    num_gpus = device.getNumGpus()
    deviceProps = device_properties.deviceProperties(device, num_gpus)
-   host_reader = host_reader.hostReader()
-   hwPlots = live_plots.hardwarePlotCollection(device, host_reader, keys, labels, init_keys)
+   pci_bus_ids = [device.getPciBusId(gpu_id) for gpu_id in range(device.getNumDevices())]
+   host_reader = host_reader.hostReader(pci_bus_ids=pci_bus_ids)
+   jobs = benchmark_queue.benchmarkQueue(num_gpus, backend=args.benchmark_backend)
+   hwPlots = live_plots.hardwarePlotCollection(device, host_reader, plot_metrics, init_keys, args.buffer_size)
 
    app = dash.Dash()
    
@@ -51,8 +74,13 @@ if __name__ == '__main__':
       ]),
    )
 
-   live_plots.register_callbacks(app, hwPlots, deviceProps)
-   dgemm_tab.register_callbacks(app)
-   stream_tab.register_callbacks(app)
+   if args.metrics_port is not None:
+      metrics_exporter.start_server(metrics_exporter.metricsExporter(live_plots.global_values, deviceProps.names,
+                                                                     host_reader.host_name, registry),
+                                    args.metrics_port)
+
+   live_plots.register_callbacks(app, hwPlots, deviceProps, args.do_logfile)
+   dgemm_tab.register_callbacks(app, deviceProps, jobs)
+   stream_tab.register_callbacks(app, deviceProps, jobs)
 
    app.run_server()
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from collections import OrderedDict
+
 import nvml
 
 class deviceProperties():
@@ -10,23 +12,57 @@ class deviceProperties():
     self.total_mem = [memory["Free"] for memory in memories]
     self.total_mem_gib = [total_mem / 1024 / 1024 / 1024 for total_mem in self.total_mem]
     self.processes = [nvml_device.getProcessInfo(gpu_id) for gpu_id in range(num_gpus)]
+    self.process_names = processNameCache(nvml_device)
+    # procString of each GPU, rebuilt only when its process list changes.
+    self.proc_strings = [None] * num_gpus
     self.persistence_enabled = [nvml_device.getPersistenceMode(gpu_id) for gpu_id in range(num_gpus)]
 
 
   def update_process(self, nvml_device, gpu_id):
-    self.processes[gpu_id] = nvml_device.getProcessInfo(gpu_id)
+    # Returns whether the processes on the GPU have changed since the last call.
+    processes = nvml_device.getProcessInfo(gpu_id)
+    if processes == self.processes[gpu_id]: return False
+    self.processes[gpu_id] = processes
+    self.proc_strings[gpu_id] = None
+    return True
 
   def procString(self, nvml_device, gpu_id):
-    gpu_name = self.names[gpu_id]
-    processes = self.processes[gpu_id]
-    n = len(processes)
-    s = "%s: %d" % (gpu_name, n)
-    if n > 0:
-      s += "["
-      for i, proc in enumerate(processes):
-        s += str(proc) + "(" + nvml_device.getProcessName(proc) + ")"
-        if i < n - 1: 
-          s += ", "
-      s += "]"
-    return s
+    if self.proc_strings[gpu_id] is None:
+      processes = self.processes[gpu_id]
+      s = "%s: %d" % (self.names[gpu_id], len(processes))
+      if len(processes) > 0:
+        s += "[" + ", ".join(["%d(%s)" % (pid, self.process_names.get(pid)) for pid in processes]) + "]"
+      self.proc_strings[gpu_id] = s
+    return self.proc_strings[gpu_id]
+
+def process_start_time(pid):
+  # Start time of a process in clock ticks since boot, from field 22 of /proc/<pid>/stat.
+  # None if the process is not visible, e.g. because it runs in another PID namespace.
+  try:
+    with open("/proc/%d/stat" % pid, "rb") as f:
+      stat = f.read()
+  except OSError:
+    return None
+  # The command name in parentheses can contain spaces.
+  return int(stat[stat.rindex(b")") + 2:].split()[19])
+
+class processNameCache():
+  # Names of processes as reported by NVML. An entry is keyed by the PID and the start
+  # time of the process, so that a PID which is reused by a new process is looked up
+  # again. The least recently used entries are dropped beyond max_size.
+  def __init__(self, nvml_device, max_size=1024):
+    self.nvml_device = nvml_device
+    self.max_size = max_size
+    self.names = OrderedDict()
 
+  def get(self, pid):
+    key = (pid, process_start_time(pid))
+    name = self.names.get(key)
+    if name is None:
+      name = self.nvml_device.getProcessName(pid)
+      self.names[key] = name
+      if len(self.names) > self.max_size:
+        self.names.popitem(last=False)
+    else:
+      self.names.move_to_end(key)
+    return name
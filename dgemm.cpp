@@ -9,120 +9,173 @@
 #include "common.h"
 #include "dgemm.h"
 
-void init_matrices (long long N, double *__restrict__ mA, double *__restrict__ mB, double *__restrict__ mC) {
-   double *__restrict__ init_vec = (double*)aligned_alloc (64, sizeof(double) * N);
+static unsigned int error_status (cudaError_t cuda_error) {
+   return cuda_error == cudaErrorMemoryAllocation ? DGEMM_CUBLAS_ERR_OOM : DGEMM_CUBLAS_ERR_OTHER;
+}
 
-   for (long long  i = 0; i < N; i++) {
-      double value = 2.0 + sin((double)i);
-      init_vec[i] = value;
+// All rows of a matrix are the same, so only one row is written on the host. It is copied to
+// the first row of the device matrix, which is then doubled by device-to-device copies.
+static cudaError_t fill_matrix (double *dev, const double *host_row, long long N) {
+   cudaError_t cuda_error = cudaMemcpy(dev, host_row, N * sizeof(double), cudaMemcpyHostToDevice);
+   const long long n_elements = N * N;
+   for (long long filled = N; filled < n_elements && cuda_error == cudaSuccess; filled *= 2) {
+      const long long n_copy = filled < n_elements - filled ? filled : n_elements - filled;
+      cuda_error = cudaMemcpy(dev + filled, dev, n_copy * sizeof(double), cudaMemcpyDeviceToDevice);
    }
+   return cuda_error;
+}
 
-   for (long long i = 0; i < N; i++) {
-      for (long long j = 0; j < N; j++) {
-         mA[i * N + j] = init_vec[j];
-         mB[i * N + j] = 1.0 / init_vec[j];
-         mA[i * N + j] = 1.0;
-      }
+static cudaError_t init_matrices (dgemm_context_t *context, long long N) {
+   double *row = context->host_row;
+   for (long long j = 0; j < N; j++) {
+      row[j] = 1.0;
    }
-
-   free(init_vec);
+   cudaError_t cuda_error = fill_matrix (context->devA, row, N);
+   if (cuda_error != cudaSuccess) return cuda_error;
+   for (long long j = 0; j < N; j++) {
+      row[j] = 1.0 / (2.0 + sin((double)j));
+   }
+   return fill_matrix (context->devB, row, N);
 }
 
 int dgemmMaxSize (const double memory_size) {
   return (int)floor(sqrt(memory_size / 3 / sizeof(double)));
 }
 
-void doDgemm(const int N, const double alpha, const double beta, const int n_repeats,
-             double *gflops_avg, double *gflops_min, double *gflops_max, double *gflops_stddev,
-             unsigned int *status) {
-   const long long required_memory = 3.0 * N * N * sizeof(double);
+void dgemmContextInit (dgemm_context_t *context, int gpu_id) {
+   context->gpu_id = gpu_id;
+   context->has_handle = false;
+   context->host_row = NULL;
+   context->host_capacity = 0;
+   context->devA = context->devB = context->devC = NULL;
+   context->device_capacity = 0;
+   context->N_initialized = 0;
+}
+
+static void free_device_buffers (dgemm_context_t *context) {
+   cudaFree(context->devA);
+   cudaFree(context->devB);
+   cudaFree(context->devC);
+   context->devA = context->devB = context->devC = NULL;
+   context->device_capacity = 0;
+   context->N_initialized = 0;
+}
+
+unsigned int dgemmContextReserve (dgemm_context_t *context, int N) {
+   const long long Nll = (long long)N;
+   cudaError_t cuda_error = cudaSetDevice(context->gpu_id);
+   if (cuda_error != cudaSuccess) return DGEMM_CUBLAS_ERR_OTHER;
+   if (!context->has_handle) {
+      if (cublasCreate(&context->cublas_handle) != CUBLAS_STATUS_SUCCESS) return DGEMM_CUBLAS_ERR_OTHER;
+      context->has_handle = true;
+   }
+   if (Nll > context->host_capacity) {
+      cudaFreeHost(context->host_row);
+      context->host_row = NULL;
+      context->host_capacity = 0;
+      cuda_error = cudaMallocHost((void**) &context->host_row, Nll * sizeof(double));
+      if (cuda_error != cudaSuccess) {
+         context->host_row = NULL;
+         return error_status(cuda_error);
+      }
+      context->host_capacity = Nll;
+   }
+   if (Nll * Nll > context->device_capacity) {
+      // The old buffers are freed first, so that they do not count against the new ones.
+      free_device_buffers(context);
+      double **buffers[3] = {&context->devA, &context->devB, &context->devC};
+      for (int i = 0; i < 3; i++) {
+         cuda_error = cudaMalloc((void**) buffers[i], Nll * Nll * sizeof(double));
+         if (cuda_error != cudaSuccess) {
+            *buffers[i] = NULL;
+            free_device_buffers(context);
+            return error_status(cuda_error);
+         }
+      }
+      context->device_capacity = Nll * Nll;
+   }
+   return DGEMM_CUBLAS_SUCCESS;
+}
+
+void dgemmContextFree (dgemm_context_t *context) {
+   cudaSetDevice(context->gpu_id);
+   free_device_buffers(context);
+   cudaFreeHost(context->host_row);
+   context->host_row = NULL;
+   context->host_capacity = 0;
+   if (context->has_handle) cublasDestroy(context->cublas_handle);
+   context->has_handle = false;
+}
+
+void doDgemmInContext (dgemm_context_t *context, const int N, const double alpha, const double beta, const int n_repeats,
+                       double *gflops_avg, double *gflops_min, double *gflops_max, double *gflops_stddev,
+                       unsigned int *status) {
    const long long Nll = (long long)N;
    const long long flops_per_step = Nll * Nll * (Nll + 1) * 2;
 
+   // The results stay 0 if the run fails.
    *gflops_avg = 0;
-   *gflops_min = DBL_MAX;
+   *gflops_min = 0;
    *gflops_max = 0;
    *gflops_stddev = 0;
 
-   cublasHandle_t cublas_handle;
-   cublasStatus_t cublas_status = cublasCreate(&cublas_handle);
-  
-   double *__restrict__ mA, *devA;
-   double *__restrict__ mB, *devB;
-   double *__restrict__ mC, *devC;
-      
-   mA = (double*)aligned_alloc(64, Nll * Nll * sizeof(double));
-   mB = (double*)aligned_alloc(64, Nll * Nll * sizeof(double));
-   mC = (double*)aligned_alloc(64, Nll * Nll * sizeof(double));
-
-   cudaError_t cuda_error;
-   cuda_error = cudaMalloc((void**) &devA, Nll * Nll * sizeof(double));
-   if (cuda_error != cudaSuccess) {
-      if (cuda_error == cudaErrorMemoryAllocation) {
-        *status = DGEMM_CUBLAS_ERR_OOM;
-      } else {
-        *status = DGEMM_CUBLAS_ERR_OTHER;
-      }
-      return;
+   *status = dgemmContextReserve(context, N);
+   if (*status != DGEMM_CUBLAS_SUCCESS) return;
+
+   cudaError_t cuda_error = cudaSuccess;
+   if (context->N_initialized != N) {
+      context->N_initialized = 0;
+      cuda_error = init_matrices (context, Nll);
+      if (cuda_error == cudaSuccess) context->N_initialized = N;
    }
-   cuda_error = cudaMalloc((void**) &devB, Nll * Nll * sizeof(double));
+   if (cuda_error == cudaSuccess) cuda_error = cudaMemset(context->devC, 0, Nll * Nll * sizeof(double));
    if (cuda_error != cudaSuccess) {
-      if (cuda_error == cudaErrorMemoryAllocation) {
-        *status = DGEMM_CUBLAS_ERR_OOM;
-      } else {
-        *status = DGEMM_CUBLAS_ERR_OTHER;
-      }
+      *status = error_status(cuda_error);
       return;
    }
-   cuda_error = cudaMalloc((void**) &devC, Nll * Nll * sizeof(double));
-   if (cuda_error != cudaSuccess) {
-      if (cuda_error == cudaErrorMemoryAllocation) {
-        *status = DGEMM_CUBLAS_ERR_OOM;
-      } else {
-        *status = DGEMM_CUBLAS_ERR_OTHER;
-      }
-      return;
-   }
-
-   init_matrices (N, mA, mB, mC);
-   cuda_error = cudaMemcpy(devA, mA, N * N * sizeof(double), cudaMemcpyHostToDevice);
-   cuda_error = cudaMemcpy(devB, mB, N * N * sizeof(double), cudaMemcpyHostToDevice);
-   cuda_error = cudaMemcpy(devC, mC, N * N * sizeof(double), cudaMemcpyHostToDevice);
 
    double this_gflops;
    double gflops_var = 0;
+   double min_gflops = DBL_MAX;
    for (int r = 0; r < n_repeats; r++) {
       const double t_start = get_time_monotonic();
-      cublas_status = cublasDgemm (cublas_handle,
-                                   CUBLAS_OP_N, CUBLAS_OP_N,
-                                   N, N, N,
-                                   &alpha,
-                                   devB, N,
-                                   devA, N,
-                                   &beta,
-                                   devC, N);
+      cublasStatus_t cublas_status = cublasDgemm (context->cublas_handle,
+                                                  CUBLAS_OP_N, CUBLAS_OP_N,
+                                                  N, N, N,
+                                                  &alpha,
+                                                  context->devB, N,
+                                                  context->devA, N,
+                                                  &beta,
+                                                  context->devC, N);
 
       // Important!
       cuda_error = cudaDeviceSynchronize();
       const double t_end = get_time_monotonic();
+      if (cublas_status != CUBLAS_STATUS_SUCCESS || cuda_error != cudaSuccess) {
+         *status = DGEMM_CUBLAS_ERR_OTHER;
+         return;
+      }
       double t_elapsed = t_end - t_start;
       this_gflops = flops_per_step / t_elapsed / 1e9;
       if (r > 0) gflops_var = gflops_var + pow(r * (this_gflops - *gflops_avg), 2) / (r * (r+1));
       *gflops_avg = (this_gflops + r * *gflops_avg) / (r + 1);
-      if (this_gflops < *gflops_min) *gflops_min = this_gflops;
+      if (this_gflops < min_gflops) min_gflops = this_gflops;
       if (this_gflops > *gflops_max) *gflops_max = this_gflops;
-      //printf ("GFLOPS: %lf\n", *perf);
    }
 
-   //*perf = gflops_avg;
+   *gflops_min = min_gflops;
    *gflops_stddev = sqrt(gflops_var / (n_repeats + 1));
-
-   cublas_status = cublasDestroy(cublas_handle);
-   free(mA);
-   free(mB);
-   free(mC);
-   cudaFree(devA);
-   cudaFree(devB);
-   cudaFree(devC);
    *status = DGEMM_CUBLAS_SUCCESS;
 }
+
+void doDgemm(const int N, const double alpha, const double beta, const int n_repeats,
+             double *gflops_avg, double *gflops_min, double *gflops_max, double *gflops_stddev,
+             unsigned int *status) {
+   int gpu_id = 0;
+   cudaGetDevice(&gpu_id);
+   dgemm_context_t context;
+   dgemmContextInit(&context, gpu_id);
+   doDgemmInContext(&context, N, alpha, beta, n_repeats,
+                    gflops_avg, gflops_min, gflops_max, gflops_stddev, status);
+   dgemmContextFree(&context);
+}
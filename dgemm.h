@@ -1,13 +1,37 @@
 #ifndef DGEMM_H
 #define DGEMM_H
 
+#include <cublas_v2.h>
+
 constexpr unsigned int DGEMM_CUBLAS_SUCCESS{0};
 constexpr unsigned int DGEMM_CUBLAS_ERR_OOM{1};
 constexpr unsigned int DGEMM_CUBLAS_ERR_OTHER{2};
 
+// Keeps the cuBLAS handle and the buffers of the DGEMM benchmark between runs, so that
+// a run only allocates and initializes the matrices if they are larger than before.
+// The host buffer (pinned) holds one row, which is replicated on the device.
+typedef struct {
+   int gpu_id;
+   bool has_handle;
+   cublasHandle_t cublas_handle;
+   double *host_row;
+   long long host_capacity;
+   double *devA, *devB, *devC;
+   long long device_capacity;
+   // Size of the matrices which are currently initialized, 0 if none.
+   int N_initialized;
+} dgemm_context_t;
+
 int dgemmMaxSize (const double memory_size);
 double get_time_monotonic ();
 
+void dgemmContextInit (dgemm_context_t *context, int gpu_id);
+unsigned int dgemmContextReserve (dgemm_context_t *context, int N);
+void dgemmContextFree (dgemm_context_t *context);
+void doDgemmInContext (dgemm_context_t *context, const int N, const double alpha, const double beta, const int n_repeats,
+                       double *gflops_avg, double *gflops_min, double *gflops_max, double *gflops_stddev,
+                       unsigned int *status);
+
 void doDgemm(const int N, const double alpha, const double beta, const int n_repeats,
              double *gflops_agv, double *gflops_min, double *gflops_max, double *gflops_stddev,
              unsigned int *status);
@@ -5,98 +5,82 @@ from dash import html
 from dash import dcc
 from dash.dependencies import Input, Output, State
 import plotly
-import nvml
-
-import multiprocessing
 
+import benchmark_tab
 import device_properties
 
-DGEMM_RESULT_BUFFER_SIZE = 1024
-DGEMM_STATE_IDLE = 0
-DGEMM_STATE_BUSY = 1
-DGEMM_STATE_DONE = 2
-
-matrix_size = 1000
-n_repeat = 30
-
-dgemm_result = multiprocessing.Array('u', 1024)
-dgemm_busy_flag = multiprocessing.Value('i', 0)
+RESULT_KEYS = ["Avg", "Min", "Max", "Stddev"]
 
 def Tab (deviceProps):
-  max_dgemm_size = nvml.dgemmMaxMatrixSize(deviceProps.total_mem[0])
   return dcc.Tab(label='Dgemm', children=[
          html.H1('This is a new tab!'),
-         html.P(children="Available GPU Memory: " + str(deviceProps.total_mem_gib[0]) + " GiB"),
-         html.P(children="Maximal DGEMM matrix size: " + str(max_dgemm_size)),
+         html.Div(["GPU: ",
+                   dcc.Dropdown(id='dgemm-gpu', options=benchmark_tab.gpu_options(deviceProps), value=0, clearable=False)
+         ]),
+         html.P(id='dgemm-memory'),
          html.Div(["Matrix size: ",
                    dcc.Input(id='input-dgemm-matrix-size', value=20000, type='number')
          ]),
          html.Div(["N Repeats: ",
-                   dcc.Input(id='input-dgemm-nrepeat', value=10, type='str')
+                   dcc.Input(id='input-dgemm-nrepeat', value=10, type='number')
          ]),
          html.Button('DGEMM', id='start-dgemm', n_clicks=0),
-         html.P(id='button-out', children='This is the button output'),
+         html.P(id='button-out', children=''),
+         html.Div(["Job: ",
+                   dcc.Input(id='dgemm-cancel-id', type='number'),
+                   html.Button('Cancel', id='cancel-dgemm', n_clicks=0),
+                   html.Span(id='dgemm-cancel-out')
+         ]),
          html.Div(children= [
-            html.P(id='live-update-dgemm', children='Nothing happened'),
+            html.Table(id='live-update-dgemm'),
             dcc.Interval(id='dgemm-interval-component', interval = 1000, n_intervals = 0)
-         ]) 
+         ])
     ])
 
+def register_callbacks(app, deviceProps, jobs):
+  @app.callback(
+     Output('dgemm-memory', 'children'),
+     Input('dgemm-gpu', 'value'))
+  def show_memory (gpu_id):
+    gpu_ids = benchmark_tab.chosen_gpus(deviceProps, gpu_id)
+    # All GPUs run the same size, so the smallest memory limits it.
+    memory = min(jobs.backend.available_memory(deviceProps, i) for i in gpu_ids)
+    return "Available %s Memory: %.2f GiB, maximal DGEMM matrix size: %d" % (
+           jobs.backend.memory_label, memory / 1024**3,
+           jobs.backend.dgemm_max_size(memory))
 
-def multiprocDgemm (matrix_size, n_repeats, result_string, busy_flag):
-  busy_flag.value = DGEMM_STATE_BUSY
-  gflops = nvml.performDgemm(matrix_size, n_repeats)
-  status = gflops["Status"]
-  if status == "OK":
-     s = "DGEMM result for N = %d" % matrix_size + "\n" \
-         "  Avg: %6.1f GF/s" % gflops["Avg"] + "\n" \
-         "  Min: %6.1f GF/s" % gflops["Min"] + "\n" \
-         "  Max: %6.1f GF/s" % gflops["Max"] + "\n" \
-         "  Stddev: %6.1f GF/s" % gflops["Stddev"]
-  else:
-     s = "DGEMM failed: Error %s" % status
-
-  for i in range(len(s)):
-     result_string[i] = s[i]
-
-  busy_flag.value = DGEMM_STATE_DONE
-
-def register_callbacks(app):
   @app.callback(
      Output('button-out', 'children'),
      Input('start-dgemm', 'n_clicks'),
+     State('dgemm-gpu', 'value'),
      State('input-dgemm-matrix-size', 'value'),
-     State('input-dgemm-nrepeat', 'value')
-  )
-  def do_button_click (n_clicks, matrix_size, n_repeats):
-    if n_clicks > 0:
-       dgemm_proc = multiprocessing.Process(target=multiprocDgemm, args=(matrix_size, n_repeats, dgemm_result, dgemm_busy_flag))
-       dgemm_proc.start()
-       dgemm_proc.join()
-    #return 'The input was "{}" and "{}"'.format(matrix_size, n_repeats)
-  
+     State('input-dgemm-nrepeat', 'value'),
+     prevent_initial_call=True)
+  def do_button_click (n_clicks, gpu_id, matrix_size, n_repeats):
+    if matrix_size is None or n_repeats is None:
+      return "Invalid input"
+    job_ids = jobs.submit("dgemm", {"matrix_size": int(matrix_size), "n_repeats": int(n_repeats)},
+                          benchmark_tab.chosen_gpus(deviceProps, gpu_id))
+    return "Queued job %s" % ", ".join(map(str, job_ids))
+
   @app.callback(
-     Output('live-update-dgemm', 'children'),
-     Input('live-update-dgemm', 'children'),
-     Input('dgemm-interval-component', 'n_intervals'))
-  def update_result(original_name, n_intervals):
-    if dgemm_busy_flag.value == DGEMM_STATE_IDLE:
-       ret = "Waiting"
-    elif dgemm_busy_flag.value == DGEMM_STATE_BUSY:
-       ret = "Busy"
-    elif dgemm_busy_flag.value == DGEMM_STATE_DONE: 
-       ret = []
-       tmp = ""
-       for s in dgemm_result:
-         if s == '\0':
-           break
-         elif s == '\n':
-           ret.append (tmp)
-           ret.append (html.Br())
-           tmp = ""
-         else:
-           tmp += s
-       ret.append(tmp)
-    return ret
+     Output('dgemm-cancel-out', 'children'),
+     Input('cancel-dgemm', 'n_clicks'),
+     State('dgemm-cancel-id', 'value'),
+     prevent_initial_call=True)
+  def do_cancel_click (n_clicks, job_id):
+    if job_id is None: return ""
+    return " Cancelled job %d" % job_id if jobs.cancel(int(job_id)) else " Job %d is not queued or running" % job_id
 
+  shown_version = [None]
 
+  @app.callback(
+     Output('live-update-dgemm', 'children'),
+     Input('dgemm-interval-component', 'n_intervals'))
+  def update_result(n_intervals):
+    # Redrawn if a job has changed or is running, whose time is shown.
+    snapshot, version = jobs.snapshot()
+    if version == shown_version[0] and not jobs.busy_gpus():
+      return dash.no_update
+    shown_version[0] = version
+    return benchmark_tab.jobs_table(snapshot, "dgemm", RESULT_KEYS, "GF/s")
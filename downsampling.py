@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+def minmax_reduce(t, y, bucket_size):
+  # Reduces each column of y (n x m) to its minimum and maximum in consecutive buckets
+  # of bucket_size rows, so that spikes stay visible. n has to be a multiple of
+  # bucket_size. Both points of a bucket are returned in the order in which they
+  # occurred, with their own timestamps. Returns x and y of shape (2 * n_buckets, m).
+  n, m = y.shape
+  n_buckets = n // bucket_size
+  y_buckets = y.reshape(n_buckets, bucket_size, m)
+  i_min = y_buckets.argmin(axis=1)
+  i_max = y_buckets.argmax(axis=1)
+  offsets = (np.arange(n_buckets) * bucket_size)[:, None, None]
+  idx = np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=1) + offsets
+  idx = idx.reshape(2 * n_buckets, m)
+  return t[idx], np.take_along_axis(y, idx, axis=0)
+
+class minMaxDownsampler():
+  # Downsamples a growing series of rows, whose absolute row index is known, into
+  # buckets of a fixed number of rows. The buckets are aligned to the absolute row
+  # index, so a bucket never changes once it is complete and only the new rows
+  # have to be processed on each update. The last, incomplete bucket is held back
+  # until it is complete.
+  def __init__(self, history_size, n_buckets):
+    self.bucket_size = max(1, -(-history_size // n_buckets))
+    self.max_points = 2 * n_buckets if self.bucket_size > 1 else history_size
+
+  def complete_rows(self, n_rows):
+    # Nr. of rows which belong to complete buckets.
+    return n_rows - n_rows % self.bucket_size
+
+  def reduce(self, t, y, first_row):
+    # t and y hold the rows with the absolute indices first_row, first_row + 1, ...
+    # Returns the reduced complete buckets and the absolute index of the first row
+    # which has not been processed.
+    skip = -first_row % self.bucket_size
+    last_row = self.complete_rows(first_row + len(t))
+    if last_row <= first_row + skip:
+      return t[:0, None].repeat(y.shape[1], axis=1), y[:0], max(first_row, last_row)
+    t = t[skip:last_row - first_row]
+    y = y[skip:last_row - first_row]
+    if self.bucket_size == 1:
+      return t[:, None].repeat(y.shape[1], axis=1), y, last_row
+    x, y = minmax_reduce(t, y, self.bucket_size)
+    return x, y, last_row
@@ -0,0 +1,291 @@
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+
+#include "event_table.h"
+
+#define ARENA_BLOCK_SIZE (64 * 1024)
+#define INITIAL_SLOTS 256
+
+// Binary profile: magic, header length (uint32), header (UTF-8 JSON), the string table
+// (per string its length as uint32 and its bytes) and one profile_record_t per event.
+// All numbers are little-endian, names are indices into the string table or -1.
+#define PROFILE_MAGIC "ACCPROF\x01"
+#define PROFILE_MAGIC_SIZE 8
+
+typedef struct {
+   uint64_t total_duration;
+   uint64_t total_bytes;
+   int64_t n_calls;
+   int32_t kind;
+   int32_t kernel_name;
+   int32_t src_file;
+   int32_t func_name;
+   int32_t line_start;
+   int32_t line_end;
+   int32_t func_line_start;
+   int32_t func_line_end;
+} profile_record_t;
+
+static uint64_t hash_string (const char *s) {
+   // FNV-1a
+   uint64_t h = 14695981039346656037ULL;
+   for (; *s; s++) {
+      h ^= (unsigned char)*s;
+      h *= 1099511628211ULL;
+   }
+   return h;
+}
+
+static uint64_t hash_combine (uint64_t h, uint64_t value) {
+   // Mixing step of splitmix64
+   h ^= value + 0x9e3779b97f4a7c15ULL + (h << 6) + (h >> 2);
+   h = (h ^ (h >> 30)) * 0xbf58476d1ce4e5b9ULL;
+   h = (h ^ (h >> 27)) * 0x94d049bb133111ebULL;
+   return h ^ (h >> 31);
+}
+
+static char *arena_copy (event_table_t *table, const char *s) {
+   const size_t length = strlen(s) + 1;
+   arena_block_t *block = table->arena;
+   if (block == NULL || block->size - block->used < length) {
+      const size_t size = length > ARENA_BLOCK_SIZE ? length : ARENA_BLOCK_SIZE;
+      block = (arena_block_t*)malloc(sizeof(arena_block_t) + size);
+      if (block == NULL) return NULL;
+      block->size = size;
+      block->used = 0;
+      block->next = table->arena;
+      table->arena = block;
+   }
+   char *copy = block->data + block->used;
+   memcpy (copy, s, length);
+   block->used += length;
+   return copy;
+}
+
+static bool grow_strings (event_table_t *table) {
+   const size_t n_slots = table->n_string_slots == 0 ? INITIAL_SLOTS : 2 * table->n_string_slots;
+   interned_string_t *strings = (interned_string_t*)calloc(n_slots, sizeof(interned_string_t));
+   if (strings == NULL) return false;
+   for (size_t i = 0; i < table->n_string_slots; i++) {
+      const interned_string_t *entry = &table->strings[i];
+      if (entry->str == NULL) continue;
+      size_t slot = entry->hash & (n_slots - 1);
+      while (strings[slot].str != NULL) slot = (slot + 1) & (n_slots - 1);
+      strings[slot] = *entry;
+   }
+   free(table->strings);
+   table->strings = strings;
+   table->n_string_slots = n_slots;
+   return true;
+}
+
+// The interned copy of s, which is the same pointer for equal strings. NULL stays NULL.
+// *ok is set to false if memory could not be allocated.
+static const char *intern (event_table_t *table, const char *s, bool *ok) {
+   if (s == NULL) return NULL;
+   if (2 * (table->n_strings + 1) > table->n_string_slots && !grow_strings(table)) {
+      *ok = false;
+      return NULL;
+   }
+   const uint64_t h = hash_string(s);
+   const size_t mask = table->n_string_slots - 1;
+   size_t slot = h & mask;
+   while (table->strings[slot].str != NULL) {
+      if (table->strings[slot].hash == h && !strcmp(table->strings[slot].str, s)) return table->strings[slot].str;
+      slot = (slot + 1) & mask;
+   }
+   char *copy = arena_copy(table, s);
+   if (copy == NULL) {
+      *ok = false;
+      return NULL;
+   }
+   table->strings[slot].hash = h;
+   table->strings[slot].str = copy;
+   table->strings[slot].id = (int)table->n_strings++;
+   return copy;
+}
+
+static bool grow_slots (event_table_t *table) {
+   const size_t n_slots = table->n_slots == 0 ? INITIAL_SLOTS : 2 * table->n_slots;
+   int *slots = (int*)malloc(n_slots * sizeof(int));
+   if (slots == NULL) return false;
+   for (size_t i = 0; i < n_slots; i++) slots[i] = -1;
+   for (int i = 0; i < table->n_events; i++) {
+      size_t slot = table->events[i].hash & (n_slots - 1);
+      while (slots[slot] >= 0) slot = (slot + 1) & (n_slots - 1);
+      slots[slot] = i;
+   }
+   free(table->slots);
+   table->slots = slots;
+   table->n_slots = n_slots;
+   return true;
+}
+
+void event_table_init (event_table_t *table) {
+   memset (table, 0, sizeof(event_table_t));
+}
+
+void event_table_free (event_table_t *table) {
+   free(table->events);
+   free(table->slots);
+   free(table->strings);
+   while (table->arena != NULL) {
+      arena_block_t *next = table->arena->next;
+      free(table->arena);
+      table->arena = next;
+   }
+   event_table_init(table);
+}
+
+bool event_table_add (event_table_t *table, int kind, const char *kernelName, const char *srcFile,
+                      const char *funcName, int line_start, int line_end,
+                      int func_line_start, int func_line_end, uint64_t duration, uint64_t bytes) {
+   bool ok = true;
+   kernelName = intern(table, kernelName, &ok);
+   srcFile = intern(table, srcFile, &ok);
+   funcName = intern(table, funcName, &ok);
+   if (!ok) return false;
+
+   uint64_t h = hash_combine(kind, (uintptr_t)srcFile);
+   h = hash_combine(h, (uintptr_t)funcName);
+   h = hash_combine(h, (uintptr_t)kernelName);
+   h = hash_combine(h, ((uint64_t)(uint32_t)line_start << 32) | (uint32_t)line_end);
+   h = hash_combine(h, ((uint64_t)(uint32_t)func_line_start << 32) | (uint32_t)func_line_end);
+
+   if (2 * (table->n_events + 1) > (int)table->n_slots && !grow_slots(table)) return false;
+   const size_t mask = table->n_slots - 1;
+   size_t slot = h & mask;
+   for (; table->slots[slot] >= 0; slot = (slot + 1) & mask) {
+      event_t *ev = &table->events[table->slots[slot]];
+      if (ev->hash == h && ev->kind == kind && ev->srcFile == srcFile && ev->funcName == funcName
+          && ev->kernelName == kernelName && ev->line_start == line_start && ev->line_end == line_end
+          && ev->func_line_start == func_line_start && ev->func_line_end == func_line_end) {
+         ev->n_calls++;
+         ev->total_duration += duration;
+         ev->total_bytes += bytes;
+         return true;
+      }
+   }
+
+   if (table->n_events == table->events_capacity) {
+      const int capacity = table->events_capacity == 0 ? INITIAL_SLOTS / 2 : 2 * table->events_capacity;
+      event_t *events = (event_t*)realloc(table->events, capacity * sizeof(event_t));
+      if (events == NULL) return false;
+      table->events = events;
+      table->events_capacity = capacity;
+   }
+   event_t *ev = &table->events[table->n_events];
+   ev->kind = kind;
+   ev->n_calls = 1;
+   ev->total_duration = duration;
+   ev->total_bytes = bytes;
+   ev->kernelName = kernelName;
+   ev->srcFile = srcFile;
+   ev->funcName = funcName;
+   ev->line_start = line_start;
+   ev->line_end = line_end;
+   ev->func_line_start = func_line_start;
+   ev->func_line_end = func_line_end;
+   ev->hash = h;
+   table->slots[slot] = table->n_events++;
+   return true;
+}
+
+int event_table_count (const event_table_t *table, int kind) {
+   int n = 0;
+   for (int i = 0; i < table->n_events; i++) {
+      if (table->events[i].kind == kind) n++;
+   }
+   return n;
+}
+
+int event_table_collect (const event_table_t *table, int kind, const event_t **events) {
+   int n = 0;
+   for (int i = 0; i < table->n_events; i++) {
+      if (table->events[i].kind == kind) events[n++] = &table->events[i];
+   }
+   return n;
+}
+
+static int32_t string_id (const event_table_t *table, const char *s) {
+   if (s == NULL) return -1;
+   const size_t mask = table->n_string_slots - 1;
+   size_t slot = hash_string(s) & mask;
+   while (table->strings[slot].str != s) slot = (slot + 1) & mask;
+   return table->strings[slot].id;
+}
+
+// A copy of s with the characters which JSON does not allow in a string escaped,
+// to be freed by the caller. NULL if it cannot be allocated.
+static char *json_escape (const char *s) {
+   char *out = (char*)malloc(6 * strlen(s) + 1);
+   if (out == NULL) return NULL;
+   char *p = out;
+   for (; *s != '\0'; s++) {
+      const unsigned char c = *s;
+      if (c == '"' || c == '\\') {
+         *p++ = '\\';
+         *p++ = c;
+      } else if (c < 0x20) {
+         p += sprintf (p, "\\u%04x", c);
+      } else {
+         *p++ = c;
+      }
+   }
+   *p = '\0';
+   return out;
+}
+
+bool event_table_write_profile (const event_table_t *table, const char *filename, int mpi_rank,
+                                const char *host, int kind_data, int kind_launch, int kind_other) {
+   const char **strings = (const char**)malloc((table->n_strings + 1) * sizeof(char*));
+   profile_record_t *records = (profile_record_t*)malloc((table->n_events + 1) * sizeof(profile_record_t));
+   char *escaped_host = json_escape(host);
+   char *header = NULL;
+   FILE *f = fopen(filename, "wb");
+   bool ok = strings != NULL && records != NULL && escaped_host != NULL && f != NULL;
+   if (ok) {
+      for (size_t i = 0; i < table->n_string_slots; i++) {
+         if (table->strings[i].str != NULL) strings[table->strings[i].id] = table->strings[i].str;
+      }
+      for (int i = 0; i < table->n_events; i++) {
+         const event_t *ev = &table->events[i];
+         profile_record_t *r = &records[i];
+         r->total_duration = ev->total_duration;
+         r->total_bytes = ev->total_bytes;
+         r->n_calls = ev->n_calls;
+         r->kind = ev->kind;
+         r->kernel_name = string_id(table, ev->kernelName);
+         r->src_file = string_id(table, ev->srcFile);
+         r->func_name = string_id(table, ev->funcName);
+         r->line_start = ev->line_start;
+         r->line_end = ev->line_end;
+         r->func_line_start = ev->func_line_start;
+         r->func_line_end = ev->func_line_end;
+      }
+
+      const char *format = "{\"mpi_rank\": %d, \"host\": \"%s\", \"n_strings\": %zu, \"n_events\": %d, "
+                           "\"kinds\": {\"DATA\": %d, \"LAUNCH\": %d, \"OTHER\": %d}}";
+      const uint32_t header_size = snprintf (NULL, 0, format, mpi_rank, escaped_host, table->n_strings,
+                                             table->n_events, kind_data, kind_launch, kind_other);
+      header = (char*)malloc(header_size + 1);
+      ok = header != NULL;
+      if (ok) snprintf (header, header_size + 1, format, mpi_rank, escaped_host, table->n_strings,
+                        table->n_events, kind_data, kind_launch, kind_other);
+      ok = ok && fwrite (PROFILE_MAGIC, 1, PROFILE_MAGIC_SIZE, f) == PROFILE_MAGIC_SIZE;
+      ok = ok && fwrite (&header_size, sizeof(uint32_t), 1, f) == 1;
+      ok = ok && fwrite (header, 1, header_size, f) == header_size;
+      for (size_t i = 0; ok && i < table->n_strings; i++) {
+         const uint32_t length = strlen(strings[i]);
+         ok = fwrite (&length, sizeof(uint32_t), 1, f) == 1 && fwrite (strings[i], 1, length, f) == length;
+      }
+      ok = ok && fwrite (records, sizeof(profile_record_t), table->n_events, f) == (size_t)table->n_events;
+   }
+   if (f != NULL && fclose(f) != 0) ok = false;
+   free(strings);
+   free(records);
+   free(escaped_host);
+   free(header);
+   return ok;
+}
@@ -0,0 +1,77 @@
+#ifndef EVENT_TABLE_H
+#define EVENT_TABLE_H
+
+#include <stdint.h>
+#include <stddef.h>
+
+// Accumulated calls of the OpenACC tracer (openacc_trace.cpp), one entry per event site.
+// An event site is identified by its kind, source file, function, kernel name (NULL for
+// DATA and OTHER events) and line ranges. The names are interned, so that equal names
+// share one copy, and sites are compared by these pointers instead of strcmp.
+// The table does not depend on CUPTI, the kind is only used as a number.
+typedef struct {
+   int kind;
+   int n_calls;
+   uint64_t total_duration;
+   uint64_t total_bytes;
+   const char *kernelName;
+   const char *srcFile;
+   const char *funcName;
+   int line_start;
+   int line_end;
+   int func_line_start;
+   int func_line_end;
+   uint64_t hash;
+} event_t;
+
+typedef struct {
+   uint64_t hash;
+   const char *str;
+   // Position in the string table of a profile, in the order of interning.
+   int id;
+} interned_string_t;
+
+// The strings live in blocks of an arena, which are only freed all at once.
+typedef struct arena_block_st {
+   struct arena_block_st *next;
+   size_t size;
+   size_t used;
+   char data[];
+} arena_block_t;
+
+typedef struct {
+   // The events in the order of their first call.
+   event_t *events;
+   int n_events;
+   int events_capacity;
+   // Open addressing with linear probing: indices into events, -1 for empty slots.
+   // The number of slots is a power of two and at least twice the number of events.
+   int *slots;
+   size_t n_slots;
+   interned_string_t *strings;
+   size_t n_strings;
+   size_t n_string_slots;
+   arena_block_t *arena;
+} event_table_t;
+
+void event_table_init (event_table_t *table);
+void event_table_free (event_table_t *table);
+
+// Adds one call to the event site, which is created on its first call.
+// Returns false if memory could not be allocated, in which case the call is not counted.
+bool event_table_add (event_table_t *table, int kind, const char *kernelName, const char *srcFile,
+                      const char *funcName, int line_start, int line_end,
+                      int func_line_start, int func_line_end, uint64_t duration, uint64_t bytes);
+
+int event_table_count (const event_table_t *table, int kind);
+// Stores pointers to the events of this kind in events, which must hold event_table_count
+// entries, and returns their number. The pointers are valid until the next event_table_add.
+int event_table_collect (const event_table_t *table, int kind, const event_t **events);
+
+// Writes all events to a binary profile, which acc_profile.py reads and merges with those
+// of the other ranks. The kinds are the values which mark DATA, LAUNCH and OTHER events.
+// Returns false if the file could not be written.
+bool event_table_write_profile (const event_table_t *table, const char *filename, int mpi_rank,
+                                const char *host, int kind_data, int kind_launch, int kind_other);
+
+#endif
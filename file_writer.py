@@ -1,44 +1,136 @@
 #!/usr/bin/env python
 from datetime import datetime
+import json
+import multiprocessing
+import os
+import struct
+import time
+
+import numpy as np
+
+# Binary .hwout format, all numbers little-endian:
+#   magic (8 bytes), header length (uint32), header (UTF-8 JSON),
+#   followed by fixed-width records of one float64 timestamp,
+#   num_gpus * num_keys float32 values, ordered by GPU and then by key,
+#   and num_host_keys float32 host values. Files without host keys have no host field.
+# The file is only ever appended to, so a recording which has been cut off
+# is still readable up to its last complete record.
+HWOUT_MAGIC = b"HWOUT\x00\x00\x01"
+HWOUT_VALUE_TYPE = "<f4"
+
+def record_dtype(n_values, n_host_values=0):
+  fields = [("t", "<f8"), ("values", HWOUT_VALUE_TYPE, (n_values,))]
+  if n_host_values > 0:
+    fields.append(("host", HWOUT_VALUE_TYPE, (n_host_values,)))
+  return np.dtype(fields)
 
 class fileWriter():
-  def __init__(self):
+  def __init__(self, buffer_size=1 << 20):
     self.handle = None
     self.is_open = False
     self.n_columns_per_gpu = 0
+    self.buffer_size = buffer_size
+    self.dtype = None
 
-  def start (self, device_names, host_name, keys, filename=""):
+  def start (self, device_names, host_name, keys, filename="", host_keys=()):
 
     now = datetime.now()
     start_date = now.strftime("%Y_%m_%d_%H_%M_%S")
     if filename == "":
-       auto_filename = host_name + "_" + start_date + ".hwout"
-       self.handle = open(auto_filename, "w+")
-    else:
-       self.handle = open(filename, "w+")
+       filename = host_name + "_" + start_date + ".hwout"
+    self.handle = open(filename, "wb", buffering=self.buffer_size)
     self.is_open = True
-    self.handle.write("Watching %d GPUs on %s\n\n" % (len(device_names), host_name))
-    for i, name in enumerate(device_names):
-      self.handle.write ("%d: %s\n" % (i, name))
-    self.handle.write("Start date:      %s\n" % (start_date))
-    self.handle.write("Registered keys: ")
-    for key in keys:
-       self.handle.write("%s " % key)
-    self.handle.write("\n\n")
+    header = json.dumps({"host": host_name,
+                         "devices": list(device_names),
+                         "keys": list(keys),
+                         "host_keys": list(host_keys),
+                         "start_date": start_date}).encode()
+    self.handle.write(HWOUT_MAGIC + struct.pack("<I", len(header)) + header)
     self.n_columns_per_gpu = len(keys)
+    self.dtype = record_dtype(len(device_names) * len(keys), len(host_keys))
 
-  def stop (self, end_date=None):
-    self.handle.write("Finished recording\n")
-    if end_date != None: self.handle.write("End date:     %s" % (end_date))
+  def stop (self):
     self.handle.close()
     self.is_open = False
 
-  def add_items(self, timestamps, all_y):
-    for t, y_line in zip(timestamps, all_y): 
-      self.handle.write("%.2f: " % t)
-      for i, y in enumerate(y_line):
-        if i > 0 and i % self.n_columns_per_gpu == 0: self.handle.write ("|| ")
-        self.handle.write("%d " % y)
-      self.handle.write("\n")
+  def add_items(self, timestamps, all_y, host_y=None):
+    # all_y has one row of num_gpus * num_keys values per timestamp, host_y one of num_host_keys.
+    records = np.empty(len(timestamps), dtype=self.dtype)
+    records["t"] = timestamps
+    records["values"] = all_y
+    if host_y is not None and "host" in self.dtype.names:
+      records["host"] = host_y
+    self.handle.write(records.tobytes())
+
+class sampleRecorder():
+  # Records the rows of a multiProcState into .hwout files. record() is called by the
+  # readout process after it has stored new rows, so the recording does not depend on
+  # anybody watching the dashboard. The file is flushed to disk every flush_interval
+  # seconds. Other processes start and stop the recording through the shared flag
+  # self.active, and the readout process opens or closes the file on its next call.
+  def __init__(self, state, device_names, host_name, flush_interval=5.0, filename=""):
+    self.state = state
+    self.device_names = device_names
+    self.host_name = host_name
+    self.filename = filename
+    self.flush_interval = flush_interval
+    self.active = multiprocessing.RawValue('b', 0)
+    self.writer = fileWriter()
+    self.last_flush = 0
+
+  def start (self):
+    self.active.value = 1
 
+  def stop (self):
+    self.active.value = 0
+
+  def record (self):
+    if not self.active.value:
+      if self.writer.is_open: self.writer.stop()
+      return
+    if not self.writer.is_open:
+      self.writer.start(self.device_names, self.host_name, list(self.state.keys), self.filename,
+                        list(self.state.host_keys))
+      self.last_flush = time.monotonic()
+    t, y, host_y = self.state.flush()
+    if len(t) != 0:
+      self.writer.add_items(t, y.reshape(len(t), -1), host_y)
+    if time.monotonic() - self.last_flush > self.flush_interval:
+      self.writer.handle.flush()
+      self.last_flush = time.monotonic()
+
+class hwoutRecording():
+  # A .hwout file, memory-mapped. t holds the timestamps in seconds, values is an
+  # array of (time x GPU x key) and host_values one of (time x host key).
+  def __init__(self, filename):
+    with open(filename, "rb") as f:
+      magic = f.read(len(HWOUT_MAGIC))
+      if magic != HWOUT_MAGIC:
+        raise ValueError("%s is not a binary .hwout file" % filename)
+      header_size, = struct.unpack("<I", f.read(4))
+      header = json.loads(f.read(header_size))
+    self.host_name = header["host"]
+    self.device_names = header["devices"]
+    self.keys = header["keys"]
+    self.host_keys = header.get("host_keys", [])
+    self.start_date = datetime.strptime(header["start_date"], "%Y_%m_%d_%H_%M_%S")
+
+    n_gpus = len(self.device_names)
+    dtype = record_dtype(n_gpus * len(self.keys), len(self.host_keys))
+    offset = len(HWOUT_MAGIC) + 4 + header_size
+    n_records = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if n_records > 0:
+      records = np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(n_records,))
+    else:
+      records = np.empty(0, dtype=dtype)
+    self.t = records["t"]
+    self.values = records["values"].reshape(n_records, n_gpus, len(self.keys))
+    if self.host_keys:
+      self.host_values = records["host"]
+    else:
+      self.host_values = np.empty((n_records, 0), dtype=HWOUT_VALUE_TYPE)
 
+  def get(self, key, gpu_id=0):
+    if key in self.host_keys:
+      return self.host_values[:, self.host_keys.index(key)]
+    return self.values[:, gpu_id, self.keys.index(key)]
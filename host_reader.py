@@ -1,34 +1,155 @@
 #!/usr/bin/env python
 
 from platform import node
-import re
+import os
+
+import numpy as np
 
 class hostReader():
-  def __init__(self):
-    self.handle = open("/proc/stat")
-    self.prev_jiffies = [0 for i in range(10)]
-    self.current_cpu_usage = 0
+  # Reads the CPU utilization of all cores, the memory usage and the load of the host.
+  # Each of /proc/stat, /proc/meminfo and /proc/loadavg is read with one pread into a
+  # buffer which is reused. read_out returns the values in the order of self.keys:
+  # the utilization of all cores in %, the used memory in %, the 1 minute load
+  # average and the utilization of each core in %.
+  # With the PCI addresses of the GPUs, as given by nvml.deviceManager.getPciBusId,
+  # read_gpus returns the utilization of the cores local to each GPU and the used
+  # memory of its NUMA node in %, in the order of self.gpu_keys. The locations of
+  # /proc and /sys can be changed, e.g. to a fake directory tree.
+  def __init__(self, proc_dir="/proc", sys_dir="/sys", pci_bus_ids=()):
     self.host_name = node()
-    
+    self.fd_stat = os.open(os.path.join(proc_dir, "stat"), os.O_RDONLY)
+    self.fd_meminfo = os.open(os.path.join(proc_dir, "meminfo"), os.O_RDONLY)
+    self.fd_loadavg = os.open(os.path.join(proc_dir, "loadavg"), os.O_RDONLY)
+    self.buffer = bytearray(1 << 12)
+    # Offline cores have no line in /proc/stat, so the cores are numbered by the
+    # cpu number of each line, and a core without a line is shown as idle.
+    with open(os.path.join(proc_dir, "stat"), "rb") as f:
+      cpus = [int(line.split()[0][3:]) for line in f.read().split(b"\n")
+              if line.startswith(b"cpu") and line[3:4].isdigit()]
+    self.n_cores = max(cpus) + 1 if cpus else 0
+    # The cpu lines come first in /proc/stat, so the rest of the file is not needed.
+    self.stat_buffer = bytearray(256 * (self.n_cores + 1) + (1 << 12))
+    self.keys = ["CPU", "Host-Memory", "Load"] + ["CPU%d" % i for i in range(self.n_cores)]
+    self.values = np.zeros(len(self.keys))
+    self.prev_jiffies = None
+    self.core_usage = np.zeros(self.n_cores)
+
+    self.gpu_keys = ["Local-CPU", "NUMA-Memory"]
+    self.gpu_values = np.zeros((len(pci_bus_ids), len(self.gpu_keys)))
+    self.gpu_cores = []
+    self.gpu_nodes = []
+    self.fd_nodes = {}
+    for bus_id in pci_bus_ids:
+      cores, numa_node = pci_locality(sys_dir, bus_id)
+      cores = [core for core in cores if core < self.n_cores]
+      self.gpu_cores.append(np.array(cores) if cores else np.arange(self.n_cores))
+      node_meminfo = os.path.join(sys_dir, "devices", "system", "node", "node%d" % numa_node, "meminfo")
+      if numa_node >= 0 and os.path.exists(node_meminfo):
+        if numa_node not in self.fd_nodes:
+          self.fd_nodes[numa_node] = os.open(node_meminfo, os.O_RDONLY)
+        self.gpu_nodes.append(numa_node)
+      else:
+        self.gpu_nodes.append(None)
+
   def __del__(self):
-    self.handle.close()
-    self.handle = None
+    for fd in [self.fd_stat, self.fd_meminfo, self.fd_loadavg] + list(self.fd_nodes.values()):
+      os.close(fd)
+
+  def read(self, fd, buffer=None):
+    buffer = self.buffer if buffer is None else buffer
+    n = os.preadv(fd, [buffer], 0)
+    return memoryview(buffer)[:n]
 
   def get_cpu_usage(self):
-    for line in self.handle.readlines():
-      if re.search("cpu0 ", line):
-        jiffies = [int(l) for l in line.split()[1:]]
-        if any ([j_new > j_old for j_new, j_old in zip(jiffies[0:3], self.prev_jiffies[0:3])]):
-          total = sum(jiffies[0:-1])
-          work = sum(jiffies[0:3])
-          prev_total = sum(self.prev_jiffies[0:-1])
-          prev_work = sum(self.prev_jiffies[0:3])
-          self.current_cpu_usage = (work - prev_work) / (total - prev_total) * 100
-          self.prev_jiffies = jiffies.copy()
-
-    self.handle.seek(0) 
-    return int(round(self.current_cpu_usage,0))
+    # Utilization of all cores and of each core in %, from the jiffies since the last call.
+    data = self.read(self.fd_stat, self.stat_buffer).tobytes()
+    n_lines = self.n_cores + 1
+    # The cpu lines, which come first, are parsed in one go: "cpu" becomes -1 and "cpuN"
+    # becomes N, so that the first column + 1 is the row of the line.
+    end = data.find(b"\n", data.rfind(b"\ncpu") + 1)
+    block = data[:end if end >= 0 else len(data)]
+    block = block.replace(b"cpu ", b"-1 ").replace(b"cpu", b"")
+    values = np.fromstring(block, dtype=np.int64, sep=" ")
+    values = values.reshape(block.count(b"\n") + 1, -1)
+    values = values[values[:, 0] + 1 < n_lines]
+    rows = values[:, 0] + 1
+    # user, nice, system, idle, iowait, irq, softirq, steal. guest is part of user.
+    jiffies = values[:, 1:9]
+    # A core without a line keeps its jiffies from the last call.
+    if self.prev_jiffies is None:
+      total = np.zeros(n_lines, dtype=np.int64)
+      busy = np.zeros(n_lines, dtype=np.int64)
+    else:
+      total = self.prev_jiffies[0].copy()
+      busy = self.prev_jiffies[1].copy()
+    total[rows] = jiffies.sum(axis=1)
+    busy[rows] = total[rows] - jiffies[:, 3] - jiffies[:, 4]
+    if self.prev_jiffies is None:
+      usage = busy / np.maximum(total, 1)
+    else:
+      d_total = total - self.prev_jiffies[0]
+      d_busy = busy - self.prev_jiffies[1]
+      usage = np.where(d_total > 0, d_busy / np.maximum(d_total, 1), 0)
+    self.prev_jiffies = (total, busy)
+    return usage * 100
+
+  def get_memory_usage(self):
+    meminfo = self.read(self.fd_meminfo).tobytes()
+    total = int(meminfo.split(b"MemTotal:", 1)[1].split(None, 1)[0])
+    available = int(meminfo.split(b"MemAvailable:", 1)[1].split(None, 1)[0])
+    return (total - available) / total * 100
+
+  def get_load(self):
+    return float(self.read(self.fd_loadavg).tobytes().split(None, 1)[0])
+
+  def get_node_memory_usage(self, numa_node):
+    # Memory of the node which is neither free nor used by the page cache, in %.
+    meminfo = self.read(self.fd_nodes[numa_node]).tobytes()
+    total = int(meminfo.split(b"MemTotal:", 1)[1].split(None, 1)[0])
+    free = int(meminfo.split(b"MemFree:", 1)[1].split(None, 1)[0])
+    file_pages = int(meminfo.split(b"FilePages:", 1)[1].split(None, 1)[0])
+    return max(total - free - file_pages, 0) / total * 100
 
   def read_out(self):
-    return {'CPU': self.get_cpu_usage()}
+    cpu_usage = self.get_cpu_usage()
+    self.values[0] = cpu_usage[0]
+    self.values[1] = self.get_memory_usage()
+    self.values[2] = self.get_load()
+    self.values[3:] = cpu_usage[1:]
+    self.core_usage = cpu_usage[1:]
+    return self.values
+
+  def read_gpus(self):
+    # Uses the utilization of the cores from the last call of read_out.
+    node_usage = {}
+    for numa_node in self.fd_nodes:
+      node_usage[numa_node] = self.get_node_memory_usage(numa_node)
+    for i, (cores, numa_node) in enumerate(zip(self.gpu_cores, self.gpu_nodes)):
+      self.gpu_values[i, 0] = self.core_usage[cores].mean()
+      self.gpu_values[i, 1] = self.values[1] if numa_node is None else node_usage[numa_node]
+    return self.gpu_values
+
+def parse_cpulist(cpulist):
+  # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+  cores = []
+  for part in cpulist.strip().split(","):
+    if part == "": continue
+    first, _, last = part.partition("-")
+    cores.extend(range(int(first), int(last or first) + 1))
+  return cores
 
+def pci_locality(sys_dir, bus_id):
+  # The cores and the NUMA node which are local to a PCI device. No cores and
+  # the node -1 are returned if sysfs does not know the device.
+  device_dir = os.path.join(sys_dir, "bus", "pci", "devices", bus_id.lower())
+  try:
+    with open(os.path.join(device_dir, "local_cpulist")) as f:
+      cores = parse_cpulist(f.read())
+  except (OSError, ValueError):
+    cores = []
+  try:
+    with open(os.path.join(device_dir, "numa_node")) as f:
+      numa_node = int(f.read())
+  except (OSError, ValueError):
+    numa_node = -1
+  return cores, numa_node
@@ -7,105 +7,36 @@ from dash.dependencies import Input, Output, State
 import plotly
 import nvml
 
-from datetime import datetime
-
 import time
 import multiprocessing
+import numpy as np
 
+import downsampling
 import file_writer
-
-class multiProcQueue():
-  def __init__(self, element_type, lock, queue_size=50):
-    self.content = multiprocessing.Array(element_type, queue_size, lock=lock)
-    self.size = queue_size
-    self.n_elements = multiprocessing.Value('i', 0, lock=lock)
-    self.last_read_at = multiprocessing.Value('i', 0, lock=lock)
-
-  def put(self, value):
-    if self.n_elements.value < self.size:
-      self.content[self.n_elements.value] = value
-      self.n_elements.value += 1
-    else:
-      for i in range(self.size - 1):
-        self.content[i] = self.content[i+1]
-      self.content[self.size-1] = value
-      self.last_read_at.value -= 1
-
-  def flush(self):
-    ret = [self.content[i] for i in range(self.last_read_at.value, self.n_elements.value)]
-    self.last_read_at.value = self.n_elements.value
-    return ret
-
-  def has_new_data(self):
-    return self.last_read_at.value != self.n_elements.value
-
-  def get_all(self):
-    return [self.content[i] for i in range(self.n_elements.value)]
-
-  def reset(self):
-    self.n_elements.value = 0
-
-class multiProcQueueCollection():
-  def __init__(self, lock, num_plots, buffer_size):
-    self.yvalues = [multiProcQueue('i', lock, buffer_size) for i in range(num_plots)]
-
-  def reset (self):
-    for y in self.yvalues:
-      y.reset()
-
-  def has_new_data(self):
-    return any([queue.has_new_data() for queue in self.yvalues])
-
-class multiProcState():
-  def __init__(self, keys, buffer_size, num_gpus=1):
-    self.num_gpus = num_gpus
-    self.lock = multiprocessing.Lock()
-    self.count = multiprocessing.Value('i', 0, lock=self.lock)
-    self.timestamps = multiProcQueue('i', self.lock, buffer_size)
-    self.keys = {}
-    for i, key in enumerate(keys):
-       self.keys[key] = i
-    num_plots = len(keys)
-    self.start_time = datetime.now()
-    self.queues = [multiProcQueueCollection(self.lock, num_plots, buffer_size) for i in range(num_gpus)]
-
-  def inc_timestamps(self):
-    self.count.value += 1
-    delta = datetime.now() - self.start_time
-    self.timestamps.put(delta.seconds * 1000000 + delta.microseconds)
-
-  def put_observables(self, gpu_id, key, value):
-    self.queues[gpu_id].yvalues[self.keys[key]].put(value) 
-
-  def get_observable(self, key, gpu_id):
-    return self.queues[gpu_id].yvalues[self.keys[key]].get_all()
-
-  def reset(self):
-    self.count.value = 0
-    self.timestamps.reset()
-    self.start_time = datetime.now()
-    for queue in self.queues:
-       queue.reset()
-
-  def has_new_data(self, gpu_id):
-    return self.queues[gpu_id].has_new_data()
-    
+import process_accounting
+import sample_store
+import scheduler
 
 class hardwarePlot():
-  def __init__(self, key, label, is_visible=True):
-    self.key = key
-    self.label = label
+  def __init__(self, metric, is_visible=True):
+    self.metric = metric
+    self.key = metric.name
+    self.label = metric.label()
     self.visible = is_visible
 
 class hardwarePlotCollection ():
-  def __init__(self, device, host_reader, keys, labels, init_visible_keys, n_x_values=50):
-    ll = len(keys)
+  # One plot for each of the metrics.metric objects in plot_metrics.
+  def __init__(self, device, host_reader, plot_metrics, init_visible_keys, n_x_values=50, plot_width=600):
+    ll = len(plot_metrics)
     self.n_cols = 1 if ll == 1 else 2
     self.n_rows = (ll + 1) // 2
     self.n_x_values = n_x_values
+    self.plot_width = plot_width
+    # Long histories are reduced to about one point per pixel. Each bucket gives two points.
+    self.downsampler = downsampling.minMaxDownsampler(n_x_values, plot_width // 2)
     self.plots = []
-    for key, label in zip(keys, labels):
-      self.plots.append(hardwarePlot(key, label))
+    for metric in plot_metrics:
+      self.plots.append(hardwarePlot(metric))
     self.device = device
     self.set_visible (init_visible_keys)
     self.display_gpus = [0]
@@ -113,42 +44,139 @@ class hardwarePlotCollection ():
     self.colors = ["black", "red", "blue", "green"]
     self.update_active = True
     self.host_reader = host_reader
+    # (key, GPU) of each trace in self.fig and the number of rows it shows. Host keys
+    # have a single trace with the GPU None.
+    self.traces = []
+    self.n_shown = 0
+    self.rebuild = True
+    # Index of the rollup tier which is shown, None for the raw samples.
+    self.resolution = None
 
   def set_visible (self, new_keys):
     for plot in self.plots:
        plot.visible = plot.key in new_keys
+    self.rebuild = True
+
+  def set_display_gpus (self, gpu_ids):
+    self.display_gpus = gpu_ids
+    self.rebuild = True
+
+  def set_resolution (self, resolution):
+    self.resolution = resolution
+    self.rebuild = True
+
+  def needs_rebuild (self):
+    # The figure has to be generated from scratch if the selection has changed
+    # or the data has been reset in the meantime. The rollup tiers change rarely
+    # and are redrawn completely whenever a bucket has been added.
+    if self.fig is None or self.rebuild: return True
+    if self.resolution is not None:
+      return global_rollups.tiers[self.resolution].store.n_written.value != self.n_shown
+    return global_values.n_written.value < self.n_shown
+
+  def update (self):
+    # The new figure or extendData of the graph, or dash.no_update for either.
+    if not self.update_active:
+      return dash.no_update, dash.no_update
+    elif self.needs_rebuild():
+      return self.gen_plots(), dash.no_update
+    elif self.resolution is None and global_values.n_written.value != self.n_shown:
+      return dash.no_update, self.gen_update()
+    else:
+      return dash.no_update, dash.no_update
 
   def gen_plots (self):
     if not self.update_active: return self.fig
     self.fig = plotly.tools.make_subplots(rows=self.n_rows, cols=self.n_cols, vertical_spacing=0.075)
+    self.traces = []
+    positions = []
     i_plot = 0
     for plot in self.plots:
       if not plot.visible: continue
       irow = (i_plot // 2) + 1
       icol = (i_plot % 2) + 1
-      y_max = 0
-      y_min = 1000
-      x = [xx / 1000000 for xx in global_values.timestamps.get_all()]
-      for i_gpu in self.display_gpus:
-         y = global_values.get_observable(plot.key, i_gpu)
-         y_max = max(max(y) * 1.25, y_max)
-         y_min = min(min(y) * 0.8, y_min)
-         self.fig.append_trace({
-            'x': x,
-            'y': y,
-            'name': "GPU-" + str(i_gpu),
-            'marker': {'color': self.colors[i_gpu]}
-         }, irow, icol)
-
-      self.fig.update_yaxes(range=[y_min, y_max], row=irow, col=icol, title_text=plot.label)
-      self.fig.update_xaxes(range=[x[0] - 1, x[-1] + 2], row=irow, col=icol, title_text="t [s]")
+      for i_gpu in [None] if self.is_host_key(plot.key) else self.display_gpus:
+         self.traces.append((plot.key, i_gpu))
+         positions.append((irow, icol))
+
+      # The axes are autoscaled by the browser, since gen_update only sends new points.
+      self.fig.update_yaxes(row=irow, col=icol, title_text=plot.label)
+      self.fig.update_xaxes(row=irow, col=icol, title_text="t [s]")
       i_plot += 1
 
-    self.fig.update_layout(height=self.n_rows * 500, width = self.n_cols * 600,
+    if self.resolution is None:
+      self.add_sample_traces(positions)
+    else:
+      self.add_rollup_traces(positions)
+
+    self.fig.update_layout(height=self.n_rows * 500, width = self.n_cols * self.plot_width,
                            showlegend = False,
                           )
+    self.rebuild = False
     return self.fig
 
+  def add_sample_traces (self, positions):
+    t, all_y, host_y, n_written = global_values.get_since(0)
+    x, y, self.n_shown = self.downsampler.reduce(t, self.trace_values(all_y, host_y), n_written - len(t))
+    for i, ((key, i_gpu), (irow, icol)) in enumerate(zip(self.traces, positions)):
+      self.fig.append_trace({
+         'x': x[:, i],
+         'y': y[:, i],
+         'name': self.trace_name(i_gpu),
+         'marker': {'color': self.trace_color(i_gpu)}
+      }, irow, icol)
+
+  def add_rollup_traces (self, positions):
+    # The mean of each bucket as a line inside a band from the minimum to the maximum.
+    t, stats, host_stats, self.n_shown = global_rollups.tiers[self.resolution].get_since(0)
+    for (key, i_gpu), (irow, icol) in zip(self.traces, positions):
+      if i_gpu is None:
+        y = host_stats[:, :, global_values.host_keys[key]]
+      else:
+        y = stats[:, i_gpu, :, global_values.keys[key]]
+      color = self.trace_color(i_gpu)
+      self.fig.append_trace({'x': t, 'y': y[:, 0], 'mode': 'lines', 'line': {'width': 0},
+                             'hoverinfo': 'skip'}, irow, icol)
+      self.fig.append_trace({'x': t, 'y': y[:, 2], 'mode': 'lines', 'line': {'width': 0},
+                             'fill': 'tonexty', 'fillcolor': color, 'opacity': 0.2,
+                             'hoverinfo': 'skip'}, irow, icol)
+      self.fig.append_trace({
+         'x': t,
+         'y': y[:, 1],
+         'name': self.trace_name(i_gpu),
+         'marker': {'color': color}
+      }, irow, icol)
+
+  def gen_update (self):
+    # The points which have been recorded since the last call, in the format of the
+    # extendData property of dcc.Graph. Only the new rows are downsampled, so there
+    # is nothing to send until they fill a complete bucket.
+    t, all_y, host_y, n_written = global_values.get_since(self.n_shown)
+    x, y, self.n_shown = self.downsampler.reduce(t, self.trace_values(all_y, host_y), n_written - len(t))
+    if len(x) == 0:
+      return dash.no_update
+    return {'x': list(x.T), 'y': list(y.T)}, list(range(len(self.traces))), self.downsampler.max_points
+
+  def trace_values (self, all_y, host_y):
+    # The columns of the sample rows which are shown in the traces, in their order.
+    n_gpu_values = all_y.shape[1] * all_y.shape[2]
+    columns = []
+    for key, i_gpu in self.traces:
+      if i_gpu is None:
+        columns.append(n_gpu_values + global_values.host_keys[key])
+      else:
+        columns.append(i_gpu * all_y.shape[2] + global_values.keys[key])
+    return np.concatenate([all_y.reshape(len(all_y), n_gpu_values), host_y], axis=1)[:, columns]
+
+  def trace_name (self, i_gpu):
+    return "Host" if i_gpu is None else "GPU-" + str(i_gpu)
+
+  def trace_color (self, i_gpu):
+    return "gray" if i_gpu is None else self.colors[i_gpu]
+
+  def is_host_key (self, key):
+    return key in self.host_reader.keys
+
   def getData (self):
     t = list(self.timestamps)
     t.reverse()
@@ -166,6 +194,12 @@ class hardwarePlotCollection ():
   def all_keys (self):
     return [plot.key for plot in self.plots]
 
+  def gpu_metrics (self):
+    return [plot.metric for plot in self.plots if plot.metric.per_gpu()]
+
+  def gpu_keys (self):
+    return [metric.name for metric in self.gpu_metrics()]
+
   def num_keys (self):
     return len(self.plots)
 
@@ -177,32 +211,85 @@ class hardwarePlotCollection ():
     return keys
 
 global_values = None
-
-def multiProcRead (hwPlots, t_record_s):
+global_rollups = None
+global_processes = None
+
+def multiProcRead (hwPlots, t_record_s, recorder):
+  # The devices are read out by the sampler thread of the nvml module, which keeps its
+  # period regardless of how long the readout takes. This loop only collects the samples
+  # and reads the process tables, which change slowly, at their own period.
+  # NVML handles do not survive a fork, so the child opens its own session.
+  t_drain = max(t_record_s, 0.1)
+  device = nvml.deviceManager()
+  global_processes.device = device
+  collector = sample_store.sampleCollector(device, hwPlots.host_reader, hwPlots.gpu_metrics(),
+                                           global_values.num_gpus, t_record_s, t_drain)
+  tasks = scheduler.tickScheduler(t_drain)
+  tasks.add("collect")
+  tasks.add("processes", global_processes.period)
+  tasks.start()
+  collector.start()
   while True:
-    #now = datetime.now()
-    #print (now)
-    hwPlots.device.readOut() 
-    for gpu_index in range(global_values.num_gpus):
-      for key, value in hwPlots.device.getItems(gpu_index).items():
-         global_values.put_observables(gpu_index, key, value)
-      for key, value in hwPlots.host_reader.read_out().items():
-         global_values.put_observables(gpu_index, key, value)  
-    time.sleep(t_record_s)
+    time.sleep(tasks.time_to_next())
+    due = tasks.due()
+    t, rows, host_rows = collector.collect()
+    if len(t) == 0: continue
+    global_values.put_rows(t, rows, host_rows)
+    global_rollups.add(t, rows, host_rows)
+    if "processes" in due:
+      global_processes.sample(t[-1])
+    recorder.record()
     
 
-file_writer = file_writer.fileWriter()
+recorder = None
 
 tab_style = {'display':'inline'}
+
+def process_figure (deviceProps, gpu_ids, plot_width):
+  # The memory and SM utilization of the processes on each GPU, stacked.
+  t, values, n_written = global_processes.get_since(0)
+  gpu_ids = [gpu_id for gpu_id in gpu_ids if gpu_id < global_processes.num_gpus]
+  fig = plotly.tools.make_subplots(rows=max(len(gpu_ids), 1), cols=2, vertical_spacing=0.075)
+  for irow, gpu_id in enumerate(gpu_ids, start=1):
+    for icol, (key, label) in enumerate([("Memory", "Memory [MiB]"), ("SM-Util", "SM-Util [%]")], start=1):
+      pids, series = process_accounting.process_series(values, gpu_id, key)
+      for pid, y in zip(pids, series.T):
+        name = "other" if pid == process_accounting.OTHER_PID else deviceProps.process_names.get(pid)
+        fig.append_trace({'x': t, 'y': y, 'mode': 'lines', 'stackgroup': str(gpu_id) + key,
+                          'name': "%d (%s)" % (pid, name), 'legendgroup': str(pid),
+                          'showlegend': icol == 1}, irow, icol)
+      fig.update_yaxes(row=irow, col=icol, title_text="GPU-%d %s" % (gpu_id, label))
+      fig.update_xaxes(row=irow, col=icol, title_text="t [s]")
+  fig.update_layout(height=max(len(gpu_ids), 1) * 400, width=2 * plot_width)
+  return fig, n_written
+
+def resolution_options (rollups):
+  options = [{'label': 'Raw', 'value': -1}]
+  for i, tier in enumerate(rollups.tiers):
+    if tier.resolution < 60:
+      label = "%g s" % tier.resolution
+    else:
+      label = "%g min" % (tier.resolution / 60)
+    options.append({'label': label, 'value': i})
+  return options
+
 def Tab (deviceProps, hwPlots, num_gpus, buffer_size, t_update_s, t_record_s, do_logfile):
   global global_values
-  global_values = multiProcState(hwPlots.all_keys(), buffer_size, num_gpus)
-  readOutProc = multiprocessing.Process(target=multiProcRead, args=(hwPlots,t_record_s))
+  global global_rollups
+  global recorder
+  global global_processes
+  global_values = sample_store.multiProcState(hwPlots.gpu_keys(), buffer_size, num_gpus,
+                                              host_keys=hwPlots.host_reader.keys)
+  global_processes = process_accounting.processAccounting(hwPlots.device, num_gpus, buffer_size,
+                                                          global_values.start_time)
+  global_rollups = sample_store.multiProcRollup(global_values)
+  recorder = file_writer.sampleRecorder(global_values, deviceProps.names, hwPlots.host_reader.host_name)
+  if do_logfile:
+     recorder.start()
+  readOutProc = multiprocessing.Process(target=multiProcRead, args=(hwPlots,t_record_s,recorder))
   readOutProc.start()
   # Where to join (signal handling)?
   #readOutProc.join()
-  if do_logfile:
-     file_writer.start(deviceProps.names, hwPlots.host_reader.host_name, hwPlots.all_keys())
 
   proclist = [html.P ("Active processes: ")]
   for gpu_id in range(num_gpus):
@@ -219,15 +306,21 @@ def Tab (deviceProps, hwPlots, num_gpus, buffer_size, t_update_s, t_record_s, do
                      dcc.Input(id="choose-gpu", value='0', type='string', debounce=True)
            ]),
            html.Div(id="gpu-out", style={'display': 'none'}),
+           html.Div(["Resolution: ",
+                     dcc.RadioItems(id='choose-resolution', inline=True, value=-1,
+                                    options=resolution_options(global_rollups))
+           ]),
            html.Button('Stop', id='stopButton', n_clicks=0),
            dcc.Graph(id='live-update-graph'),
+           html.H2('Processes:'),
+           dcc.Graph(id='process-graph'),
            dcc.Interval(id='interval-component',
                         interval = t_update_s * 1000,
                         n_intervals = 0),
            ],
          )
 
-def register_callbacks (app, hwPlots, deviceProps):
+def register_callbacks (app, hwPlots, deviceProps, do_logfile):
   @app.callback(
       Output('choosePlots', 'value'),
       Input('choosePlots', 'value'))
@@ -239,28 +332,32 @@ def register_callbacks (app, hwPlots, deviceProps):
       Output('live-update-procids-0', 'children'),
       Input ('interval-component', 'n_intervals'))
   def update_proc_ids(n):
-    deviceProps.update_process(hwPlots.device, 0)
+    if not deviceProps.update_process(hwPlots.device, 0):
+      return dash.no_update
     return deviceProps.procString(hwPlots.device, 0)
 
   @app.callback(
       Output('live-update-procids-1', 'children'),
       Input ('interval-component', 'n_intervals'))
   def update_proc_ids(n):
-    deviceProps.update_process(hwPlots.device, 1)
+    if not deviceProps.update_process(hwPlots.device, 1):
+      return dash.no_update
     return deviceProps.procString(hwPlots.device, 1)
 
   @app.callback(
       Output('live-update-procids-2', 'children'),
       Input ('interval-component', 'n_intervals'))
   def update_proc_ids(n):
-    deviceProps.update_process(hwPlots.device, 2)
+    if not deviceProps.update_process(hwPlots.device, 2):
+      return dash.no_update
     return deviceProps.procString(hwPlots.device, 2)
 
   @app.callback(
       Output('live-update-procids-3', 'children'),
       Input ('interval-component', 'n_intervals'))
   def update_proc_ids(n):
-    deviceProps.update_process(hwPlots.device, 3)
+    if not deviceProps.update_process(hwPlots.device, 3):
+      return dash.no_update
     return deviceProps.procString(hwPlots.device, 3)
 
   @app.callback(
@@ -270,51 +367,51 @@ def register_callbacks (app, hwPlots, deviceProps):
   def choose_gpus (gpu_ids):
     if gpu_ids != '':
       if gpu_ids.isdigit():
-        hwPlots.display_gpus = [int(gpu_ids)]
+        hwPlots.set_display_gpus([int(gpu_ids)])
       else:
         check_number = gpu_ids.replace('-','').replace(',','')
         if not check_number.isdigit():
           return "Invalid" 
         tmp = gpu_ids.split(',')
-        hwPlots.display_gpus = []
+        display_gpus = []
         for s in tmp:
           if '-' in s:
             tmp2 = s.split('-')
             for i in range(int(tmp2[0]), int(tmp2[1])+1):
-              hwPlots.display_gpus.append(i)
+              display_gpus.append(i)
           else:
-            hwPlots.display_gpus.append(int(s))
+            display_gpus.append(int(s))
+        hwPlots.set_display_gpus(display_gpus)
     return gpu_ids
     
+  @app.callback(
+    Output ('choose-resolution', 'value'),
+    Input ('choose-resolution', 'value'),
+    )
+  def choose_resolution (resolution):
+    hwPlots.set_resolution(None if resolution < 0 else resolution)
+    return resolution
+
   @app.callback(
       Output('live-update-graph', 'figure'),
+      Output('live-update-graph', 'extendData'),
       Input('interval-component', 'n_intervals'))
   def update_graph_live(n):
+    return hwPlots.update()
 
-    n_retries = 75
-    n_sleep = 0
-    for i in range(n_retries):
-      if global_values.has_new_data(0):
-         break
-      else:
-         n_sleep += 1
-         time.sleep(0.01)
-
-    no_new_data = n_sleep == n_retries
-    if (no_new_data):
-       return hwPlots.fig
+  n_processes_shown = [None, None]
 
-    global_values.inc_timestamps()
-    if file_writer.is_open:
-       t = [tt / 1000000 for tt in global_values.timestamps.flush()]
-       if len(t) != 0:
-         y = []
-         for queue in global_values.queues:
-           for yy in queue.yvalues:
-              y.append(yy.flush())
-         file_writer.add_items (t, list(map(list, zip(*y))))
-
-    return hwPlots.gen_plots ()
+  @app.callback(
+      Output('process-graph', 'figure'),
+      Input('interval-component', 'n_intervals'))
+  def update_process_graph(n):
+    # Redrawn only if there are new samples or other GPUs have been chosen.
+    shown = (global_processes.store.n_written.value, tuple(hwPlots.display_gpus))
+    if not hwPlots.update_active or shown == tuple(n_processes_shown):
+      return dash.no_update
+    fig, n_written = process_figure(deviceProps, hwPlots.display_gpus, hwPlots.plot_width)
+    n_processes_shown[:] = [n_written, shown[1]]
+    return fig
 
   @app.callback(
       Output('stopButton', 'children'),
@@ -323,10 +420,14 @@ def register_callbacks (app, hwPlots, deviceProps):
   def stop_button_click (n_clicks):
     if n_clicks % 2 == 1:
       hwPlots.update_active = False 
-      file_writer.stop()
+      recorder.stop()
       return "Restart"
     elif n_clicks > 0:
       hwPlots.update_active = True
       global_values.reset()
+      global_rollups.reset()
+      global_processes.reset()
+      # A new recording is started for the new time axis.
+      if do_logfile: recorder.start()
     return "Stop"
   
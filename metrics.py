@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+# Registry of the metrics which can be recorded. Each metric declares where its
+# values come from:
+#   NVML:     an item of the C sampler, see nvml.deviceManager.getItemNames()
+#   HOST:     a key of host_reader.hostReader, stored once for the host
+#   GPU_HOST: a host value which belongs to each GPU, see hostReader.gpu_keys
+#   PYTHON:   a callable read(gpu_id), which is called once per collection
+# and how expensive it is to query, so that expensive metrics can be left out.
+# A metric with a period is read less often than the samples are recorded, see
+# scheduler.tickScheduler, and keeps its last value in between.
+# New metrics are added with register, e.g. in a site-specific script:
+#   registry = metrics.default_registry()
+#   registry.register(metrics.metric("Fan", "%", metrics.PYTHON, read=lambda gpu_id: read_fan(gpu_id)))
+
+NVML = "nvml"
+HOST = "host"
+GPU_HOST = "gpu-host"
+PYTHON = "python"
+
+COST_CLASSES = ["cheap", "moderate", "expensive"]
+
+class metric():
+  # counter=True marks a cumulative counter, which is stored as its rate per second.
+  # Counters are read at every sample, since a held value would show as a rate of 0.
+  def __init__(self, name, unit, source, cost="cheap", read=None, counter=False, description="", period=None):
+    if source not in (NVML, HOST, GPU_HOST, PYTHON):
+      raise ValueError("Unknown source %s of metric %s" % (source, name))
+    if cost not in COST_CLASSES:
+      raise ValueError("Unknown cost class %s of metric %s" % (cost, name))
+    if source == PYTHON and read is None:
+      raise ValueError("Metric %s needs a read function" % name)
+    self.name = name
+    self.unit = unit
+    self.source = source
+    self.cost = cost
+    self.read = read
+    self.counter = counter
+    self.description = description
+    self.period = None if counter else period
+
+  def label(self):
+    unit = self.unit + "/s" if self.counter and self.unit else self.unit
+    return "%s [%s]" % (self.name, unit) if unit else self.name
+
+  def per_gpu(self):
+    return self.source != HOST
+
+class metricRegistry():
+  def __init__(self):
+    self.metrics = {}
+
+  def register(self, new_metric):
+    if new_metric.name in self.metrics:
+      raise ValueError("Metric %s is already registered" % new_metric.name)
+    self.metrics[new_metric.name] = new_metric
+    return new_metric
+
+  def get(self, name):
+    return self.metrics[name]
+
+  def names(self):
+    return list(self.metrics)
+
+  def set_periods(self, specs):
+    # Sets the periods of metrics from strings like "Temperature=1.0".
+    for spec in specs:
+      name, _, period = spec.partition("=")
+      if name not in self.metrics:
+        raise ValueError("Unknown metric: " + name)
+      if not self.metrics[name].counter:
+        self.metrics[name].period = float(period) if period else None
+
+  def select(self, names=None, max_cost="expensive"):
+    # The metrics with the given names, or all of them, without those which cost
+    # more than max_cost. They are returned in the order of registration.
+    if names is not None:
+      unknown = [name for name in names if name not in self.metrics]
+      if unknown:
+        raise ValueError("Unknown metrics: " + ", ".join(unknown))
+    max_level = COST_CLASSES.index(max_cost)
+    return [m for m in self.metrics.values()
+            if (names is None or m.name in names) and COST_CLASSES.index(m.cost) <= max_level]
+
+def default_registry():
+  registry = metricRegistry()
+  # Slowly changing metrics are read once per second or less often by default.
+  for name, unit, cost, counter, period, description in [
+      ("Temperature", "C", "cheap", False, 1.0, "GPU core temperature"),
+      ("Frequency", "MHz", "cheap", False, None, "Graphics clock"),
+      ("PCIE", "KB/s", "expensive", False, 1.0, "PCIe TX throughput, sampled by NVML over 20 ms"),
+      ("Power", "W", "cheap", False, None, "Power draw"),
+      ("GPU-Util", "%", "cheap", False, None, "Time in which a kernel was running"),
+      ("Memory-Util", "%", "cheap", False, None, "Time in which device memory was read or written"),
+      ("Memory-Used", "MiB", "cheap", False, None, "Allocated device memory"),
+      ("SM-Clock", "MHz", "cheap", False, None, "SM clock"),
+      ("Memory-Clock", "MHz", "cheap", False, 1.0, "Memory clock"),
+      ("ECC-Errors", "", "moderate", False, 10.0, "Uncorrected ECC errors since the driver was loaded"),
+      ("Throttle-Reasons", "", "cheap", False, None, "Bit mask of the reasons for reduced clocks"),
+      ("NVLink-TX", "KiB", "expensive", True, None, "Data sent over all NVLinks"),
+      ("NVLink-RX", "KiB", "expensive", True, None, "Data received over all NVLinks")]:
+    registry.register(metric(name, unit, NVML, cost, counter=counter, description=description, period=period))
+  registry.register(metric("Local-CPU", "%", GPU_HOST, "moderate",
+                           description="Utilization of the cores local to the GPU"))
+  registry.register(metric("NUMA-Memory", "%", GPU_HOST, "moderate",
+                           description="Used memory of the NUMA node of the GPU"))
+  registry.register(metric("CPU", "%", HOST, description="Utilization of all cores"))
+  registry.register(metric("Host-Memory", "%", HOST, description="Used host memory"))
+  registry.register(metric("Load", "", HOST, description="1 minute load average"))
+  return registry
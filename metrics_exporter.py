@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+# Serves the latest values of a multiProcState at /metrics in the Prometheus text
+# format, or as OpenMetrics if the scraper asks for it, e.g.
+#   monitorgpu_power{host="node1",gpu="0",name="NVIDIA A100"} 61
+#   monitorgpu_host_cpu{host="node1"} 12.5
+#   monitorgpu_host_cpu_core{host="node1",core="3"} 80
+# The response is rendered once per new sample and shared by all scrapes in between.
+# The server runs in a thread of the process which owns it and only reads the shared
+# memory of the store, so it does not depend on the dashboard.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import re
+import threading
+
+PREFIX = "monitorgpu_"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+def metric_name(key):
+  return PREFIX + re.sub(r"[^a-z0-9_]", "_", key.lower())
+
+def label_value(value):
+  return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_value(value):
+  if math.isnan(value): return "NaN"
+  if math.isinf(value): return "+Inf" if value > 0 else "-Inf"
+  return "%.10g" % value
+
+class metricsExporter():
+  # The HELP text of each key is taken from its metric in the registry, if given.
+  def __init__(self, state, device_names, host_name, registry=None):
+    self.state = state
+    self.lock = threading.Lock()
+    self.n_rendered = None
+    self.body = b""
+    host = "host=\"%s\"" % label_value(host_name)
+    descriptions = {}
+    if registry is not None:
+      for name in registry.names():
+        m = registry.get(name)
+        unit = m.unit + "/s" if m.counter and m.unit else m.unit
+        descriptions[name] = (m.description or name) + (" [%s]" % unit if unit else "")
+    # Each sample line is a fixed prefix and the value, so rendering only formats numbers.
+    self.header = {}
+    self.gpu_lines = []
+    for key in state.keys:
+      name = metric_name(key)
+      self.header[key] = self.help_lines(name, descriptions.get(key, key))
+      self.gpu_lines.append(["%s{%s,gpu=\"%d\",name=\"%s\"} " % (name, host, gpu_id, label_value(device_name))
+                             for gpu_id, device_name in enumerate(device_names[:state.num_gpus])])
+    self.host_lines = []
+    self.host_header = {}
+    for key in state.host_keys:
+      core = re.fullmatch(r"CPU(\d+)", key)
+      if core:
+        name = PREFIX + "host_cpu_core"
+        self.host_lines.append((name, "%s{%s,core=\"%s\"} " % (name, host, core.group(1))))
+      else:
+        name = metric_name(key if key.lower().startswith("host") else "host_" + key)
+        self.host_lines.append((name, "%s{%s} " % (name, host)))
+      if name not in self.host_header:
+        self.host_header[name] = self.help_lines(name, descriptions.get(key, "Utilization of one core [%]" if core else key))
+
+  def help_lines(self, name, description):
+    return "# HELP %s %s\n# TYPE %s gauge\n" % (name, description.replace("\n", " "), name)
+
+  def render(self):
+    # The response body for the latest row, which is only rendered again after a new row.
+    n_written = self.state.n_written.value
+    if n_written == self.n_rendered: return self.body
+    with self.lock:
+      if n_written != self.n_rendered:
+        self.body = self.render_row(n_written).encode()
+        self.n_rendered = n_written
+    return self.body
+
+  def render_row(self, n_written):
+    if n_written == 0: return ""
+    t, values, host_values, _ = self.state.get_since(n_written - 1)
+    if len(t) == 0: return ""
+    lines = []
+    for i_key, key in enumerate(self.state.keys):
+      lines.append(self.header[key])
+      for gpu_id, line in enumerate(self.gpu_lines[i_key]):
+        lines.append(line + format_value(values[-1, gpu_id, i_key]) + "\n")
+    previous_name = None
+    for (name, line), value in zip(self.host_lines, host_values[-1]):
+      if name != previous_name:
+        lines.append(self.host_header[name])
+        previous_name = name
+      lines.append(line + format_value(value) + "\n")
+    return "".join(lines)
+
+class metricsHandler(BaseHTTPRequestHandler):
+  exporter = None
+
+  def do_GET(self):
+    if self.path.split("?")[0] != "/metrics":
+      self.send_error(404)
+      return
+    body = self.exporter.render()
+    if "application/openmetrics-text" in self.headers.get("Accept", ""):
+      body += b"# EOF\n"
+      content_type = OPENMETRICS_CONTENT_TYPE
+    else:
+      content_type = PROMETHEUS_CONTENT_TYPE
+    self.send_response(200)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+def start_server(exporter, port, address=""):
+  # Serves /metrics in a daemon thread. Returns the server, which is stopped with shutdown().
+  handler = type("handler", (metricsHandler,), {"exporter": exporter})
+  server = ThreadingHTTPServer((address, port), handler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
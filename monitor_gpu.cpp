@@ -1,7 +1,12 @@
 #include "monitor_gpu.h"
 #include "dgemm.h"
 #include "stream.h"
+#include "common.h"
+#include <algorithm>
+#include <functional>
 #include <iostream>
+#include <map>
+#include <string.h>
 #include "cuda_runtime_api.h"
 
 static PyObject *dgemmMaxMatrixSize (PyObject *self, PyObject *args, PyObject *kwargs) {
@@ -28,52 +33,243 @@ static PyObject *streamMaxVectorSize (PyObject *self, PyObject *args, PyObject *
 }
 
 
+static const char *dgemm_status_string (unsigned int status) {
+   if (status == DGEMM_CUBLAS_SUCCESS) {
+      return "OK";
+   } else if (status == DGEMM_CUBLAS_ERR_OOM) {
+      return "OOM";
+   } else {
+      return "Unknown";
+   }
+}
+
+static PyObject *dgemm_result (unsigned int status, double gflops_avg, double gflops_min,
+                               double gflops_max, double gflops_stddev) {
+   return Py_BuildValue("{s:s,s:d,s:d,s:d,s:d}",
+                       "Status", dgemm_status_string(status),
+                       "Avg", gflops_avg,
+                       "Min", gflops_min,
+                       "Max", gflops_max,
+                       "Stddev", gflops_stddev);
+}
+
 static PyObject *performDgemm (PyObject *self, PyObject *args, PyObject *kwargs) {
    int N = 1000;
    const double alpha = 1.0;
    const double beta = 1.0;
    int n_repeats = 1.0;
+   int gpu_id = 0;
    
-   static char *keywords[] = {"N", "nrepeats", NULL};
-   if (!PyArg_ParseTupleAndKeywords(args, kwargs, "i|i", keywords, &N, &n_repeats)) {
+   static char *keywords[] = {"N", "nrepeats", "gpu", NULL};
+   if (!PyArg_ParseTupleAndKeywords(args, kwargs, "i|ii", keywords, &N, &n_repeats, &gpu_id)) {
      //return PyErr_BadArgument();
      return NULL;
    }
-   printf ("Input: %d %d\n", N, n_repeats);
+   printf ("Input: %d %d on GPU %d\n", N, n_repeats, gpu_id);
+
+   if (cudaSetDevice(gpu_id) != cudaSuccess) {
+      return Py_BuildValue("{s:s}", "Status", "INVALID_DEVICE");
+   }
 
    double gflops_avg, gflops_min, gflops_max, gflops_stddev;
    unsigned int status;
+   Py_BEGIN_ALLOW_THREADS
    doDgemm(N, alpha, beta, n_repeats,
            &gflops_avg, &gflops_min, &gflops_max, &gflops_stddev, &status);
+   Py_END_ALLOW_THREADS
 
-   const char *str_status;
-   if (status == DGEMM_CUBLAS_SUCCESS) {
-      str_status = "OK";
-   } else if (status == DGEMM_CUBLAS_ERR_OOM) {
-      str_status = "OOM";
-   } else {
-      str_status = "Unknown";
+   return dgemm_result(status, gflops_avg, gflops_min, gflops_max, gflops_stddev);
+}
+
+static int dgemmContext_tp_init (dgemm_context_object_t *self, PyObject *args, PyObject *kwargs) {
+   int gpu_id = 0;
+   static char *keywords[] = {"gpu", NULL};
+   if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|i", keywords, &gpu_id)) {
+      return -1;
+   }
+   if (self->busy) {
+      PyErr_SetString(PyExc_RuntimeError, "dgemmContext is in use by another thread");
+      return -1;
    }
+   if (self->initialized) dgemmContextFree(&self->context);
+   dgemmContextInit(&self->context, gpu_id);
+   self->initialized = true;
+   return 0;
+}
 
-   return Py_BuildValue("{s:s,s:d,s:d,s:d,s:d}",
-                       "Status", str_status,
-                       "Avg", gflops_avg,
-                       "Min", gflops_min,
-                       "Max", gflops_max,
-                       "Stddev", gflops_stddev);
+static PyObject *dgemmContext_tp_new (PyTypeObject *type, PyObject *args, PyObject *kwargs) {
+   dgemm_context_object_t *self = (dgemm_context_object_t*)type->tp_alloc(type, 0);
+   if (self != NULL) {
+      self->initialized = false;
+      self->busy = false;
+   }
+   return (PyObject*)self;
+}
+
+static void dgemmContext_tp_dealloc (dgemm_context_object_t *self) {
+   if (self->initialized) dgemmContextFree(&self->context);
+   Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+// The methods release the GIL while they use the context, so other threads are turned
+// away until they are done. The flag is only read and set with the GIL held.
+static int dgemmContext_acquire (dgemm_context_object_t *self) {
+   if (!self->initialized) {
+      PyErr_SetString(PyExc_RuntimeError, "dgemmContext has not been initialized");
+      return -1;
+   }
+   if (self->busy) {
+      PyErr_SetString(PyExc_RuntimeError, "dgemmContext is in use by another thread");
+      return -1;
+   }
+   self->busy = true;
+   return 0;
+}
+
+static PyObject *dgemmContext_run (dgemm_context_object_t *self, PyObject *args, PyObject *kwargs) {
+   int N;
+   int n_repeats = 1;
+   static char *keywords[] = {"N", "nrepeats", NULL};
+   if (!PyArg_ParseTupleAndKeywords(args, kwargs, "i|i", keywords, &N, &n_repeats)) {
+      return NULL;
+   }
+   if (dgemmContext_acquire(self) < 0) return NULL;
+   double gflops_avg, gflops_min, gflops_max, gflops_stddev;
+   unsigned int status;
+   Py_BEGIN_ALLOW_THREADS
+   doDgemmInContext(&self->context, N, 1.0, 1.0, n_repeats,
+                    &gflops_avg, &gflops_min, &gflops_max, &gflops_stddev, &status);
+   Py_END_ALLOW_THREADS
+   self->busy = false;
+   return dgemm_result(status, gflops_avg, gflops_min, gflops_max, gflops_stddev);
 }
 
+static PyObject *dgemmContext_sweep (dgemm_context_object_t *self, PyObject *args, PyObject *kwargs) {
+   // One result per size, with the size as "N". The buffers are sized for the largest one which fits.
+   PyObject *sizes_arg;
+   int n_repeats = 1;
+   static char *keywords[] = {"sizes", "nrepeats", NULL};
+   if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|i", keywords, &sizes_arg, &n_repeats)) {
+      return NULL;
+   }
+   PyObject *sizes = PySequence_Fast(sizes_arg, "sizes must be a sequence of matrix sizes");
+   if (sizes == NULL) return NULL;
+   const Py_ssize_t n_sizes = PySequence_Fast_GET_SIZE(sizes);
+   std::vector<int> Ns(n_sizes);
+   for (Py_ssize_t i = 0; i < n_sizes; i++) {
+      long N = PyLong_AsLong(PySequence_Fast_GET_ITEM(sizes, i));
+      if (N == -1 && PyErr_Occurred()) {
+         Py_DECREF(sizes);
+         return NULL;
+      }
+      if (N <= 0 || N > INT_MAX) {
+         PyErr_SetString(PyExc_ValueError, "matrix sizes must be positive integers");
+         Py_DECREF(sizes);
+         return NULL;
+      }
+      Ns[i] = (int)N;
+   }
+   Py_DECREF(sizes);
+
+   PyObject *results = PyList_New(n_sizes);
+   if (results == NULL) return NULL;
+   if (dgemmContext_acquire(self) < 0) {
+      Py_DECREF(results);
+      return NULL;
+   }
+   // The buffers are reserved for the largest size which fits. The sizes above it are not
+   // run and get the status of their reservation, or that of the last one for the sizes
+   // which were not tried after an error other than OOM.
+   std::vector<int> by_size(Ns);
+   std::sort(by_size.begin(), by_size.end(), std::greater<int>());
+   by_size.erase(std::unique(by_size.begin(), by_size.end()), by_size.end());
+   std::map<int, unsigned int> failed;
+   unsigned int reserve_status = DGEMM_CUBLAS_SUCCESS;
+   int N_reserved = 0;
+   Py_BEGIN_ALLOW_THREADS
+   for (int N : by_size) {
+      reserve_status = dgemmContextReserve(&self->context, N);
+      if (reserve_status == DGEMM_CUBLAS_SUCCESS) {
+         N_reserved = N;
+         break;
+      }
+      failed[N] = reserve_status;
+      if (reserve_status != DGEMM_CUBLAS_ERR_OOM) break;
+   }
+   Py_END_ALLOW_THREADS
+   for (Py_ssize_t i = 0; i < n_sizes; i++) {
+      double gflops_avg = 0, gflops_min = 0, gflops_max = 0, gflops_stddev = 0;
+      unsigned int status;
+      if (Ns[i] > N_reserved) {
+         status = failed.count(Ns[i]) ? failed[Ns[i]] : reserve_status;
+      } else {
+         Py_BEGIN_ALLOW_THREADS
+         doDgemmInContext(&self->context, Ns[i], 1.0, 1.0, n_repeats,
+                          &gflops_avg, &gflops_min, &gflops_max, &gflops_stddev, &status);
+         Py_END_ALLOW_THREADS
+      }
+      PyObject *result = dgemm_result(status, gflops_avg, gflops_min, gflops_max, gflops_stddev);
+      if (result == NULL) {
+         self->busy = false;
+         Py_DECREF(results);
+         return NULL;
+      }
+      PyObject *N = PyLong_FromLong(Ns[i]);
+      PyDict_SetItemString(result, "N", N);
+      Py_DECREF(N);
+      PyList_SET_ITEM(results, i, result);
+   }
+   self->busy = false;
+   return results;
+}
+
+static PyObject *dgemmContext_release (dgemm_context_object_t *self, PyObject *args) {
+   if (dgemmContext_acquire(self) < 0) return NULL;
+   dgemmContextFree(&self->context);
+   self->busy = false;
+   Py_RETURN_NONE;
+}
+
+static PyMethodDef dgemmContextMethods[] = {
+   {"run", (PyCFunction)dgemmContext_run, METH_VARARGS | METH_KEYWORDS,
+    "DGEMM of size N, like performDgemm, reusing the handle and buffers of earlier runs."},
+   {"sweep", (PyCFunction)dgemmContext_sweep, METH_VARARGS | METH_KEYWORDS,
+    "DGEMM for each of the sizes. Returns a list of results, which include N."},
+   {"release", (PyCFunction)dgemmContext_release, METH_NOARGS,
+    "Free the buffers and the cuBLAS handle. The next run allocates them again."},
+   {NULL}
+};
+
+static PyTypeObject dgemmContextType = {
+   PyVarObject_HEAD_INIT(NULL, 0)
+   .tp_name = "nvml.dgemmContext",
+   .tp_basicsize = sizeof(dgemm_context_object_t),
+   .tp_dealloc = (destructor)dgemmContext_tp_dealloc,
+   .tp_flags = Py_TPFLAGS_DEFAULT,
+   .tp_doc = "Keeps the cuBLAS handle and the matrices of the DGEMM benchmark on one GPU between runs.",
+   .tp_methods = dgemmContextMethods,
+   .tp_init = (initproc)dgemmContext_tp_init,
+   .tp_new = dgemmContext_tp_new
+};
+
 static PyObject *performStream (PyObject *self, PyObject *args, PyObject *kwargs) {
-  static char *keywords[] = {"array_size", "n_times", NULL};
+  static char *keywords[] = {"array_size", "n_times", "gpu", NULL};
   int array_size = 10000;
   int n_times = 10;
-  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "ii", keywords, &array_size, &n_times)) {
+  int gpu_id = 0;
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "ii|i", keywords, &array_size, &n_times, &gpu_id)) {
      return NULL;
   }
 
+  if (cudaSetDevice(gpu_id) != cudaSuccess) {
+     return Py_BuildValue("{s:s}", "Status", "INVALID_DEVICE");
+  }
+
   int status;
   double bw_copy, bw_scale, bw_add, bw_triad;
+  Py_BEGIN_ALLOW_THREADS
   do_stream (array_size, n_times, &bw_copy, &bw_scale, &bw_add, &bw_triad, &status);
+  Py_END_ALLOW_THREADS
 
   const char *str_status;
   if (status == STREAM_SUCCESS) {
@@ -87,7 +283,7 @@ static PyObject *performStream (PyObject *self, PyObject *args, PyObject *kwargs
   } else if (status == STREAM_OOM_HOST) {
      str_status = "OOM_HOST";
      return Py_BuildValue("{s:s}", "Status", str_status);
-  } else if (status == STREAM_OOM_HOST) {
+  } else if (status == STREAM_OOM_DEVICE) {
      str_status = "OOM_DEVICE";
      return Py_BuildValue("{s:s}", "Status", str_status);
   } else {
@@ -96,23 +292,191 @@ static PyObject *performStream (PyObject *self, PyObject *args, PyObject *kwargs
   }
 }
 
+static void read_device (device_manager_t *self, int i) {
+   NVMLDeviceManager &device_manager = *self->device_manager;
+   self->temp[i] = device_manager.getTemperature(i); 
+   self->freq[i] = device_manager.getFrequency(i); 
+   self->pcie_rate[i] = device_manager.getPcieRate(i);
+   self->power_usage[i] = device_manager.getPowerUsage(i);
+   // Convert from mW to W. I don't see when a device should not pull at least 1W of power
+   // and the conversion loss is acceptable.
+   self->power_usage[i] /= 1000;
+   device_manager.getUtilization(i, &(self->gpu_util[i]), &(self->mem_util[i]));
+   device_manager.getMemoryInfo(i, &(self->memory[i].free), &(self->memory[i].total), &(self->memory[i].used));
+}
+
 static PyObject *readOut (device_manager_t *self) {
-   NVML nvml;
-   NVMLDeviceManager device_manager{nvml};
    for (int i = 0; i < self->num_devices; i++) {
-      self->temp[i] = device_manager.getTemperature(i); 
-      self->freq[i] = device_manager.getFrequency(i); 
-      self->pcie_rate[i] = device_manager.getPcieRate(i);
-      self->power_usage[i] = device_manager.getPowerUsage(i);
-      // Convert from mW to W. I don't see when a device should not pull at least 1W of power
-      // and the conversion loss is acceptable.
-      self->power_usage[i] /= 1000;
-      device_manager.getUtilization(i, &(self->gpu_util[i]), &(self->mem_util[i]));
-      device_manager.getMemoryInfo(i, &(self->memory[i].free), &(self->memory[i].total), &(self->memory[i].used));
+      read_device (self, i);
    }
    Py_RETURN_NONE;
 }
 
+static int get_double_buffer (PyObject *args, Py_buffer *view) {
+  PyObject *buffer;
+  if (!PyArg_ParseTuple (args, "O", &buffer)) {
+    return -1;
+  }
+  if (PyObject_GetBuffer(buffer, view, PyBUF_WRITABLE | PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0) {
+    return -1;
+  }
+  if (view->itemsize != sizeof(double) || view->format[strlen(view->format) - 1] != 'd') {
+    PyBuffer_Release(view);
+    PyErr_SetString(PyExc_TypeError, "Requires a buffer of doubles");
+    return -1;
+  }
+  return 0;
+}
+
+static PyObject *readInto (device_manager_t *self, PyObject *args) {
+  Py_buffer view;
+  if (get_double_buffer(args, &view) < 0) {
+    return NULL;
+  }
+
+  // Fill as many devices as fit into the buffer, one row of N_ITEMS values each.
+  int n_devices = view.len / sizeof(double) / N_ITEMS;
+  if (n_devices > self->num_devices) n_devices = self->num_devices;
+  double *row = (double*)view.buf;
+  double t = get_time_monotonic();
+  std::vector<int> items = all_device_items();
+  for (int i = 0; i < n_devices; i++, row += N_ITEMS) {
+     read_device_items (*self->device_manager, i, items, row);
+  }
+  PyBuffer_Release(&view);
+  return Py_BuildValue("d", t);
+}
+
+// Indices of the items with the names in the sequence, or all items for None.
+static int get_item_indices (PyObject *names, std::vector<int> &items) {
+  if (names == NULL || names == Py_None) {
+    items = all_device_items();
+    return 0;
+  }
+  PyObject *seq = PySequence_Fast(names, "items must be a sequence of item names");
+  if (seq == NULL) return -1;
+  for (Py_ssize_t i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+    const char *name = PyUnicode_AsUTF8(PySequence_Fast_GET_ITEM(seq, i));
+    if (name == NULL) {
+      Py_DECREF(seq);
+      return -1;
+    }
+    int item = find_device_item(name);
+    if (item < 0) {
+      PyErr_Format(PyExc_ValueError, "Unknown item: %s", name);
+      Py_DECREF(seq);
+      return -1;
+    }
+    items.push_back(item);
+  }
+  Py_DECREF(seq);
+  return 0;
+}
+
+// One positive divisor per item from the sequence, or 1 for all items for None.
+static int get_item_divisors (PyObject *values, int n_items, std::vector<int> &divisors) {
+  if (values == NULL || values == Py_None) {
+    divisors.assign(n_items, 1);
+    return 0;
+  }
+  PyObject *seq = PySequence_Fast(values, "divisors must be a sequence of integers");
+  if (seq == NULL) return -1;
+  if (PySequence_Fast_GET_SIZE(seq) != n_items) {
+    PyErr_SetString(PyExc_ValueError, "divisors must have one entry per item");
+    Py_DECREF(seq);
+    return -1;
+  }
+  for (Py_ssize_t i = 0; i < n_items; i++) {
+    long divisor = PyLong_AsLong(PySequence_Fast_GET_ITEM(seq, i));
+    if (divisor == -1 && PyErr_Occurred()) {
+      Py_DECREF(seq);
+      return -1;
+    }
+    if (divisor <= 0) {
+      PyErr_SetString(PyExc_ValueError, "divisors must be positive");
+      Py_DECREF(seq);
+      return -1;
+    }
+    divisors.push_back(divisor);
+  }
+  Py_DECREF(seq);
+  return 0;
+}
+
+static PyObject *startSampler (device_manager_t *self, PyObject *args, PyObject *kwargs) {
+  double period;
+  int buffer_size = 1024;
+  PyObject *item_names = NULL;
+  PyObject *item_divisors = NULL;
+  static char *keywords[] = {"period", "buffer_size", "items", "divisors", NULL};
+  if (!PyArg_ParseTupleAndKeywords(args, kwargs, "d|iOO", keywords, &period, &buffer_size,
+                                   &item_names, &item_divisors)) {
+    return NULL;
+  }
+  std::vector<int> items;
+  if (get_item_indices(item_names, items) < 0) {
+    return NULL;
+  }
+  std::vector<int> divisors;
+  if (get_item_divisors(item_divisors, items.size(), divisors) < 0) {
+    return NULL;
+  }
+  // Also rejects a NaN period.
+  if (!(period >= MIN_SAMPLER_PERIOD && period <= MAX_SAMPLER_PERIOD)) {
+    PyErr_Format(PyExc_ValueError, "period must be between %g and %g s", MIN_SAMPLER_PERIOD, MAX_SAMPLER_PERIOD);
+    return NULL;
+  }
+  if (buffer_size <= 0) {
+    PyErr_SetString(PyExc_ValueError, "buffer_size must be positive");
+    return NULL;
+  }
+  if (self->sampler != NULL && self->sampler->is_running()) {
+    PyErr_SetString(PyExc_RuntimeError, "Sampler is already running");
+    return NULL;
+  }
+  delete self->sampler;
+  self->sampler = new Sampler(*self->device_manager, self->num_devices, buffer_size, items, divisors);
+  self->sampler->start(period);
+  Py_RETURN_NONE;
+}
+
+static PyObject *stopSampler (device_manager_t *self) {
+  if (self->sampler != NULL) {
+    // The sampler thread never takes the GIL, but joining it can take up to one period.
+    Py_BEGIN_ALLOW_THREADS
+    self->sampler->stop();
+    Py_END_ALLOW_THREADS
+  }
+  Py_RETURN_NONE;
+}
+
+static PyObject *drainSamples (device_manager_t *self, PyObject *args) {
+  if (self->sampler == NULL) {
+    PyErr_SetString(PyExc_RuntimeError, "Sampler has not been started");
+    return NULL;
+  }
+  Py_buffer view;
+  if (get_double_buffer(args, &view) < 0) {
+    return NULL;
+  }
+  int max_rows = view.len / sizeof(double) / self->sampler->row_size();
+  int n_rows = self->sampler->drain((double*)view.buf, max_rows);
+  PyBuffer_Release(&view);
+  return Py_BuildValue("i", n_rows);
+}
+
+static PyObject *getNumDevices (device_manager_t *self) {
+  return Py_BuildValue("i", self->num_devices);
+}
+
+static PyObject *getItemNames (device_manager_t *self) {
+  PyObject *ret = PyTuple_New(N_ITEMS);
+  for (int i = 0; i < N_ITEMS; i++) {
+     PyTuple_SetItem (ret, i, PyUnicode_FromString(device_items[i].name));
+  }
+  return ret;
+}
+
 static PyObject *getItems (device_manager_t *self, PyObject *args) {
   int device_id;
   if (!PyArg_ParseTuple (args, "i", &device_id)) {
@@ -164,6 +528,14 @@ static PyObject *getDeviceName (device_manager_t *self, PyObject *args) {
   return Py_BuildValue("s", self->gpu_names[device_id].c_str());
 }
 
+static PyObject *getPciBusId (device_manager_t *self, PyObject *args) {
+  int device_id;
+  if (!PyArg_ParseTuple (args, "i", &device_id)) {
+     return NULL;
+  }
+  return Py_BuildValue("s", self->device_manager->getPciBusId(device_id).c_str());
+}
+
 static PyObject *getNumCores (device_manager_t *self, PyObject *args) {
   int device_id;
   if (!PyArg_ParseTuple (args, "i", &device_id)) {
@@ -184,9 +556,7 @@ static PyObject *getProcessInfo (device_manager_t *self, PyObject *args) {
      //return PyErr_BadArgument();
      return NULL;
   }
-  NVML nvml;
-  NVMLDeviceManager device_manager{nvml};
-  device_manager.getProcessInfo(device_id, &(self->current_processes[device_id]),
+  self->device_manager->getProcessInfo(device_id, &(self->current_processes[device_id]),
                                 &(self->max_running_processes[device_id]),
                                 &(self->process_ids[device_id]));
   PyObject *ret = PyList_New(self->current_processes[device_id]);
@@ -197,14 +567,31 @@ static PyObject *getProcessInfo (device_manager_t *self, PyObject *args) {
   return ret;
 }
 
+static PyObject *getProcessUsage (device_manager_t *self, PyObject *args) {
+  int device_id;
+  if (!PyArg_ParseTuple (args, "i", &device_id)) {
+     return NULL;
+  }
+  if (device_id < 0 || device_id >= self->num_devices) {
+     PyErr_SetString(PyExc_IndexError, "device index out of range");
+     return NULL;
+  }
+  std::vector<process_usage_t> usage;
+  self->device_manager->getProcessUsage(device_id, &(self->last_process_sample[device_id]), usage);
+  PyObject *ret = PyList_New(usage.size());
+  for (int i = 0; i < usage.size(); i++) {
+     PyList_SetItem (ret, i, Py_BuildValue("(IKi)", usage[i].pid, usage[i].used_memory, usage[i].sm_util));
+  }
+  return ret;
+}
+
 static PyObject *getProcessName (device_manager_t *self, PyObject *args) {
   int pid;
   if (!PyArg_ParseTuple (args, "i", &pid)) {
      return NULL;
   }
-  char *name = (char*) malloc (1024);
-  NVML nvml;
-  nvml.getProcessName(pid, name);
+  char name[NVML_SYSTEM_PROCESS_NAME_BUFFER_SIZE];
+  self->nvml->getProcessName(pid, name, NVML_SYSTEM_PROCESS_NAME_BUFFER_SIZE);
   return Py_BuildValue("s", name);
 }
 
@@ -213,10 +600,8 @@ static PyObject *getPersistenceMode (device_manager_t *self, PyObject *args) {
   if (!PyArg_ParseTuple (args, "i", &device_id)) {
      return NULL;
   }
-  NVML nvml;
-  NVMLDeviceManager device_manager{nvml};
   unsigned int mode;
-  device_manager.getPersistenceMode(device_id, &mode);
+  self->device_manager->getPersistenceMode(device_id, &mode);
   return Py_BuildValue ("O", mode == NVML_PERSISTENCE_ENABLED ? Py_True : Py_False);
 }
 
@@ -229,11 +614,27 @@ static PyObject *getNumGpus (device_manager_t *self, PyObject *args) {
 static PyMethodDef deviceMethods[] = {
    {"readOut", (PyCFunction)readOut, METH_NOARGS, "TBD"},
    {"getItems", (PyCFunction)getItems, METH_VARARGS, "TBD"},
+   {"readInto", (PyCFunction)readInto, METH_VARARGS,
+    "Read out all devices into a buffer of doubles with one row of items per device. Returns the monotonic time of the readout."},
+   {"getItemNames", (PyCFunction)getItemNames, METH_NOARGS, "Names of the items in one row written by readInto."},
+   {"startSampler", (PyCFunction)startSampler, METH_VARARGS | METH_KEYWORDS,
+    "Start reading out all devices every period seconds in a background thread, keeping at most buffer_size samples. "
+    "items is a sequence of item names to read, by default all of getItemNames(). "
+    "Item i is only read every divisors[i] periods and keeps its last value in between."},
+   {"stopSampler", (PyCFunction)stopSampler, METH_NOARGS, "Stop the background sampler."},
+   {"drainSamples", (PyCFunction)drainSamples, METH_VARARGS,
+    "Move the collected samples into a buffer of doubles, one row of 1 + getNumDevices() * len(items) values "
+    "(timestamp, items of each device) per sample. Returns the number of rows."},
+   {"getNumDevices", (PyCFunction)getNumDevices, METH_NOARGS, "Nr. of devices seen by NVML."},
    {"getUtilization", (PyCFunction)getUtilization, METH_VARARGS, "TBD"},
    {"getDeviceName", (PyCFunction)getDeviceName, METH_VARARGS, "TBD"},
+   {"getPciBusId", (PyCFunction)getPciBusId, METH_VARARGS, "PCI address of the device as in /sys/bus/pci/devices, or an empty string."},
    {"getNumCores", (PyCFunction)getNumCores, METH_VARARGS, "TBD"},
    {"getMemoryInfo", (PyCFunction)getMemoryInfo, METH_VARARGS, "TBD"},
    {"getProcessInfo", (PyCFunction)getProcessInfo, METH_VARARGS, "TBD"},
+   {"getProcessUsage", (PyCFunction)getProcessUsage, METH_VARARGS,
+    "List of (pid, used memory in bytes, SM utilization in %) of the compute processes on a device. "
+    "The utilization is -1 if the driver does not report it."},
    {"getProcessName", (PyCFunction)getProcessName, METH_VARARGS, "TBD"},
    {"getPersistenceMode", (PyCFunction)getPersistenceMode, METH_VARARGS, "TBD"},
    {"getNumGpus", (PyCFunction)getNumGpus, METH_NOARGS, "TBD"},
@@ -254,8 +655,11 @@ static PyTypeObject deviceManagerType = {
 };
 
 static int deviceManager_tp_init (device_manager_t *self, PyObject *args, PyObject *kwargs) {
-   NVML nvml;
-   NVMLDeviceManager device_manager{nvml};
+   self->nvml = new NVML();
+   self->device_manager = new NVMLDeviceManager(*self->nvml);
+   self->sampler = NULL;
+   self->owner_pid = getpid();
+   NVMLDeviceManager &device_manager = *self->device_manager;
 
    self->num_devices = device_manager.num_devices;
    self->memory = (nvml_memory_t *) malloc(self->num_devices * sizeof(nvml_memory_t));
@@ -278,6 +682,7 @@ static int deviceManager_tp_init (device_manager_t *self, PyObject *args, PyObje
      self->current_processes[i] = 0;
      self->max_running_processes[i] = 0;
      self->process_ids[i] = NULL;
+     self->last_process_sample.push_back(0);
    }
    return 0;
 }
@@ -299,6 +704,21 @@ static int deviceManager_tp_traverse (device_manager_t *self, visitproc visit, v
 
 static void deviceManager_tp_dealloc (device_manager_t *self) {
    deviceManager_tp_clear(self);
+   if (self->owner_pid == getpid()) {
+      delete self->sampler;
+      // The device handles are only valid while the NVML session is alive,
+      // so the manager has to go first.
+      delete self->device_manager;
+      delete self->nvml;
+   }
+   for (int i = 0; i < self->num_devices; i++) {
+      free(self->process_ids[i]);
+   }
+   free(self->process_ids);
+   free(self->current_processes);
+   free(self->max_running_processes);
+   free(self->memory);
+   Py_TYPE(self)->tp_free((PyObject*)self);
 }
 
 static PyMethodDef nvml_methods[] = {
@@ -333,5 +753,6 @@ PyMODINIT_FUNC PyInit_nvml(void) {
    Py_Initialize();
    PyObject *thisPy = PyModule_Create(&nvml_definition);
    PyModule_AddType(thisPy, &deviceManagerType);
+   PyModule_AddType(thisPy, &dgemmContextType);
    return thisPy;
 }
@@ -5,10 +5,20 @@
 #include "structmember.h"
 
 #include <string>
+#include <unistd.h>
 #include "nvml_interface.h"
+#include "sampler.h"
+#include "dgemm.h"
 
 typedef struct {
    PyObject_HEAD
+   // One NVML session and its device handles live as long as the deviceManager.
+   NVML *nvml;
+   NVMLDeviceManager *device_manager;
+   Sampler *sampler;
+   // The process which opened the session. A copy inherited by a forked child
+   // must not shut it down, and its sampler thread does not exist in the child.
+   pid_t owner_pid;
    int num_devices;
    std::vector<std::string> gpu_names;
    std::vector<int> num_cores;
@@ -22,8 +32,18 @@ typedef struct {
    unsigned int* max_running_processes;
    unsigned int* current_processes;
    int **process_ids;
+   // Time of the last per-process utilization sample of each device, in us.
+   std::vector<unsigned long long> last_process_sample;
 } device_manager_t;
 
+typedef struct {
+   PyObject_HEAD
+   dgemm_context_t context;
+   bool initialized;
+   // Set while a call uses the context without the GIL.
+   bool busy;
+} dgemm_context_object_t;
+
 static int deviceManager_tp_init (device_manager_t *self, PyObject *args, PyObject *kwargs);
 static PyObject *deviceManager_tp_new (PyTypeObject *type, PyObject *args, PyObject *kwargs);
 static int deviceManager_tp_clear (device_manager_t *self);
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+# Records the hardware counters into a .hwout file without the dashboard, e.g. as a
+# prefix in batch job scripts:
+#   monitor_record.py --rate 10 -- mpirun ./my_app
+# Without a command, it records for --duration seconds or until it is interrupted.
+
+import argparse
+import signal
+import subprocess
+import sys
+import time
+
+import nvml
+
+import cluster
+import file_writer
+import host_reader
+import metrics
+import metrics_exporter
+import sample_store
+
+def stop_on_signal (signum, frame):
+  raise KeyboardInterrupt
+
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description="Record GPU hardware counters into a .hwout file.")
+   parser.add_argument("--rate", dest="rate", type=float, default=1.0,
+                       help="Samples per second.")
+   parser.add_argument("--duration", dest="duration", type=float, default=None,
+                       help="Stop recording after this many seconds.")
+   parser.add_argument("--output", "-o", dest="filename", default="",
+                       help="Name of the .hwout file. Default: <host>_<start date>.hwout")
+   parser.add_argument("--flush-interval", dest="t_flush", type=float, default=5.0,
+                       help="Time interval in seconds in which the file is written to disk.")
+   parser.add_argument("--metrics", dest="metrics", default="all",
+                       help="Comma-separated list of the metrics to record, or 'all'.")
+   parser.add_argument("--max-cost", dest="max_cost", choices=metrics.COST_CLASSES, default="moderate",
+                       help="Leave out the metrics which are more expensive to query.")
+   parser.add_argument("--metrics-port", dest="metrics_port", type=int, default=None,
+                       help="Serve the latest values at http://<host>:PORT/metrics for Prometheus.")
+   parser.add_argument("--record", action=argparse.BooleanOptionalAction, dest="do_record", default=True,
+                       help="Write the .hwout file. Without it, the samples are only served or sent.")
+   parser.add_argument("--aggregator", dest="aggregator", default=None, metavar="ADDRESS",
+                       help="Send the samples to the cluster dashboard at HOST:PORT or unix:PATH.")
+   parser.add_argument("--node-name", dest="node_name", default=None,
+                       help="Name of this node in the cluster dashboard. Default: the host name.")
+   parser.add_argument("command", nargs=argparse.REMAINDER,
+                       help="Command to run while recording, after --.")
+   parser.add_argument("--metric-period", dest="metric_periods", action="append", default=[],
+                       metavar="NAME=SECONDS",
+                       help="Read a metric only every SECONDS instead of at every sample. Can be repeated.")
+   args = parser.parse_args()
+   command = args.command[1:] if args.command[:1] == ["--"] else args.command
+
+   device = nvml.deviceManager()
+   num_gpus = device.getNumDevices()
+   host = host_reader.hostReader(pci_bus_ids=[device.getPciBusId(gpu_id) for gpu_id in range(num_gpus)])
+   registry = metrics.default_registry()
+   registry.set_periods(args.metric_periods)
+   gpu_metrics = [m for m in registry.select(None if args.metrics == "all" else args.metrics.split(","), args.max_cost)
+                  if m.per_gpu()]
+   keys = [m.name for m in gpu_metrics]
+   device_names = [device.getDeviceName(gpu_id) for gpu_id in range(num_gpus)]
+
+   t_record = 1 / args.rate
+   t_collect = max(t_record, 0.1)
+   collector = sample_store.sampleCollector(device, host, gpu_metrics, num_gpus, t_record, t_collect)
+   state = sample_store.multiProcState(keys, collector.buffer_size, num_gpus, host_keys=host.keys)
+   recorder = file_writer.sampleRecorder(state, device_names, host.host_name, args.t_flush, args.filename)
+   if args.do_record:
+      recorder.start()
+   agent = None
+   if args.aggregator is not None:
+      agent = cluster.clusterAgent(state, device_names, args.node_name or host.host_name, args.aggregator, t_collect)
+      agent.start()
+   if args.metrics_port is not None:
+      metrics_exporter.start_server(metrics_exporter.metricsExporter(state, device_names, host.host_name, registry),
+                                    args.metrics_port)
+
+   signal.signal(signal.SIGTERM, stop_on_signal)
+   proc = subprocess.Popen(command) if command else None
+   t_end = time.monotonic() + args.duration if args.duration is not None else None
+   return_code = 0
+
+   collector.start()
+   try:
+      while True:
+         time.sleep(t_collect)
+         state.put_rows(*collector.collect())
+         recorder.record()
+         if proc is not None and proc.poll() is not None: break
+         if t_end is not None and time.monotonic() >= t_end: break
+   except KeyboardInterrupt:
+      pass
+   finally:
+      collector.stop()
+      state.put_rows(*collector.collect())
+      recorder.record()
+      # Closes the file.
+      recorder.stop()
+      recorder.record()
+      if agent is not None: agent.stop()
+
+   if proc is not None:
+      if proc.poll() is None:
+         proc.terminate()
+      return_code = proc.wait()
+   sys.exit(return_code)
@@ -1,15 +1,21 @@
 #include <dlfcn.h>
+#include <cmath>
 #include <iostream>
 
 #include "nvml_interface.h"
 
 NVML::NVML(std::string_view lib_name) {
   nvml_solib = dlopen (lib_name.data(), RTLD_LAZY); 
+  if (nvml_solib == NULL) {
+     printf ("Could not open %s!\n", lib_name.data());
+     return;
+  }
   bind_functions();
   auto nv_status = nvmlInit();
   if (nv_status != nvmlReturn_t::NVML_SUCCESS) {
      printf ("Could not init NVML!\n");
   } else {
+     initialized = true;
      char driver_version[NVML_SYSTEM_DRIVER_VERSION_BUFFER_SIZE];
      char nvml_version[NVML_SYSTEM_NVML_VERSION_BUFFER_SIZE];
      auto nv_status_1 = getDriverVersion(driver_version, NVML_SYSTEM_DRIVER_VERSION_BUFFER_SIZE);
@@ -24,6 +30,7 @@ sofunc_handle_t load_func_or_halt (solib_handle_t lib, std::string_view func_nam
 
 void NVML::bind_functions() {
   nvmlInit = reinterpret_cast<nvmlInit_t>(dlsym(nvml_solib, "nvmlInit"));
+  nvmlShutdown = reinterpret_cast<nvmlShutdown_t>(dlsym(nvml_solib, "nvmlShutdown"));
   getNVMLDeviceCount = reinterpret_cast<nvmlDeviceGetCount_t>(dlsym(nvml_solib, "nvmlDeviceGetCount_v2"));
   if (getNVMLDeviceCount == NULL) {
     getNVMLDeviceCount = reinterpret_cast<nvmlDeviceGetCount_t>(dlsym(nvml_solib, "nvmlDeviceGetCount"));
@@ -45,17 +52,29 @@ void NVML::bind_functions() {
      getNVMLProcInfo = reinterpret_cast<nvmlDeviceGetProcInfo_t>(dlsym(nvml_solib, "nvmlDeviceGetComputeRunningProcesses_v2"));
   }
   if (getNVMLProcInfo == NULL) {
-     getNVMLProcInfo = reinterpret_cast<nvmlDeviceGetProcInfo_t>(dlsym(nvml_solib, "nvmlDeviceGetComputeRunningProcesses"));
+     getNVMLProcInfo_v1 = reinterpret_cast<nvmlDeviceGetProcInfo_v1_t>(dlsym(nvml_solib, "nvmlDeviceGetComputeRunningProcesses"));
   }
+  getNVMLProcUtilization = reinterpret_cast<nvmlDeviceGetProcessUtilization_t>(dlsym(nvml_solib, "nvmlDeviceGetProcessUtilization"));
   getNVMLProcName = reinterpret_cast<nvmlSystemGetProcessName_t>(dlsym(nvml_solib, "nvmlSystemGetProcessName"));
 
   getNVMLPersistenceMode = reinterpret_cast<nvmlDeviceGetPersistenceMode_t>(dlsym(nvml_solib, "nvmlDeviceGetPersistenceMode"));
+  getNVMLPciInfo = reinterpret_cast<nvmlDeviceGetPciInfo_t>(dlsym(nvml_solib, "nvmlDeviceGetPciInfo_v3"));
+  getNVMLEccErrors = reinterpret_cast<nvmlDeviceGetTotalEccErrors_t>(dlsym(nvml_solib, "nvmlDeviceGetTotalEccErrors"));
+  getNVMLClocksEventReasons = reinterpret_cast<nvmlDeviceGetClocksEventReasons_t>(dlsym(nvml_solib, "nvmlDeviceGetCurrentClocksEventReasons"));
+  if (getNVMLClocksEventReasons == NULL) {
+     getNVMLClocksEventReasons = reinterpret_cast<nvmlDeviceGetClocksEventReasons_t>(dlsym(nvml_solib, "nvmlDeviceGetCurrentClocksThrottleReasons"));
+  }
+  getNVMLFieldValues = reinterpret_cast<nvmlDeviceGetFieldValues_t>(dlsym(nvml_solib, "nvmlDeviceGetFieldValues"));
 }
 
-NVML::~NVML() {}
+NVML::~NVML() {
+   if (initialized && nvmlShutdown != NULL) nvmlShutdown();
+   if (nvml_solib != NULL) dlclose(nvml_solib);
+}
 
 unsigned int NVML::getDeviceCount() const {
    unsigned int device_count{0};
+   if (!initialized) return 0;
    auto nv_status = getNVMLDeviceCount(&device_count);
    return device_count;
 }
@@ -86,6 +105,39 @@ unsigned int NVML::getFrequency (const unsigned int index, const nvmlDevice_t &d
    return value;
 }
 
+double NVML::getClock (const unsigned int index, const nvmlDevice_t &device_handle, unsigned int clock_type) const {
+   unsigned int value;
+   auto nv_status = getNVMLFrequency(device_handle, clock_type, NVML_CLOCK_ID_CURRENT, &value);
+   return nv_status == nvmlReturn_t::NVML_SUCCESS ? value : NAN;
+}
+
+// Uncorrected ECC errors since the driver has been loaded.
+double NVML::getEccErrors (const unsigned int index, const nvmlDevice_t &device_handle) const {
+   unsigned long long value;
+   if (getNVMLEccErrors == NULL) return NAN;
+   auto nv_status = getNVMLEccErrors(device_handle, NVML_MEMORY_ERROR_TYPE_UNCORRECTED, NVML_VOLATILE_ECC, &value);
+   return nv_status == nvmlReturn_t::NVML_SUCCESS ? value : NAN;
+}
+
+// Bit mask of the reasons why the clocks are reduced, see nvmlClocksEventReasons in nvml.h.
+double NVML::getThrottleReasons (const unsigned int index, const nvmlDevice_t &device_handle) const {
+   unsigned long long value;
+   if (getNVMLClocksEventReasons == NULL) return NAN;
+   auto nv_status = getNVMLClocksEventReasons(device_handle, &value);
+   return nv_status == nvmlReturn_t::NVML_SUCCESS ? value : NAN;
+}
+
+// Data sent or received over all NVLinks since the driver has been loaded, in KiB.
+double NVML::getNvLinkThroughput (const unsigned int index, const nvmlDevice_t &device_handle, unsigned int field_id) const {
+   if (getNVMLFieldValues == NULL) return NAN;
+   nvml_field_value_t field{};
+   field.fieldId = field_id;
+   field.scopeId = NVML_NVLINK_ALL_LINKS;
+   auto nv_status = getNVMLFieldValues(device_handle, 1, &field);
+   if (nv_status != nvmlReturn_t::NVML_SUCCESS || field.nvmlReturn != nvmlReturn_t::NVML_SUCCESS) return NAN;
+   return field.value.ullVal;
+}
+
 DEVICE_RETURN_T NVML::getNumCores (const unsigned int index, const nvmlDevice_t &device_handle) const {
    unsigned int value;
    if (getNVMLDeviceNumCores != NULL) {
@@ -125,29 +177,89 @@ void NVML::getMemoryInfo(const unsigned int index, const nvmlDevice_t &device_ha
    *used = memory.used;
 }
 
-void NVML::getProcessInfo (const unsigned int index, const nvmlDevice_t &device_handle, unsigned int *info_count, unsigned int *max_running_processes, int **proc_ids) const {
-   auto nv_status = getNVMLProcInfo (device_handle, info_count, NULL);
-   if (*info_count > 0) {
-     if (*max_running_processes == 0) {
-       *proc_ids = (int*) malloc (*info_count * sizeof(int*));
-       *max_running_processes = *info_count;
-     } else if (*info_count > *max_running_processes) {
-       *proc_ids = (int*) realloc (*proc_ids, *info_count * sizeof(int*));
-       *max_running_processes = *info_count;
-     } 
-     nvml_proc_info_t *proc_info = (nvml_proc_info_t*) malloc (*info_count * sizeof(nvml_proc_info_t));
-     nv_status = getNVMLProcInfo (device_handle, info_count, proc_info);
-     for (int i = 0; i < *info_count; i++) {
-        *proc_ids[i] = proc_info[i].computeInstanceId;
+// The compute processes on a device. The table can grow between the two calls,
+// in which case it is queried again.
+void NVML::queryProcesses (const nvmlDevice_t &device_handle, std::vector<nvml_proc_info_t> &infos) const {
+   infos.clear();
+   for (int attempt = 0; attempt < 3; attempt++) {
+     unsigned int info_count{0};
+     if (getNVMLProcInfo != NULL) {
+       auto nv_status = getNVMLProcInfo (device_handle, &info_count, NULL);
+       if (nv_status != nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE || info_count == 0) return;
+       infos.resize(info_count);
+       nv_status = getNVMLProcInfo (device_handle, &info_count, infos.data());
+       if (nv_status == nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE) continue;
+       infos.resize(nv_status == nvmlReturn_t::NVML_SUCCESS ? info_count : 0);
+       return;
+     } else if (getNVMLProcInfo_v1 != NULL) {
+       auto nv_status = getNVMLProcInfo_v1 (device_handle, &info_count, NULL);
+       if (nv_status != nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE || info_count == 0) return;
+       std::vector<nvml_proc_info_v1_t> infos_v1(info_count);
+       nv_status = getNVMLProcInfo_v1 (device_handle, &info_count, infos_v1.data());
+       if (nv_status == nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE) continue;
+       if (nv_status != nvmlReturn_t::NVML_SUCCESS) return;
+       for (unsigned int i = 0; i < info_count; i++) {
+          infos.push_back({infos_v1[i].pid, infos_v1[i].usedGpuMemory, 0, 0});
+       }
+       return;
+     } else {
+       return;
      }
-     free (proc_info);
+   }
+   infos.clear();
+}
+
+void NVML::getProcessInfo (const unsigned int index, const nvmlDevice_t &device_handle, unsigned int *info_count, unsigned int *max_running_processes, int **proc_ids) const {
+   std::vector<nvml_proc_info_t> infos;
+   queryProcesses (device_handle, infos);
+   *info_count = infos.size();
+   if (*info_count > *max_running_processes) {
+     *proc_ids = (int*) realloc (*proc_ids, *info_count * sizeof(int));
+     *max_running_processes = *info_count;
+   }
+   for (int i = 0; i < *info_count; i++) {
+      (*proc_ids)[i] = infos[i].pid;
    }
 }
 
-void NVML::getProcessName (unsigned int pid, char *name) {
-  auto nv_status = getNVMLProcName (pid, name, 1024);
+// Memory and SM utilization of all compute processes on a device. The utilization
+// is the latest sample after *last_seen (in us), which is advanced to the newest sample.
+// A process without a new sample has been idle and gets 0.
+void NVML::getProcessUsage (const unsigned int index, const nvmlDevice_t &device_handle,
+                            unsigned long long *last_seen, std::vector<process_usage_t> &usage) const {
+   std::vector<nvml_proc_info_t> infos;
+   queryProcesses (device_handle, infos);
+   usage.clear();
+   for (auto &info : infos) {
+      unsigned long long memory = info.usedGpuMemory == NVML_VALUE_NOT_AVAILABLE ? 0 : info.usedGpuMemory;
+      usage.push_back({info.pid, memory, -1});
+   }
+   if (getNVMLProcUtilization == NULL || usage.empty()) return;
+
+   unsigned int sample_count{0};
+   auto nv_status = getNVMLProcUtilization (device_handle, NULL, &sample_count, *last_seen);
+   if (nv_status == nvmlReturn_t::NVML_ERROR_NOT_SUPPORTED) return;
+   for (auto &u : usage) u.sm_util = 0;
+   if (nv_status != nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE || sample_count == 0) return;
+   std::vector<nvml_process_utilization_t> samples(sample_count);
+   nv_status = getNVMLProcUtilization (device_handle, samples.data(), &sample_count, *last_seen);
+   if (nv_status != nvmlReturn_t::NVML_SUCCESS) return;
+   std::vector<unsigned long long> sample_time(usage.size(), 0);
+   for (unsigned int i = 0; i < sample_count; i++) {
+      for (int j = 0; j < usage.size(); j++) {
+         if (usage[j].pid == samples[i].pid && samples[i].timeStamp >= sample_time[j]) {
+            usage[j].sm_util = samples[i].smUtil;
+            sample_time[j] = samples[i].timeStamp;
+         }
+      }
+      if (samples[i].timeStamp > *last_seen) *last_seen = samples[i].timeStamp;
+   }
+}
+
+void NVML::getProcessName (unsigned int pid, char *name, unsigned int length) const {
+  auto nv_status = getNVMLProcName (pid, name, length);
   if (nv_status != nvmlReturn_t::NVML_SUCCESS) {
-     name = "[unknown process]";
+     snprintf (name, length, "[unknown process]");
   }
 }
 
@@ -155,6 +267,17 @@ void NVML::getPersistenceMode (const unsigned int index, const nvmlDevice_t &dev
   auto nv_status = getNVMLPersistenceMode (device_handle, mode);
 }
 
+// PCI address in the format used by sysfs, e.g. 0000:3b:00.0, or an empty string.
+std::string NVML::getPciBusId (const unsigned int index, const nvmlDevice_t &device_handle) const {
+  nvml_pci_info_t pci;
+  if (getNVMLPciInfo == NULL) return std::string();
+  auto nv_status = getNVMLPciInfo (device_handle, &pci);
+  if (nv_status != nvmlReturn_t::NVML_SUCCESS) return std::string();
+  char bus_id[NVML_DEVICE_PCI_BUS_ID_BUFFER_SIZE];
+  snprintf (bus_id, NVML_DEVICE_PCI_BUS_ID_BUFFER_SIZE, "%04x:%02x:%02x.0", pci.domain, pci.bus, pci.device);
+  return std::string(bus_id);
+}
+
 NVMLDeviceManager::NVMLDeviceManager (const NVML &nvmlAPI):
    nvmlAPI(nvmlAPI)
 {
@@ -177,6 +300,22 @@ int NVMLDeviceManager::getFrequency(int index) {
   return nvmlAPI.getFrequency(index, device_handles[index]);
 }
 
+double NVMLDeviceManager::getClock(int index, unsigned int clock_type) {
+  return nvmlAPI.getClock(index, device_handles[index], clock_type);
+}
+
+double NVMLDeviceManager::getEccErrors(int index) {
+  return nvmlAPI.getEccErrors(index, device_handles[index]);
+}
+
+double NVMLDeviceManager::getThrottleReasons(int index) {
+  return nvmlAPI.getThrottleReasons(index, device_handles[index]);
+}
+
+double NVMLDeviceManager::getNvLinkThroughput(int index, unsigned int field_id) {
+  return nvmlAPI.getNvLinkThroughput(index, device_handles[index], field_id);
+}
+
 std::string NVMLDeviceManager::getName(int index) {
    return nvmlAPI.getDeviceName(index, device_handles[index]);
 }
@@ -206,6 +345,14 @@ void NVMLDeviceManager::getProcessInfo(int index, unsigned int *n_procs, unsigne
   nvmlAPI.getProcessInfo (index, device_handles[index], n_procs, max_running_processes, proc_ids);
 } 
 
+void NVMLDeviceManager::getProcessUsage(int index, unsigned long long *last_seen, std::vector<process_usage_t> &usage) {
+  nvmlAPI.getProcessUsage (index, device_handles[index], last_seen, usage);
+}
+
 void NVMLDeviceManager::getPersistenceMode(int index, unsigned int *mode) {
   nvmlAPI.getPersistenceMode (index, device_handles[index], mode);
 }
+
+std::string NVMLDeviceManager::getPciBusId(int index) {
+  return nvmlAPI.getPciBusId (index, device_handles[index]);
+}
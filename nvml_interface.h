@@ -8,9 +8,12 @@ constexpr auto NVML_LIB_NAME{"libnvidia-ml.so"};
 
 constexpr unsigned int NVML_DEVICE_NAME_BUFFER_SIZE{64};
 constexpr unsigned int NVML_DEVICE_SERIAL_BUFFER_SIZE{30};
+constexpr unsigned int NVML_DEVICE_PCI_BUS_ID_BUFFER_SIZE{32};
+constexpr unsigned int NVML_DEVICE_PCI_BUS_ID_BUFFER_V2_SIZE{16};
 
 constexpr unsigned int NVML_SYSTEM_DRIVER_VERSION_BUFFER_SIZE{80};
 constexpr unsigned int NVML_SYSTEM_NVML_VERSION_BUFFER_SIZE{80};
+constexpr unsigned int NVML_SYSTEM_PROCESS_NAME_BUFFER_SIZE{1024};
 
 constexpr unsigned int NVML_PERSISTENCE_DISABLED{0};
 constexpr unsigned int NVML_PERSISTENCE_ENABLED{1};
@@ -50,8 +53,16 @@ enum class nvmlReturn_t {
 
 constexpr unsigned int NVML_TEMPERATURE_GPU{0};
 constexpr unsigned int NVML_CLOCK_TYPE_GRAPHICS{0};
+constexpr unsigned int NVML_CLOCK_TYPE_SM{1};
+constexpr unsigned int NVML_CLOCK_TYPE_MEM{2};
 constexpr unsigned int NVML_CLOCK_ID_CURRENT{0};
 constexpr unsigned int NVML_PCIE_UTIL_TX_BYTES{0};
+constexpr unsigned int NVML_MEMORY_ERROR_TYPE_UNCORRECTED{1};
+constexpr unsigned int NVML_VOLATILE_ECC{0};
+constexpr unsigned int NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_TX{138};
+constexpr unsigned int NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_RX{139};
+// scopeId of a field value which sums up all NVLinks.
+constexpr unsigned int NVML_NVLINK_ALL_LINKS{0xFFFFFFFF};
 
 typedef struct nvmlDevice_st* nvmlDevice_t;
 
@@ -67,13 +78,67 @@ typedef struct {
 } nvml_memory_t;
 
 typedef struct {
-  unsigned int computeInstanceId;
-  unsigned int gpuInstanceId;
   unsigned int pid;
   unsigned long long usedGpuMemory;
+  unsigned int gpuInstanceId;
+  unsigned int computeInstanceId;
 } nvml_proc_info_t;
 
+// Returned by nvmlDeviceGetComputeRunningProcesses without version suffix.
+typedef struct {
+  unsigned int pid;
+  unsigned long long usedGpuMemory;
+} nvml_proc_info_v1_t;
+
+constexpr unsigned long long NVML_VALUE_NOT_AVAILABLE{~0ULL};
+
+typedef struct {
+  unsigned int pid;
+  unsigned long long timeStamp;
+  unsigned int smUtil;
+  unsigned int memUtil;
+  unsigned int encUtil;
+  unsigned int decUtil;
+} nvml_process_utilization_t;
+
+typedef union {
+  double dVal;
+  unsigned int uiVal;
+  unsigned long ulVal;
+  unsigned long long ullVal;
+  signed long long sllVal;
+} nvml_value_t;
+
+typedef struct {
+  unsigned int fieldId;
+  unsigned int scopeId;
+  long long timestamp;
+  long long latencyUsec;
+  int valueType;
+  nvmlReturn_t nvmlReturn;
+  nvml_value_t value;
+} nvml_field_value_t;
+
+// Memory in bytes and SM utilization in % of a process on one device.
+// sm_util is -1 if the driver does not report it.
+typedef struct {
+  unsigned int pid;
+  unsigned long long used_memory;
+  int sm_util;
+} process_usage_t;
+
+typedef struct {
+  char busIdLegacy[NVML_DEVICE_PCI_BUS_ID_BUFFER_V2_SIZE];
+  unsigned int domain;
+  unsigned int bus;
+  unsigned int device;
+  unsigned int pciDeviceId;
+  unsigned int pciSubSystemId;
+  char busId[NVML_DEVICE_PCI_BUS_ID_BUFFER_SIZE];
+} nvml_pci_info_t;
+
 typedef nvmlReturn_t (*nvmlInit_t)(void);
+typedef nvmlReturn_t (*nvmlShutdown_t)(void);
 typedef nvmlReturn_t (*nvmlSystemGetDriverVersion_t)(char *version, unsigned int length);
 typedef nvmlReturn_t (*nvmlSystemGetNVMLVersion_t)(char *version, unsigned int length);
 typedef nvmlReturn_t (*nvmlSystemGetProcessName_t) (unsigned int pid, char *name, unsigned int length);
@@ -88,7 +153,15 @@ typedef nvmlReturn_t (*nvmlDeviceGetPowerUsage_t)(nvmlDevice_t device, unsigned
 typedef nvmlReturn_t (*nvmlDeviceGetUtilizationRates_t)(nvmlDevice_t device, nvml_utilization_t *utilization);
 typedef nvmlReturn_t (*nvmlDeviceGetMemoryInfo_t)(nvmlDevice_t device, nvml_memory_t *memory);
 typedef nvmlReturn_t (*nvmlDeviceGetProcInfo_t)(nvmlDevice_t device, unsigned int *info_count, nvml_proc_info_t *infos);
+typedef nvmlReturn_t (*nvmlDeviceGetProcInfo_v1_t)(nvmlDevice_t device, unsigned int *info_count, nvml_proc_info_v1_t *infos);
+typedef nvmlReturn_t (*nvmlDeviceGetProcessUtilization_t)(nvmlDevice_t device, nvml_process_utilization_t *utilization,
+                                                          unsigned int *sample_count, unsigned long long last_seen);
 typedef nvmlReturn_t (*nvmlDeviceGetPersistenceMode_t)(nvmlDevice_t device, unsigned int *mode);
+typedef nvmlReturn_t (*nvmlDeviceGetPciInfo_t)(nvmlDevice_t device, nvml_pci_info_t *pci);
+typedef nvmlReturn_t (*nvmlDeviceGetTotalEccErrors_t)(nvmlDevice_t device, unsigned int error_type,
+                                                      unsigned int counter_type, unsigned long long *count);
+typedef nvmlReturn_t (*nvmlDeviceGetClocksEventReasons_t)(nvmlDevice_t device, unsigned long long *reasons);
+typedef nvmlReturn_t (*nvmlDeviceGetFieldValues_t)(nvmlDevice_t device, int count, nvml_field_value_t *values);
 
 class NVML {
    public:
@@ -97,6 +170,11 @@ class NVML {
       
       unsigned int getTemperature(const unsigned int index, const nvmlDevice_t &device_handle) const;
       unsigned int getFrequency(const unsigned int index, const nvmlDevice_t &device_handle) const;
+      // The getters below return NAN if the device or the driver does not support them.
+      double getClock(const unsigned int index, const nvmlDevice_t &device_handle, unsigned int clock_type) const;
+      double getEccErrors(const unsigned int index, const nvmlDevice_t &device_handle) const;
+      double getThrottleReasons(const unsigned int index, const nvmlDevice_t &device_handle) const;
+      double getNvLinkThroughput(const unsigned int index, const nvmlDevice_t &device_handle, unsigned int field_id) const;
       unsigned int getDeviceCount() const;
       DEVICE_RETURN_T getNumCores(const unsigned int index, const nvmlDevice_t &device_handle) const;
       unsigned int getPcieRate(const unsigned int index, const nvmlDevice_t &device_handle) const;
@@ -108,12 +186,17 @@ class NVML {
       void getMemoryInfo(const unsigned int index, const nvmlDevice_t &device_handle,
                          unsigned long long *free, unsigned long long *total, unsigned long long *used) const;
       void getProcessInfo (const unsigned int index, const nvmlDevice_t &device_handle, unsigned int *n_procs, unsigned int *max_running_processes, int **proc_infos) const;
-      void getProcessName (unsigned int pid, char *name);
+      void getProcessUsage (const unsigned int index, const nvmlDevice_t &device_handle,
+                            unsigned long long *last_seen, std::vector<process_usage_t> &usage) const;
+      void getProcessName (unsigned int pid, char *name, unsigned int length) const;
       void getPersistenceMode (const unsigned int index, const nvmlDevice_t &device_handle, unsigned int *mode) const;
+      std::string getPciBusId (const unsigned int index, const nvmlDevice_t &device_handle) const;
    private:
-      solib_handle_t nvml_solib;
+      solib_handle_t nvml_solib{NULL};
+      bool initialized{false};
       
       nvmlInit_t nvmlInit{NULL};
+      nvmlShutdown_t nvmlShutdown{NULL};
       nvmlSystemGetDriverVersion_t getDriverVersion{NULL};
       nvmlSystemGetNVMLVersion_t getNVMLVersion{NULL};
       nvmlSystemGetProcessName_t getNVMLProcName{NULL};
@@ -128,8 +211,15 @@ class NVML {
       nvmlDeviceGetUtilizationRates_t getNVMLDeviceUtilization{NULL};
       nvmlDeviceGetMemoryInfo_t getNVMLMemoryInfo{NULL};
       nvmlDeviceGetProcInfo_t getNVMLProcInfo{NULL};
+      nvmlDeviceGetProcInfo_v1_t getNVMLProcInfo_v1{NULL};
+      nvmlDeviceGetProcessUtilization_t getNVMLProcUtilization{NULL};
       nvmlDeviceGetPersistenceMode_t getNVMLPersistenceMode{NULL};
+      nvmlDeviceGetPciInfo_t getNVMLPciInfo{NULL};
+      nvmlDeviceGetTotalEccErrors_t getNVMLEccErrors{NULL};
+      nvmlDeviceGetClocksEventReasons_t getNVMLClocksEventReasons{NULL};
+      nvmlDeviceGetFieldValues_t getNVMLFieldValues{NULL};
       void bind_functions();
+      void queryProcesses (const nvmlDevice_t &device_handle, std::vector<nvml_proc_info_t> &infos) const;
       
 };
 
@@ -142,6 +232,10 @@ class NVMLDeviceManager {
       int num_devices;
       int getTemperature(int index = 0);
       int getFrequency(int index = 0);
+      double getClock(int index, unsigned int clock_type);
+      double getEccErrors(int index = 0);
+      double getThrottleReasons(int index = 0);
+      double getNvLinkThroughput(int index, unsigned int field_id);
       std::string getName(int index = 0);
       DEVICE_RETURN_T getNumCores(int index = 0);
       int getPcieRate(int index = 0);
@@ -150,7 +244,9 @@ class NVMLDeviceManager {
       void getMemoryInfo(int index, unsigned long long *free,
                          unsigned long long *total, unsigned long long *used);
       void getProcessInfo(int index, unsigned int *n_procs, unsigned int *max_running_processes, int **proc_ids);
+      void getProcessUsage(int index, unsigned long long *last_seen, std::vector<process_usage_t> &usage);
       void getPersistenceMode(int index, unsigned int *mode);
+      std::string getPciBusId(int index = 0);
    private: 
       const NVML &nvmlAPI;
       std::vector<nvmlDevice_t> device_handles;
@@ -7,11 +7,14 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <stdbool.h>
+#include <unistd.h>
 #include <cupti.h>
 #include <cuda.h>
 #include <openacc.h>
 #include <mpi.h>
 
+#include "event_table.h"
+
 // helper macros
 
 #define CUPTI_CALL(call)                                                \
@@ -32,66 +35,29 @@
   (((uintptr_t) (buffer) & ((align)-1)) ? ((buffer) + (align) - ((uintptr_t) (buffer) & ((align)-1))) : (buffer))
 
 
-typedef struct event_list_st {
-  int kind;
-  int n_calls;
-  uint64_t total_duration;
-  const char *kernelName;
-  const char *srcFile;
-  const char *funcName;
-  int line_start;
-  int line_end;
-  int func_line_start;
-  int func_line_end;
-  uint64_t total_bytes;
-  event_list_st *next;
-} event_list_t;
-
-static event_list_t *event_list;
+static event_table_t event_table;
 int callback_counter;
 int mpi_rank;
 
-int count_registered_events (int kind) {
-  int n = 0;
-  printf ("event list exists? %d\n", event_list != NULL);
-  event_list_t *ev = event_list;
-  do {
-     if (ev->kind == kind) n++;
-     ev = ev->next;
-  } while (ev != NULL);
-  return n;
-}
-
 int compare_event_duration (const void *p1, const void *p2) {
-   event_list_t *e1 = *(event_list_t **)p1;
-   event_list_t *e2 = *(event_list_t **)p2;
-   if (!e1) return -1;
-   if (!e2) return 1;
-   uint64_t t1 = e1->total_duration;
-   uint64_t t2 = e2->total_duration;
-   int64_t diff = t2 - t1;
-   if (diff > 0) return  1;
-   if (diff < 0) return -1;
+   const event_t *e1 = *(const event_t **)p1;
+   const event_t *e2 = *(const event_t **)p2;
+   if (e1->total_duration < e2->total_duration) return 1;
+   if (e1->total_duration > e2->total_duration) return -1;
    return 0;
 }
 
 void print_event_list (bool sort_by_duration, int kind) {
-   int n_events = count_registered_events(kind);
-   event_list_t **ev_array = (event_list_t**)malloc(n_events * sizeof(event_list_t*));
-   event_list_t *ev = event_list;
-
-   int ii = 0;
-   while (ev != NULL) {
-     if (ev->kind == kind) {
-        ev_array[ii] = (event_list_t*) malloc (sizeof(event_list_t));
-        memcpy (ev_array[ii], ev, sizeof(event_list_t));
-        ii++;
-     }
-     ev = ev->next; 
+   int n_events = event_table_count(&event_table, kind);
+   const event_t **ev_array = (const event_t**)malloc(n_events * sizeof(event_t*));
+   if (n_events > 0 && ev_array == NULL) {
+      printf ("Error: out of memory\n");
+      return;
    }
+   event_table_collect (&event_table, kind, ev_array);
 
    if (sort_by_duration) {
-      qsort ((void*)ev_array, (size_t)n_events, sizeof(event_list_t*), compare_event_duration);
+      qsort ((void*)ev_array, (size_t)n_events, sizeof(event_t*), compare_event_duration);
    }
 
    long long total_summed_time = 0;
@@ -109,39 +75,22 @@ void print_event_list (bool sort_by_duration, int kind) {
    
    for (int i = 0; i < n_events; i++) { 
       printf ("Nr. %d\n", i);
-      //printf ("kind: %d\n", ev_array[i]->kind);
       printf ("n_calls: %d\n", ev_array[i]->n_calls);
       long long t = ev_array[i]->total_duration;
-      printf ("accumulated time: %lld ms (%.2lf%%)\n", ev_array[i]->total_duration, (double)t / total_summed_time * 100);
+      printf ("accumulated time: %lld ms (%.2lf%%)\n", t, (double)t / total_summed_time * 100);
       printf ("kernel: %s\n", ev_array[i]->kernelName);
       printf ("source file: %s\n", ev_array[i]->srcFile);
       printf ("function: %s\n", ev_array[i]->funcName);
       printf ("lines: %d - %d\n", ev_array[i]->line_start, ev_array[i]->line_end);
       printf ("function lines: %d - %d\n", ev_array[i]->func_line_start, ev_array[i]->func_line_end);
       if (ev_array[i]->kind == CUPTI_ACTIVITY_KIND_OPENACC_DATA) 
-         printf ("bytes transferred: %lld\n", ev_array[i]->total_bytes);
+         printf ("bytes transferred: %llu\n", (unsigned long long)ev_array[i]->total_bytes);
       printf ("**********************************\n");
    }
 
    free (ev_array);
 }
 
-bool event_matches (event_list_t *ev, int kind, const char *srcFile, const char *funcName,
-                    const char *kernelName, int line_start, int line_end,
-                    int func_line_start, int func_line_end) {
-   bool match = ev->kind == kind;
-   match &= !strcmp(ev->srcFile, srcFile);
-   match &= !strcmp(ev->funcName, funcName);
-   if (kernelName != NULL && ev->kernelName != NULL) {
-      match &= !strcmp(ev->kernelName, kernelName);
-   }
-   match &= ev->line_start == line_start;
-   match &= ev->line_end == line_end;
-   match &= ev->func_line_start == func_line_start;
-   match &= ev->func_line_end == func_line_end;
-   return match;
-}
-
 void register_event (CUpti_Activity *record) {
    int kind = record->kind;
    uint64_t start, end;
@@ -150,7 +99,7 @@ void register_event (CUpti_Activity *record) {
    const char *funcName;
    int line_start, line_end;
    int func_line_start, func_line_end;
-   uint64_t bytes;
+   uint64_t bytes = 0;
    callback_counter++;
    if (kind == CUPTI_ACTIVITY_KIND_OPENACC_LAUNCH) {
       CUpti_ActivityOpenAccLaunch *r = (CUpti_ActivityOpenAccLaunch*)record;
@@ -191,59 +140,11 @@ void register_event (CUpti_Activity *record) {
       // Unknown event type
       return;
    }
-   if (event_list == NULL) {
-      event_list = (event_list_t*) malloc (sizeof(event_list_t));
-      event_list->kind = kind;
-      event_list->n_calls = 1;
-      event_list->total_duration = end - start;
-      if (kernelName != NULL) {
-         event_list->kernelName = kernelName;
-      } else {
-         event_list->kernelName = NULL;
-      }
-      if (kind == CUPTI_ACTIVITY_KIND_OPENACC_DATA) {
-         event_list->total_bytes = bytes;
-      } else {
-         event_list->total_bytes = 0;
-      }
-      event_list->srcFile = srcFile;
-      event_list->funcName = funcName;
-      event_list->line_start = line_start;
-      event_list->line_end = line_end;
-      event_list->func_line_start = func_line_start;
-      event_list->func_line_end = func_line_end;
-      event_list->next = NULL;
+   // The names are copied into the table, since they are not guaranteed to outlive the buffer.
+   if (!event_table_add (&event_table, kind, kernelName, srcFile, funcName, line_start, line_end,
+                         func_line_start, func_line_end, end - start, bytes)) {
+      printf ("Error: out of memory, dropped an OpenACC event\n");
    }
-      event_list_t *ev = event_list;
-      while (ev->next != NULL && !event_matches (ev, kind, srcFile, funcName, kernelName, line_start, line_end, func_line_start, func_line_end)) {
-         ev = ev->next; 
-      }
-      if (ev->next == NULL) { // Event not registered
-         ev->next = (event_list_t*) malloc (sizeof(event_list_t));
-         ev = ev->next;
-         ev->kind = kind;
-         if (kind == CUPTI_ACTIVITY_KIND_OPENACC_LAUNCH) printf ("Set n_calls = 1: %s\n", funcName);
-         ev->n_calls = 1;
-         ev->total_duration = end - start;
-         if (kernelName != NULL) {
-            ev->kernelName = kernelName;
-         } else {
-            ev->kernelName = NULL;
-         }
-         if (kind == CUPTI_ACTIVITY_KIND_OPENACC_DATA) {
-            ev->total_bytes += bytes;
-         }
-         ev->srcFile = srcFile;
-         ev->funcName = funcName;
-         ev->line_start = line_start;
-         ev->line_end = line_end;
-         ev->func_line_start = func_line_start;
-         ev->func_line_end = func_line_end;
-         ev->next = NULL;
-      } else { // Event matches
-         ev->n_calls++;
-         ev->total_duration += end - start;
-      }
 }
 
 
@@ -359,9 +260,25 @@ void CUPTIAPI bufferCompleted(CUcontext ctx, uint32_t streamId, uint8_t *buffer,
   free(buffer);
 }
 
+// Every rank writes its events to <prefix>.<rank>.accprof, where the prefix is taken from
+// ACC_PROFILE_PREFIX (default openacc_profile). Merge them with acc_profile.py.
+void write_profile() {
+  const char *prefix = getenv("ACC_PROFILE_PREFIX");
+  if (prefix == NULL || prefix[0] == '\0') prefix = "openacc_profile";
+  char filename[4096];
+  snprintf (filename, sizeof(filename), "%s.%d.accprof", prefix, mpi_rank);
+  char host[256] = "";
+  gethostname (host, sizeof(host) - 1);
+  if (!event_table_write_profile (&event_table, filename, mpi_rank, host, CUPTI_ACTIVITY_KIND_OPENACC_DATA,
+                                  CUPTI_ACTIVITY_KIND_OPENACC_LAUNCH, CUPTI_ACTIVITY_KIND_OPENACC_OTHER)) {
+     fprintf (stderr, "Error: could not write the OpenACC profile %s\n", filename);
+  }
+}
+
 void finalize() {
   cuptiActivityFlushAll(0);
   printf ("Finalize CUPTI\n");
+  write_profile();
   if (mpi_rank == 0) {
       printf ("KERNEL EVENTS: \n");
       print_event_list(true, CUPTI_ACTIVITY_KIND_OPENACC_LAUNCH);
@@ -370,6 +287,7 @@ void finalize() {
       printf ("DATA EVENTS: \n");
       print_event_list(true, CUPTI_ACTIVITY_KIND_OPENACC_DATA);
   }
+  event_table_free(&event_table);
 }
 
 // acc_register_library is defined by the OpenACC tools interface
@@ -385,7 +303,7 @@ acc_register_library(void *profRegister, void *profUnregister, void *profLookup)
   }
 
   printf("Initialized CUPTI OpenACC\n");
-  event_list = NULL;
+  event_table_init(&event_table);
   callback_counter = 0;
 
   MPI_Comm_rank (MPI_COMM_WORLD, &mpi_rank);
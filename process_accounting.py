@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+import sample_store
+
+PROCESS_KEYS = ["PID", "Memory", "SM-Util"]
+# PID of the slot which sums up the processes which did not get a slot of their own.
+OTHER_PID = -1
+
+class processAccounting():
+  # Memory (MiB) and SM utilization (%) of the compute processes on each GPU over time.
+  # Every GPU has n_slots slots, and a process keeps its slot from the sample in which
+  # it appears until the one in which it has exited, when the slot is freed for the next
+  # process. Each row stores the PID of every slot next to its values (PID 0 for a free
+  # slot), so the series of a process ends with it and needs no bookkeeping by the reader.
+  # The rows are kept in a multiProcState with one "GPU" per (GPU, slot). The last slot
+  # of each GPU holds the sum of the processes which did not fit, with the PID OTHER_PID.
+  # The process tables change slowly, so they are read every period seconds.
+  def __init__(self, device, num_gpus, buffer_size, start_time=None, n_slots=16, period=1.0):
+    self.device = device
+    self.period = period
+    self.num_gpus = num_gpus
+    self.n_slots = n_slots
+    self.store = sample_store.multiProcState(PROCESS_KEYS, buffer_size, num_gpus * n_slots, start_time)
+    # PID -> slot on each GPU. This is only used by the writing process.
+    self.slots = [{} for _ in range(num_gpus)]
+    self.row = np.zeros((num_gpus, n_slots, len(PROCESS_KEYS)))
+
+  def sample(self, t):
+    # t is the time of the sample in the clock of the writer, like in multiProcState.put_row.
+    self.row.fill(0)
+    for gpu_id in range(self.num_gpus):
+      self.add_processes(gpu_id, self.device.getProcessUsage(gpu_id))
+    self.store.put_row(t, self.row.reshape(self.num_gpus * self.n_slots, len(PROCESS_KEYS)))
+
+  def add_processes(self, gpu_id, usage):
+    slots = self.slots[gpu_id]
+    running = set(pid for pid, memory, sm_util in usage)
+    for pid in [pid for pid in slots if pid not in running]:
+      del slots[pid]
+    free_slots = sorted(set(range(self.n_slots - 1)) - set(slots.values()), reverse=True)
+    row = self.row[gpu_id]
+    for pid, memory, sm_util in usage:
+      if pid not in slots and free_slots:
+        slots[pid] = free_slots.pop()
+      slot = slots.get(pid, self.n_slots - 1)
+      row[slot, 0] = pid if slot != self.n_slots - 1 else OTHER_PID
+      row[slot, 1] += memory / (1 << 20)
+      row[slot, 2] += max(sm_util, 0)
+
+  def reset(self):
+    self.store.reset()
+
+  def get_since(self, first):
+    # Like multiProcState.get_since, with the values as (time x GPU x slot x key).
+    t, values, _, n_written = self.store.get_since(first)
+    return t, values.reshape(len(t), self.num_gpus, self.n_slots, len(PROCESS_KEYS)), n_written
+
+def process_series(values, gpu_id, key):
+  # The PIDs which appear on a GPU, ordered by their first appearance, and the values
+  # of the key for each of them as (time x PID), with 0 while a process is not running.
+  pids = values[:, gpu_id, :, 0]
+  y = values[:, gpu_id, :, PROCESS_KEYS.index(key)]
+  rows, slots = np.nonzero(pids)
+  first_seen = {}
+  for pid in pids[rows, slots]:
+    first_seen.setdefault(int(pid), len(first_seen))
+  series = np.zeros((len(values), len(first_seen)))
+  columns = np.array([first_seen[int(pid)] for pid in pids[rows, slots]], dtype=np.int64)
+  np.add.at(series, (rows, columns), y[rows, slots])
+  return list(first_seen), series
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+# Compact encoding of blocks of sample rows, as they come out of multiProcState.get_since:
+# timestamps (time), values (time x GPU x key) and host values (time x host key).
+# Most values change little or not at all between samples, so each column is stored
+# as its changes from one row to the next:
+#   - the timestamps, in microseconds, as the difference of consecutive intervals
+#     (delta-of-delta), which is 0 for a regular sampler,
+#   - columns with only integral values (temperature, clocks, MiB, ...) as the
+#     differences of consecutive values,
+#   - all other columns as the XOR of the bits of consecutive float64 values, which is
+#     0 for an unchanged value.
+# The integers are zigzag-encoded varints, the XOR words are stored byte-wise by
+# significance, and the whole block is compressed with zlib.
+# The values are restored exactly; the timestamps are rounded to microseconds.
+#
+# Block: header (magic, n rows, GPUs, keys, host keys, compressed length), followed by
+# the zlib stream of: first timestamp (float64), kind of each column (uint8), length of
+# the varints (uint32), the varints (timestamps, then the integral columns) and the XOR
+# words of the other columns. Columns are ordered by GPU and key, then the host keys.
+
+import struct
+import zlib
+
+import numpy as np
+
+BLOCK_MAGIC = b"MGSB"
+BLOCK_HEADER = struct.Struct("<4sIHHHI")
+BODY_HEADER = struct.Struct("<d")
+
+INTEGRAL_COLUMN = 0
+XOR_COLUMN = 1
+
+# Integers up to this size are exactly representable as float64.
+MAX_INTEGRAL = 1 << 53
+
+def zigzag(x):
+  x = x.astype(np.int64)
+  return ((x << 1) ^ (x >> 63)).view(np.uint64)
+
+def unzigzag(u):
+  return ((u >> np.uint64(1)).view(np.int64) ^ -(u & np.uint64(1)).view(np.int64))
+
+def encode_varints(u):
+  # LEB128: 7 bits per byte, starting with the lowest ones, the high bit marks a continuation.
+  u = np.ascontiguousarray(u, dtype=np.uint64)
+  shifts = np.arange(0, 70, 7, dtype=np.uint64)
+  groups = (u[:, None] >> shifts[None, :]) & np.uint64(0x7f)
+  n_bytes = np.ones(len(u), dtype=np.int64)
+  for i in range(1, len(shifts)):
+    n_bytes += (u >> shifts[i]) != 0
+  used = np.arange(len(shifts))[None, :] < n_bytes[:, None]
+  more = np.arange(len(shifts))[None, :] < (n_bytes - 1)[:, None]
+  return (groups.astype(np.uint8) | (more.astype(np.uint8) << 7))[used].tobytes()
+
+def decode_varints(buffer, count):
+  b = np.frombuffer(buffer, dtype=np.uint8)
+  last = (b & 0x80) == 0
+  if np.count_nonzero(last) != count:
+    raise ValueError("Expected %d varints, found %d" % (count, np.count_nonzero(last)))
+  if count == 0:
+    return np.zeros(0, dtype=np.uint64)
+  starts = np.concatenate(([0], np.flatnonzero(last)[:-1] + 1))
+  position = np.arange(len(b)) - np.repeat(starts, np.diff(np.append(starts, len(b))))
+  if position.max() >= 10:
+    raise ValueError("Varint longer than 64 bits")
+  shifted = (b & 0x7f).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+  return np.add.reduceat(shifted, starts)
+
+def integral_columns(columns):
+  # The columns in which all values are integral floats which survive int64 and back.
+  finite = np.isfinite(columns).all(axis=0)
+  with np.errstate(invalid="ignore"):
+    integral = (finite & (np.abs(columns) < MAX_INTEGRAL).all(axis=0)
+                & (np.floor(columns) == columns).all(axis=0))
+  # -0.0 would come back as 0.0.
+  return integral & ~((columns == 0) & np.signbit(columns)).any(axis=0)
+
+def encode_block(t, values, host_values):
+  n, num_gpus, n_keys = values.shape
+  n_host = host_values.shape[1]
+  columns = np.concatenate((np.asarray(values, dtype=np.float64).reshape(n, num_gpus * n_keys),
+                            np.asarray(host_values, dtype=np.float64).reshape(n, n_host)), axis=1)
+  kinds = np.where(integral_columns(columns), INTEGRAL_COLUMN, XOR_COLUMN).astype(np.uint8)
+  t = np.asarray(t, dtype=np.float64)
+  t0 = t[0] if n > 0 else 0.0
+  t_us = np.rint((t - t0) * 1e6).astype(np.int64)
+  dod = np.diff(t_us, n=1, prepend=0)
+  dod = np.diff(dod, n=1, prepend=0)
+  integral = columns[:, kinds == INTEGRAL_COLUMN].astype(np.int64)
+  deltas = np.diff(integral, axis=0, prepend=0)
+  varints = encode_varints(np.concatenate((zigzag(dod), zigzag(deltas.T.ravel()))))
+  bits = np.ascontiguousarray(columns[:, kinds == XOR_COLUMN].T).view(np.uint64)
+  xor = bits ^ np.concatenate((np.zeros((len(bits), 1), dtype=np.uint64), bits[:, :-1]), axis=1)
+  # Byte planes from the most significant byte down, so that the zero bytes of small changes are adjacent.
+  planes = xor.ravel().astype("<u8").view(np.uint8).reshape(-1, 8)[:, ::-1].T
+  body = zlib.compress(BODY_HEADER.pack(t0) + kinds.tobytes() + struct.pack("<I", len(varints))
+                       + varints + np.ascontiguousarray(planes).tobytes())
+  return BLOCK_HEADER.pack(BLOCK_MAGIC, n, num_gpus, n_keys, n_host, len(body)) + body
+
+def block_size(buffer):
+  # Total size of the block at the start of buffer.
+  return BLOCK_HEADER.size + BLOCK_HEADER.unpack_from(buffer)[5]
+
+def decode_block(buffer):
+  magic, n, num_gpus, n_keys, n_host, body_size = BLOCK_HEADER.unpack_from(buffer)
+  if magic != BLOCK_MAGIC:
+    raise ValueError("Not a sample block")
+  try:
+    body = zlib.decompress(bytes(buffer[BLOCK_HEADER.size:BLOCK_HEADER.size + body_size]))
+  except zlib.error as error:
+    raise ValueError("Corrupt sample block: %s" % error)
+  n_columns = num_gpus * n_keys + n_host
+  t0, = BODY_HEADER.unpack_from(body)
+  offset = BODY_HEADER.size
+  kinds = np.frombuffer(body, dtype=np.uint8, count=n_columns, offset=offset)
+  offset += n_columns
+  varint_size, = struct.unpack_from("<I", body, offset)
+  offset += 4
+  is_integral = kinds == INTEGRAL_COLUMN
+  n_integral = int(np.count_nonzero(is_integral))
+  ints = unzigzag(decode_varints(body[offset:offset + varint_size], n + n * n_integral))
+  offset += varint_size
+  t_us = np.cumsum(np.cumsum(ints[:n]))
+  columns = np.empty((n, n_columns))
+  columns[:, is_integral] = np.cumsum(ints[n:].reshape(n_integral, n), axis=1).T
+  n_xor = n_columns - n_integral
+  planes = np.frombuffer(body, dtype=np.uint8, count=8 * n * n_xor, offset=offset).reshape(8, n * n_xor)
+  xor = np.ascontiguousarray(planes[::-1].T).view("<u8").reshape(n_xor, n)
+  columns[:, ~is_integral] = np.bitwise_xor.accumulate(xor, axis=1).view(np.float64).T
+  t = t0 + t_us / 1e6
+  return (t, columns[:, :num_gpus * n_keys].reshape(n, num_gpus, n_keys),
+          columns[:, num_gpus * n_keys:])
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import numpy as np
+
+import metrics
+import scheduler
+
+class multiProcState():
+  # Shared sample store for all GPUs and keys. Each row holds the values of one
+  # readout (time x GPU x key) plus its timestamp in seconds since the last reset.
+  # The values of the host_keys belong to the host and are stored once per row,
+  # not per GPU, in host_values (time x host key).
+  # The rows form a ring buffer in shared memory. Every row is stored twice, at
+  # i and i + buffer_size, so that the latest rows are always contiguous and can
+  # be handed out as views without copying. There is only one writer (the readout
+  # process), which publishes a row by incrementing n_written after storing it.
+  def __init__(self, keys, buffer_size, num_gpus=1, start_time=None, host_keys=()):
+    self.num_gpus = num_gpus
+    self.keys = {}
+    for i, key in enumerate(keys):
+       self.keys[key] = i
+    self.host_keys = {}
+    for i, key in enumerate(host_keys):
+       self.host_keys[key] = i
+    self.size = buffer_size
+    self.values = shared_array((2 * buffer_size, num_gpus, len(keys)))
+    self.host_values = shared_array((2 * buffer_size, len(host_keys)))
+    self.timestamps = shared_array((2 * buffer_size,))
+    # Total number of rows written / flushed since the last reset.
+    self.n_written = multiprocessing.RawValue('Q', 0)
+    self.n_read = multiprocessing.RawValue('Q', 0)
+    # Time of the first row after a reset, in the clock used by the writer. A store
+    # which shares the time axis of another one gets its start_time and leaves it alone.
+    self.owns_start_time = start_time is None
+    self.start_time = multiprocessing.RawValue('d', 0) if start_time is None else start_time
+
+  def put_row(self, t, values, host_values=None):
+    n = self.n_written.value
+    if n == 0 and self.owns_start_time:
+      self.start_time.value = t
+    i = n % self.size
+    self.timestamps[i] = self.timestamps[i + self.size] = t - self.start_time.value
+    self.values[i] = self.values[i + self.size] = values
+    if host_values is not None:
+      self.host_values[i] = self.host_values[i + self.size] = host_values
+    self.n_written.value = n + 1
+
+  def put_rows(self, t, values, host_values=None):
+    # Same as put_row for a block of rows.
+    n = self.n_written.value
+    n_new = len(t)
+    if n_new == 0: return
+    if n == 0 and self.owns_start_time:
+      self.start_time.value = t[0]
+    # Only the last self.size rows of the block are kept.
+    first = max(0, n_new - self.size)
+    i = (n + np.arange(first, n_new)) % self.size
+    self.timestamps[i] = self.timestamps[i + self.size] = t[first:] - self.start_time.value
+    self.values[i] = self.values[i + self.size] = values[first:]
+    if host_values is not None:
+      self.host_values[i] = self.host_values[i + self.size] = host_values[first:]
+    self.n_written.value = n + n_new
+
+  def _get_range(self, first, last):
+    # Slice with the rows first, ..., last - 1. Only the last self.size rows are still stored.
+    first = max(first, last - self.size)
+    start = first % self.size
+    return slice(start, start + last - first)
+
+  def get_all(self):
+    return self.get_since(0)[:3]
+
+  def get_since(self, first):
+    # Rows with the absolute indices first, ..., n_written - 1, and n_written.
+    n_written = self.n_written.value
+    rows = self._get_range(first, n_written)
+    return self.timestamps[rows], self.values[rows], self.host_values[rows], n_written
+
+  def flush(self):
+    n_written = self.n_written.value
+    rows = self._get_range(self.n_read.value, n_written)
+    self.n_read.value = n_written
+    return self.timestamps[rows], self.values[rows], self.host_values[rows]
+
+  def reset(self):
+    self.n_written.value = 0
+    self.n_read.value = 0
+
+def shared_array(shape):
+  # Float array in shared memory, which is inherited by forked processes.
+  buffer = multiprocessing.RawArray('d', int(np.prod(shape)))
+  return np.frombuffer(buffer, dtype=np.float64).reshape(shape)
+
+class sampleCollector():
+  # Collects the samples of the background sampler of an nvml.deviceManager together
+  # with the host values. collect() returns the timestamps, the rows of (time x GPU x metric)
+  # and the host rows of (time x host key) gathered since the last call, which are views
+  # into buffers that are reused by the next call. The host is read once per call, and its
+  # values, like the locality columns of the GPUs, are repeated in all rows of the call.
+  # gpu_metrics are the per-GPU metrics.metric objects in the order of the columns. The
+  # sampler only reads the NVML items among them, each at its own period. Python metrics
+  # are read in the calls in which they are due, at most once per call.
+  def __init__(self, device, host_reader, gpu_metrics, num_gpus, t_record_s, t_collect_s):
+    self.device = device
+    self.host_reader = host_reader
+    self.keys = {}
+    for i, m in enumerate(gpu_metrics):
+       self.keys[m.name] = i
+    self.t_record_s = t_record_s
+    # The sampler keeps the samples of a few collection intervals.
+    self.buffer_size = int(4 * max(t_collect_s, t_record_s) / t_record_s) + 16
+    self.items = [m.name for m in gpu_metrics if m.source == metrics.NVML]
+    sampler_ticks = scheduler.tickScheduler(t_record_s)
+    self.divisors = [sampler_ticks.divisor(m.period) for m in gpu_metrics if m.source == metrics.NVML]
+    self.n_items = len(self.items)
+    self.num_devices = device.getNumDevices()
+    self.num_gpus = min(num_gpus, self.num_devices)
+    self.samples = np.zeros((self.buffer_size, 1 + self.num_devices * self.n_items))
+    self.device_columns = [self.keys[key] for key in self.items]
+    # Host values which belong to each GPU, like the utilization of its local cores.
+    self.locality_keys = [i for i, key in enumerate(host_reader.gpu_keys) if key in self.keys]
+    self.locality_columns = [self.keys[host_reader.gpu_keys[i]] for i in self.locality_keys]
+    self.python_metrics = [(m.name, self.keys[m.name], m.read) for m in gpu_metrics if m.source == metrics.PYTHON]
+    self.python_ticks = scheduler.tickScheduler(max(t_collect_s, t_record_s))
+    for m in gpu_metrics:
+      if m.source == metrics.PYTHON: self.python_ticks.add(m.name, m.period)
+    self.python_values = np.zeros((num_gpus, len(gpu_metrics)))
+    # Cumulative counters are turned into rates, using the last sample of the previous call.
+    self.counter_columns = [self.keys[m.name] for m in gpu_metrics if m.counter]
+    self.last_counters = None
+    self.last_t = None
+    self.rows = np.zeros((self.buffer_size, num_gpus, len(gpu_metrics)))
+    self.host_rows = np.zeros((self.buffer_size, len(host_reader.keys)))
+
+  def start(self):
+    self.last_counters = None
+    self.python_ticks.start()
+    self.device.startSampler(self.t_record_s, self.buffer_size, self.items, self.divisors)
+
+  def stop(self):
+    self.device.stopSampler()
+
+  def collect(self):
+    n = self.device.drainSamples(self.samples)
+    t = self.samples[:n, 0]
+    device_items = self.samples[:n, 1:].reshape(n, self.num_devices, self.n_items)
+    self.rows[:n, :self.num_gpus, self.device_columns] = device_items[:, :self.num_gpus]
+    if n > 0:
+      self.host_rows[:n] = self.host_reader.read_out()
+      if self.locality_columns:
+        gpu_values = self.host_reader.read_gpus()[:self.num_gpus, self.locality_keys]
+        self.rows[:n, :len(gpu_values), self.locality_columns] = gpu_values
+      due = self.python_ticks.due()
+      for name, column, read in self.python_metrics:
+        if name in due:
+          for gpu_id in range(self.num_gpus):
+            self.python_values[gpu_id, column] = read(gpu_id)
+        self.rows[:n, :, column] = self.python_values[:, column]
+      if self.counter_columns:
+        self.counter_rates(t, n)
+    return t, self.rows[:n], self.host_rows[:n]
+
+  def counter_rates(self, t, n):
+    counters = self.rows[:n, :, self.counter_columns]
+    previous = np.empty_like(counters)
+    t_previous = np.empty(n)
+    previous[1:] = counters[:-1]
+    t_previous[1:] = t[:-1]
+    if self.last_counters is None:
+      previous[0] = np.nan
+      t_previous[0] = t[0]
+    else:
+      previous[0] = self.last_counters
+      t_previous[0] = self.last_t
+    self.last_counters = counters[-1].copy()
+    self.last_t = t[-1]
+    # The first row and rows with a repeated timestamp have no rate.
+    dt = t - t_previous
+    dt[dt <= 0] = np.nan
+    self.rows[:n, :, self.counter_columns] = (counters - previous) / dt[:, None, None]
+
+ROLLUP_STATS = ["min", "mean", "max"]
+# Resolution in seconds and nr. of buckets of each tier: 6 hours, 2 days and 30 days.
+DEFAULT_ROLLUP_TIERS = [(10, 2160), (60, 2880), (600, 4320)]
+
+class rollupTier():
+  # Min, mean and max of all values in consecutive time buckets of a fixed length.
+  # The buckets are kept in a multiProcState of fixed size, with the columns
+  # ordered by statistic and then by key. They are aligned to the start time of
+  # the raw samples, and a bucket is written once the first sample after it arrives.
+  def __init__(self, keys, num_gpus, resolution, n_buckets, start_time, host_keys=()):
+    self.resolution = resolution
+    self.num_gpus = num_gpus
+    self.num_keys = len(keys)
+    self.num_host_keys = len(host_keys)
+    stat_keys = [stat + " " + key for stat in ROLLUP_STATS for key in keys]
+    stat_host_keys = [stat + " " + key for stat in ROLLUP_STATS for key in host_keys]
+    self.store = multiProcState(stat_keys, n_buckets, num_gpus, start_time, stat_host_keys)
+    # The bucket which is currently filled. This is only used by the writing process.
+    self.bucket = None
+    self.bucket_origin = None
+    self.acc_min = np.zeros((num_gpus, self.num_keys))
+    self.acc_max = np.zeros((num_gpus, self.num_keys))
+    self.acc_sum = np.zeros((num_gpus, self.num_keys))
+    self.acc_host_min = np.zeros(self.num_host_keys)
+    self.acc_host_max = np.zeros(self.num_host_keys)
+    self.acc_host_sum = np.zeros(self.num_host_keys)
+    # NaN values, like the rate of a counter before its second sample, are left out,
+    # so each column counts its own values.
+    self.acc_n = np.zeros((num_gpus, self.num_keys), dtype=np.int64)
+    self.acc_host_n = np.zeros(self.num_host_keys, dtype=np.int64)
+    self.n_rows = 0
+
+  def add(self, t, rows, host_rows):
+    # t are the timestamps of the rows in the clock of the writer, not relative to start_time.
+    if len(t) == 0: return
+    origin = self.store.start_time.value
+    buckets = np.floor((t - origin) / self.resolution).astype(np.int64)
+    splits = np.flatnonzero(np.diff(buckets)) + 1
+    for first, last in zip(np.r_[0, splits], np.r_[splits, len(t)]):
+      if buckets[first] != self.bucket or origin != self.bucket_origin:
+        # After a reset, the incomplete bucket belongs to the old time axis and is dropped.
+        if self.n_rows > 0 and origin == self.bucket_origin:
+          self.write_bucket()
+        self.start_bucket(buckets[first], origin)
+      self.accumulate(rows[first:last], self.acc_min, self.acc_max, self.acc_sum, self.acc_n)
+      self.accumulate(host_rows[first:last], self.acc_host_min, self.acc_host_max, self.acc_host_sum, self.acc_host_n)
+      self.n_rows += last - first
+
+  def accumulate(self, block, acc_min, acc_max, acc_sum, acc_n):
+    # fmin and fmax ignore NaN unless all values are NaN.
+    np.fmin(acc_min, np.fmin.reduce(block, axis=0), out=acc_min)
+    np.fmax(acc_max, np.fmax.reduce(block, axis=0), out=acc_max)
+    acc_sum += np.nansum(block, axis=0)
+    acc_n += np.count_nonzero(~np.isnan(block), axis=0)
+
+  def start_bucket(self, bucket, origin):
+    self.bucket = bucket
+    self.bucket_origin = origin
+    self.acc_min.fill(np.inf)
+    self.acc_max.fill(-np.inf)
+    self.acc_sum.fill(0)
+    self.acc_host_min.fill(np.inf)
+    self.acc_host_max.fill(-np.inf)
+    self.acc_host_sum.fill(0)
+    self.acc_n.fill(0)
+    self.acc_host_n.fill(0)
+    self.n_rows = 0
+
+  def write_bucket(self):
+    # A column without any values in the bucket is NaN in all statistics.
+    row = np.concatenate(self.bucket_stats(self.acc_min, self.acc_max, self.acc_sum, self.acc_n), axis=1)
+    host_row = np.concatenate(self.bucket_stats(self.acc_host_min, self.acc_host_max, self.acc_host_sum,
+                                                self.acc_host_n))
+    self.store.put_row(self.bucket_origin + self.bucket * self.resolution, row, host_row)
+
+  def bucket_stats(self, acc_min, acc_max, acc_sum, acc_n):
+    empty = acc_n == 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+      mean = acc_sum / acc_n
+    return [np.where(empty, np.nan, acc_min), np.where(empty, np.nan, mean), np.where(empty, np.nan, acc_max)]
+
+  def get_since(self, first):
+    # Like multiProcState.get_since, with the values as (time x GPU x statistic x key)
+    # and the host values as (time x statistic x host key).
+    t, values, host_values, n_written = self.store.get_since(first)
+    return (t, values.reshape(len(t), self.num_gpus, len(ROLLUP_STATS), self.num_keys),
+            host_values.reshape(len(t), len(ROLLUP_STATS), self.num_host_keys), n_written)
+
+class multiProcRollup():
+  # Rollup tiers of coarser resolution for the samples in a multiProcState, so that
+  # a long history can be shown with bounded memory. The tiers are fed with the
+  # same rows as the state and share its time axis.
+  def __init__(self, state, tiers=DEFAULT_ROLLUP_TIERS):
+    keys = list(state.keys)
+    host_keys = list(state.host_keys)
+    self.tiers = [rollupTier(keys, state.num_gpus, resolution, n_buckets, state.start_time, host_keys)
+                  for resolution, n_buckets in tiers]
+
+  def add(self, t, rows, host_rows):
+    for tier in self.tiers:
+      tier.add(t, rows, host_rows)
+
+  def reset(self):
+    for tier in self.tiers:
+      tier.store.reset()
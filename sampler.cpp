@@ -0,0 +1,172 @@
+#include <algorithm>
+#include <string.h>
+#include <time.h>
+
+#include "sampler.h"
+
+static double read_gpu_util (NVMLDeviceManager &device_manager, int index) {
+   unsigned int gpu_util, mem_util;
+   device_manager.getUtilization(index, &gpu_util, &mem_util);
+   return gpu_util;
+}
+
+static double read_mem_util (NVMLDeviceManager &device_manager, int index) {
+   unsigned int gpu_util, mem_util;
+   device_manager.getUtilization(index, &gpu_util, &mem_util);
+   return mem_util;
+}
+
+static double read_memory_used (NVMLDeviceManager &device_manager, int index) {
+   unsigned long long free, total, used;
+   device_manager.getMemoryInfo(index, &free, &total, &used);
+   return used / (1024.0 * 1024.0);
+}
+
+const device_item_t device_items[N_ITEMS] = {
+   {"Temperature", [](NVMLDeviceManager &dm, int i) -> double { return dm.getTemperature(i); }},
+   {"Frequency", [](NVMLDeviceManager &dm, int i) -> double { return dm.getFrequency(i); }},
+   {"PCIE", [](NVMLDeviceManager &dm, int i) -> double { return dm.getPcieRate(i); }},
+   // mW -> W, as in readOut.
+   {"Power", [](NVMLDeviceManager &dm, int i) -> double { return dm.getPowerUsage(i) / 1000; }},
+   {"GPU-Util", read_gpu_util},
+   {"Memory-Util", read_mem_util},
+   {"Memory-Used", read_memory_used},
+   {"SM-Clock", [](NVMLDeviceManager &dm, int i) { return dm.getClock(i, NVML_CLOCK_TYPE_SM); }},
+   {"Memory-Clock", [](NVMLDeviceManager &dm, int i) { return dm.getClock(i, NVML_CLOCK_TYPE_MEM); }},
+   {"ECC-Errors", [](NVMLDeviceManager &dm, int i) { return dm.getEccErrors(i); }},
+   {"Throttle-Reasons", [](NVMLDeviceManager &dm, int i) { return dm.getThrottleReasons(i); }},
+   {"NVLink-TX", [](NVMLDeviceManager &dm, int i) { return dm.getNvLinkThroughput(i, NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_TX); }},
+   {"NVLink-RX", [](NVMLDeviceManager &dm, int i) { return dm.getNvLinkThroughput(i, NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_RX); }},
+};
+
+int find_device_item (const char *name) {
+   for (int i = 0; i < N_ITEMS; i++) {
+      if (strcmp(device_items[i].name, name) == 0) return i;
+   }
+   return -1;
+}
+
+std::vector<int> all_device_items () {
+   std::vector<int> items;
+   for (int i = 0; i < N_ITEMS; i++) items.push_back(i);
+   return items;
+}
+
+void read_device_items (NVMLDeviceManager &device_manager, int index, const std::vector<int> &items, double *values) {
+   for (int i = 0; i < items.size(); i++) {
+      values[i] = device_items[items[i]].read(device_manager, index);
+   }
+}
+
+Sampler::Sampler (NVMLDeviceManager &device_manager, int num_devices, int capacity,
+                  const std::vector<int> &items, const std::vector<int> &divisors):
+   device_manager(device_manager),
+   num_devices(num_devices),
+   capacity(capacity),
+   items(items),
+   divisors(divisors),
+   rows(capacity * (1 + num_devices * items.size()))
+{}
+
+Sampler::~Sampler () {
+   stop();
+}
+
+int Sampler::row_size () const {
+   return 1 + num_devices * items.size();
+}
+
+bool Sampler::is_running () const {
+   return running;
+}
+
+long long Sampler::n_dropped () const {
+   std::lock_guard<std::mutex> lock(rows_mutex);
+   return dropped;
+}
+
+void Sampler::start (double period_s) {
+   if (running) return;
+   running = true;
+   thread = std::thread(&Sampler::run, this, period_s);
+}
+
+void Sampler::stop () {
+   running = false;
+   if (thread.joinable()) thread.join();
+}
+
+int Sampler::drain (double *buffer, int max_rows) {
+   std::lock_guard<std::mutex> lock(rows_mutex);
+   int n = n_rows < max_rows ? n_rows : max_rows;
+   for (int i = 0; i < n; i++) {
+      int i_row = (first_row + i) % capacity;
+      memcpy (buffer + i * row_size(), rows.data() + i_row * row_size(), row_size() * sizeof(double));
+   }
+   first_row = (first_row + n) % capacity;
+   n_rows -= n;
+   return n;
+}
+
+static long long get_time_ns () {
+   struct timespec now;
+   clock_gettime(CLOCK_MONOTONIC, &now);
+   return now.tv_sec * 1000000000LL + now.tv_nsec;
+}
+
+void Sampler::run (double period_s) {
+   // The wake-up times are multiples of the period after the start, so the
+   // time spent reading out the devices does not accumulate as drift. The rows
+   // are stamped with the same clock as the wake-up times, which is the one
+   // of get_time_monotonic.
+   // startSampler keeps the period within MIN_SAMPLER_PERIOD and MAX_SAMPLER_PERIOD.
+   const long long period_ns = std::max((long long)(period_s * 1e9), 1LL);
+   const long long start_ns = get_time_ns();
+   long long n_ticks = 0;
+   std::vector<double> row(row_size());
+   // The tick in which each item is read next. Items with the same divisor are read in
+   // the same ticks, and an item whose tick has been skipped is read in the next one.
+   std::vector<long long> next_tick(items.size(), 0);
+   std::vector<int> due;
+   const int n_items = items.size();
+
+   while (running) {
+      row[0] = get_time_ns() * 1e-9;
+      due.clear();
+      for (int j = 0; j < n_items; j++) {
+         if (n_ticks >= next_tick[j]) {
+            due.push_back(j);
+            next_tick[j] = (n_ticks / divisors[j] + 1) * divisors[j];
+         }
+      }
+      for (int i = 0; i < num_devices; i++) {
+         for (int j : due) {
+            row[1 + i * n_items + j] = device_items[items[j]].read(device_manager, i);
+         }
+      }
+
+      {
+         std::lock_guard<std::mutex> lock(rows_mutex);
+         int i_row = (first_row + n_rows) % capacity;
+         memcpy (rows.data() + i_row * row_size(), row.data(), row_size() * sizeof(double));
+         if (n_rows < capacity) {
+            n_rows++;
+         } else {
+            first_row = (first_row + 1) % capacity;
+            dropped++;
+         }
+      }
+
+      // If the readout took longer than one period, skip the ticks which have been missed.
+      const long long now_ns = get_time_ns();
+      n_ticks++;
+      if (start_ns + n_ticks * period_ns < now_ns) {
+         n_ticks = (now_ns - start_ns) / period_ns + 1;
+      }
+      const long long next_ns = start_ns + n_ticks * period_ns;
+      struct timespec next;
+      next.tv_sec = next_ns / 1000000000LL;
+      next.tv_nsec = next_ns % 1000000000LL;
+      clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &next, NULL);
+   }
+}
@@ -0,0 +1,66 @@
+#ifndef SAMPLER_H
+#define SAMPLER_H
+
+#include <atomic>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+#include "nvml_interface.h"
+
+// The items which can be read out per device. Each one has its own getter, so that
+// only the items which are enabled are queried.
+typedef double (*item_getter_t)(NVMLDeviceManager &device_manager, int index);
+
+typedef struct {
+   const char *name;
+   item_getter_t read;
+} device_item_t;
+
+constexpr int N_ITEMS{13};
+// The range of the sampler period in seconds, so that it is a positive number of ns.
+constexpr double MIN_SAMPLER_PERIOD{1e-6};
+constexpr double MAX_SAMPLER_PERIOD{1e6};
+extern const device_item_t device_items[N_ITEMS];
+
+// Index of the item with the given name, or -1.
+int find_device_item (const char *name);
+void read_device_items (NVMLDeviceManager &device_manager, int index, const std::vector<int> &items, double *values);
+std::vector<int> all_device_items ();
+
+// Reads out all devices in a background thread at a fixed period. Each sample is
+// one row of 1 + num_devices * items.size() doubles (timestamp, then the items of
+// each device), stored in a ring buffer of fixed capacity. When the buffer is full,
+// the oldest rows are overwritten. Item i is only read every divisors[i] ticks,
+// and keeps its last value in the rows in between.
+class Sampler {
+   public:
+      Sampler(NVMLDeviceManager &device_manager, int num_devices, int capacity,
+              const std::vector<int> &items, const std::vector<int> &divisors);
+      ~Sampler();
+      void start(double period_s);
+      void stop();
+      bool is_running() const;
+      int row_size() const;
+      // Copies at most max_rows rows, oldest first, and removes them from the buffer.
+      int drain(double *buffer, int max_rows);
+      // Number of rows which have been overwritten before they were drained.
+      long long n_dropped() const;
+   private:
+      void run(double period_s);
+
+      NVMLDeviceManager &device_manager;
+      int num_devices;
+      int capacity;
+      std::vector<int> items;
+      std::vector<int> divisors;
+      std::vector<double> rows;
+      int first_row{0};
+      int n_rows{0};
+      long long dropped{0};
+      mutable std::mutex rows_mutex;
+      std::atomic<bool> running{false};
+      std::thread thread;
+};
+
+#endif
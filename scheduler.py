@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import time
+
+class tickScheduler():
+  # Runs tasks with individual periods on the ticks of a common base period. The period
+  # of each task is rounded to a multiple of the base period (its divisor), so tasks
+  # with the same divisor always fall on the same tick and their reads are grouped.
+  # The ticks are counted from start(), so the time spent in the tasks does not
+  # accumulate as drift. A task whose tick has been missed runs on the next call.
+  # The clock can be replaced, e.g. by a fake one for tests.
+  # The C sampler (nvml.deviceManager.startSampler) applies the same divisors per item.
+  def __init__(self, base_period, clock=time.monotonic):
+    if base_period <= 0:
+      raise ValueError("The base period must be positive")
+    self.base_period = base_period
+    self.clock = clock
+    self.divisors = {}
+    self.next_tick = {}
+    self.t_start = None
+
+  def divisor(self, period):
+    # Nr. of base periods between two runs of a task with the period, None for every tick.
+    if period is None: return 1
+    return max(1, int(round(period / self.base_period)))
+
+  def add(self, name, period=None):
+    self.divisors[name] = self.divisor(period)
+    self.next_tick[name] = 0
+    return self.divisors[name]
+
+  def start(self):
+    self.t_start = self.clock()
+    for name in self.next_tick:
+      self.next_tick[name] = 0
+
+  def current_tick(self):
+    # A time which is a multiple of the base period can come out just below it,
+    # e.g. 0.3 / 0.1 = 2.9999999999999996, and belongs to that tick nevertheless.
+    return int((self.clock() - self.t_start) / self.base_period + 1e-9)
+
+  def due(self):
+    # The tasks which are due at the current time, in the order in which they were added.
+    tick = self.current_tick()
+    due = [name for name, next_tick in self.next_tick.items() if next_tick <= tick]
+    for name in due:
+      d = self.divisors[name]
+      self.next_tick[name] = (tick // d + 1) * d
+    return due
+
+  def time_to_next(self):
+    # Seconds until the next task is due, 0 if one is due already.
+    if not self.next_tick: return self.base_period
+    t_next = self.t_start + min(self.next_tick.values()) * self.base_period
+    return max(0.0, t_next - self.clock())
@@ -37,9 +37,9 @@ class cuda_build_ext(build_ext):
 
 
 nvml_ext = Extension('nvml',
-                      sources = ['monitor_gpu.cpp', 'nvml_interface.cpp', 'common.cpp', 'dgemm.cpp', 'stream.cu'],
+                      sources = ['monitor_gpu.cpp', 'nvml_interface.cpp', 'sampler.cpp', 'common.cpp', 'dgemm.cpp', 'stream.cu'],
                       extra_compile_args=['-std=c++17', '-I' + CUDA_PATH + '/include'],
-                      extra_objects=['-L' + CUDA_PATH + '/lib64', '-lcudart', '-lcublas'])
+                      extra_objects=['-L' + CUDA_PATH + '/lib64', '-lcudart', '-lcublas', '-lpthread'])
 
                        
 
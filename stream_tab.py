@@ -5,23 +5,18 @@ from dash import html
 from dash import dcc
 from dash.dependencies import Input, Output, State
 import plotly
-import nvml
 
-import multiprocessing
+import benchmark_tab
 
-STREAM_STATE_IDLE = 0
-STREAM_STATE_BUSY = 1
-STREAM_STATE_DONE = 2
-
-stream_result = multiprocessing.Array('u', 1024)
-stream_busy_flag = multiprocessing.Value('i', 0)
+RESULT_KEYS = ["Copy", "Scale", "Add", "Triad"]
 
 def Tab (deviceProps):
-  max_stream_size = nvml.streamMaxVectorSize(deviceProps.total_mem[0])
   return dcc.Tab(label='Stream', children=[
          html.H1('Start a stream run'),
-         html.P(children="Available GPU Memory: " + str(deviceProps.total_mem_gib[0]) + " GiB"),
-         html.P(children="Maximal Stream vector size: " + str(max_stream_size)),
+         html.Div(["GPU: ",
+                   dcc.Dropdown(id='stream-gpu', options=benchmark_tab.gpu_options(deviceProps), value=0, clearable=False)
+         ]),
+         html.P(id='stream-memory'),
          html.Div(["Vector size: ",
                    dcc.Input(id='input-stream-matrix-size', value=10000, type='number')
          ]),
@@ -29,64 +24,60 @@ def Tab (deviceProps):
                    dcc.Input(id='input-stream-nrepeat', value=10, type='number')
          ]),
          html.Button('STREAM', id='start-stream', n_clicks=0),
-         html.P(id='stream-button-out', children='This is the button output'),
+         html.P(id='stream-button-out', children=''),
+         html.Div(["Job: ",
+                   dcc.Input(id='stream-cancel-id', type='number'),
+                   html.Button('Cancel', id='cancel-stream', n_clicks=0),
+                   html.Span(id='stream-cancel-out')
+         ]),
          html.Div(children= [
-            html.P(id='live-update-stream', children='Nothing happened'),
+            html.Table(id='live-update-stream'),
             dcc.Interval(id='stream-interval-component', interval = 1000, n_intervals = 0)
-         ]) 
+         ])
     ])
 
-def multiprocStream (vector_size, n_repeats, result_string, busy_flag):
-  busy_flag.value = STREAM_STATE_BUSY
-  bw = nvml.performStream(vector_size, n_repeats)
-  status = bw["Status"]
-  if status == "OK":
-    s = "STREAM result for N = %d" % vector_size + "\n" \
-        "   Copy: %6.1f GiB/s " % bw["Copy"] + "\n" \
-        "  Scale: %6.1f GiB/s " % bw["Scale"] + "\n" \
-        "    Add: %6.1f GiB/s " % bw["Add"] + "\n" \
-        "  Triad: %6.1f GiB/s " % bw["Triad"] 
-  else:
-    s = "STREAM failed: Error %s" % status
-  
-  for i in range(len(s)):
-     result_string[i] = s[i]
-
-  busy_flag.value = STREAM_STATE_DONE
+def register_callbacks(app, deviceProps, jobs):
+  @app.callback(
+     Output('stream-memory', 'children'),
+     Input('stream-gpu', 'value'))
+  def show_memory (gpu_id):
+    gpu_ids = benchmark_tab.chosen_gpus(deviceProps, gpu_id)
+    memory = min(jobs.backend.available_memory(deviceProps, i) for i in gpu_ids)
+    return "Available %s Memory: %.2f GiB, maximal Stream vector size: %d" % (
+           jobs.backend.memory_label, memory / 1024**3,
+           jobs.backend.stream_max_size(memory))
 
-def register_callbacks(app):
   @app.callback(
      Output('stream-button-out', 'children'),
      Input('start-stream', 'n_clicks'),
+     State('stream-gpu', 'value'),
      State('input-stream-matrix-size', 'value'),
-     State('input-stream-nrepeat', 'value'))
-  def do_stream_button_click (n_clicks, vector_size, n_repeats):
-    if n_clicks > 0:
-       stream_proc = multiprocessing.Process(target=multiprocStream, args=(vector_size, n_repeats, stream_result, stream_busy_flag))
-       stream_proc.start()
-       stream_proc.join()
-  
+     State('input-stream-nrepeat', 'value'),
+     prevent_initial_call=True)
+  def do_stream_button_click (n_clicks, gpu_id, vector_size, n_repeats):
+    if vector_size is None or n_repeats is None:
+      return "Invalid input"
+    job_ids = jobs.submit("stream", {"vector_size": int(vector_size), "n_repeats": int(n_repeats)},
+                          benchmark_tab.chosen_gpus(deviceProps, gpu_id))
+    return "Queued job %s" % ", ".join(map(str, job_ids))
+
+  @app.callback(
+     Output('stream-cancel-out', 'children'),
+     Input('cancel-stream', 'n_clicks'),
+     State('stream-cancel-id', 'value'),
+     prevent_initial_call=True)
+  def do_cancel_click (n_clicks, job_id):
+    if job_id is None: return ""
+    return " Cancelled job %d" % job_id if jobs.cancel(int(job_id)) else " Job %d is not queued or running" % job_id
+
+  shown_version = [None]
+
   @app.callback(
      Output('live-update-stream', 'children'),
-     Input('live-update-stream', 'children'),
      Input('stream-interval-component', 'n_intervals'))
-  def update_stream_result(original_name, n_intervals):
-    if stream_busy_flag.value == STREAM_STATE_IDLE:
-       ret = "Waiting"
-    elif stream_busy_flag.value == STREAM_STATE_BUSY:
-       ret = "Busy"
-    elif stream_busy_flag.value == STREAM_STATE_DONE:
-       ret = []
-       tmp = ""
-       for s in stream_result:
-         if s == '\0':
-           break
-         elif s == '\n':
-           ret.append (tmp)
-           ret.append (html.Br())
-           tmp = ""
-         else:
-           tmp += s
-       ret.append(tmp)
-    return ret
-
+  def update_stream_result(n_intervals):
+    snapshot, version = jobs.snapshot()
+    if version == shown_version[0] and not jobs.busy_gpus():
+      return dash.no_update
+    shown_version[0] = version
+    return benchmark_tab.jobs_table(snapshot, "stream", RESULT_KEYS, "GB/s")
@@ -0,0 +1,222 @@
+// Minimal stand-in for libnvidia-ml.so, so the nvml extension can be exercised
+// on machines without a GPU. Build and use it with
+//
+//    g++ -std=c++17 -shared -fPIC -o libnvidia-ml.so stub_nvml.cpp
+//    LD_LIBRARY_PATH=. python bench_readout.py
+//
+// The environment variables STUB_NVML_DEVICES (default 1) and STUB_NVML_INIT_US
+// (default 0) set the number of fake GPUs and an artificial nvmlInit delay.
+// STUB_NVML_PROCESSES (default 0) sets the number of process slots per GPU.
+// Every 10 queries of the process table of a GPU, one of these processes exits
+// and comes back with a new PID on the next round.
+
+#include <stdlib.h>
+#include <string.h>
+#include <stdio.h>
+#include <unistd.h>
+
+#include "nvml_interface.h"
+
+static unsigned int stub_num_devices () {
+   const char *s = getenv("STUB_NVML_DEVICES");
+   return s != NULL ? atoi(s) : 1;
+}
+
+// Device handles are only compared and passed around, so the index is enough.
+static unsigned int stub_index (nvmlDevice_t device) {
+   return (unsigned int)(size_t)device - 1;
+}
+
+static unsigned int stub_counter = 0;
+
+extern "C" {
+
+nvmlReturn_t nvmlInit () {
+   const char *s = getenv("STUB_NVML_INIT_US");
+   if (s != NULL) usleep(atoi(s));
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlShutdown () {
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlSystemGetDriverVersion (char *version, unsigned int length) {
+   snprintf (version, length, "stub");
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlSystemGetNVMLVersion (char *version, unsigned int length) {
+   snprintf (version, length, "stub");
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlSystemGetProcessName (unsigned int pid, char *name, unsigned int length) {
+   snprintf (name, length, "stub_process_%u", pid);
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetCount_v2 (unsigned int *device_count) {
+   *device_count = stub_num_devices();
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetHandleByIndex (unsigned int index, nvmlDevice_t *device) {
+   if (index >= stub_num_devices()) return nvmlReturn_t::NVML_ERROR_INVALID_ARGUMENT;
+   *device = (nvmlDevice_t)(size_t)(index + 1);
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetName (nvmlDevice_t device, char *name, unsigned int length) {
+   snprintf (name, length, "Stub GPU %u", stub_index(device));
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetTemperature (nvmlDevice_t device, unsigned int sensor_type, unsigned int *temp) {
+   *temp = 40 + stub_index(device);
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetClock (nvmlDevice_t device, unsigned int clock_type, unsigned int clock_id, unsigned int *clock_mhz) {
+   *clock_mhz = 1400 + (stub_counter++ % 10);
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetNumGpuCores (nvmlDevice_t device, unsigned int *num_cores) {
+   *num_cores = 5120;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetPcieThroughput (nvmlDevice_t device, unsigned int counter, unsigned int *rate) {
+   *rate = 100;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetPowerUsage (nvmlDevice_t device, unsigned int *power) {
+   *power = 60000 + 1000 * (stub_counter++ % 50);
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetUtilizationRates (nvmlDevice_t device, nvml_utilization_t *utilization) {
+   utilization->gpu = stub_counter++ % 100;
+   utilization->memory = 10;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetMemoryInfo (nvmlDevice_t device, nvml_memory_t *memory) {
+   memory->total = 16ULL << 30;
+   memory->used = 1ULL << 30;
+   memory->free = memory->total - memory->used;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+constexpr unsigned int STUB_MAX_DEVICES{64};
+static unsigned int stub_process_queries[STUB_MAX_DEVICES];
+
+static unsigned int stub_num_processes () {
+   const char *s = getenv("STUB_NVML_PROCESSES");
+   return s != NULL ? atoi(s) : 0;
+}
+
+// The PID of process slot k of a device after the given number of queries, or 0 if the slot is empty.
+static unsigned int stub_pid (unsigned int device_index, unsigned int k, unsigned int queries) {
+   unsigned int n = stub_num_processes();
+   unsigned int round = queries / 10 + k;
+   if (round % (n + 1) == 0) return 0;
+   return 1000 + 100 * device_index + k + 10000 * (round / (n + 1));
+}
+
+nvmlReturn_t nvmlDeviceGetComputeRunningProcesses_v3 (nvmlDevice_t device, unsigned int *info_count, nvml_proc_info_t *infos) {
+   unsigned int index = stub_index(device) % STUB_MAX_DEVICES;
+   unsigned int queries = stub_process_queries[index];
+   unsigned int n = 0;
+   for (unsigned int k = 0; k < stub_num_processes(); k++) {
+      if (stub_pid(index, k, queries) != 0) n++;
+   }
+   if (infos == NULL || *info_count < n) {
+      *info_count = n;
+      return n == 0 ? nvmlReturn_t::NVML_SUCCESS : nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE;
+   }
+   unsigned int i = 0;
+   for (unsigned int k = 0; k < stub_num_processes(); k++) {
+      unsigned int pid = stub_pid(index, k, queries);
+      if (pid == 0) continue;
+      infos[i].pid = pid;
+      infos[i].usedGpuMemory = ((k + 1) * 256ULL + queries % 8) << 20;
+      infos[i].gpuInstanceId = 0;
+      infos[i].computeInstanceId = 0;
+      i++;
+   }
+   *info_count = n;
+   stub_process_queries[index]++;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetProcessUtilization (nvmlDevice_t device, nvml_process_utilization_t *utilization,
+                                              unsigned int *sample_count, unsigned long long last_seen) {
+   unsigned int index = stub_index(device) % STUB_MAX_DEVICES;
+   unsigned int queries = stub_process_queries[index];
+   unsigned long long now = 1000ULL * (queries + 1);
+   if (now <= last_seen) return nvmlReturn_t::NVML_ERROR_NOT_FOUND;
+   unsigned int n = 0;
+   for (unsigned int k = 0; k < stub_num_processes(); k++) {
+      if (stub_pid(index, k, queries) != 0) n++;
+   }
+   if (n == 0) return nvmlReturn_t::NVML_ERROR_NOT_FOUND;
+   if (utilization == NULL || *sample_count < n) {
+      *sample_count = n;
+      return nvmlReturn_t::NVML_ERROR_INSUFFICIENT_SIZE;
+   }
+   unsigned int i = 0;
+   for (unsigned int k = 0; k < stub_num_processes(); k++) {
+      unsigned int pid = stub_pid(index, k, queries);
+      if (pid == 0) continue;
+      utilization[i] = {pid, now, (10 * (k + 1) + queries) % 100, 5, 0, 0};
+      i++;
+   }
+   *sample_count = n;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetTotalEccErrors (nvmlDevice_t device, unsigned int error_type, unsigned int counter_type,
+                                          unsigned long long *count) {
+   *count = 0;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetCurrentClocksEventReasons (nvmlDevice_t device, unsigned long long *reasons) {
+   *reasons = 0;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+// NVLink traffic grows by 1 MiB per query.
+static unsigned long long stub_nvlink_kib = 0;
+
+nvmlReturn_t nvmlDeviceGetFieldValues (nvmlDevice_t device, int count, nvml_field_value_t *values) {
+   for (int i = 0; i < count; i++) {
+      if (values[i].fieldId == NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_TX
+          || values[i].fieldId == NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_RX) {
+         stub_nvlink_kib += 1024;
+         values[i].value.ullVal = stub_nvlink_kib;
+         values[i].nvmlReturn = nvmlReturn_t::NVML_SUCCESS;
+      } else {
+         values[i].nvmlReturn = nvmlReturn_t::NVML_ERROR_NOT_SUPPORTED;
+      }
+   }
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+// One GPU per PCI bus, starting at 0000:01:00.0.
+nvmlReturn_t nvmlDeviceGetPciInfo_v3 (nvmlDevice_t device, nvml_pci_info_t *pci) {
+   memset (pci, 0, sizeof(nvml_pci_info_t));
+   pci->bus = 1 + stub_index(device);
+   snprintf (pci->busId, NVML_DEVICE_PCI_BUS_ID_BUFFER_SIZE, "00000000:%02X:00.0", pci->bus);
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+nvmlReturn_t nvmlDeviceGetPersistenceMode (nvmlDevice_t device, unsigned int *mode) {
+   *mode = NVML_PERSISTENCE_ENABLED;
+   return nvmlReturn_t::NVML_SUCCESS;
+}
+
+}
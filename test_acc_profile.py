@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+# Round trips and merges of the per-rank OpenACC profiles.
+
+import io
+import os
+
+import numpy as np
+import pytest
+
+import acc_profile
+from acc_profile import KINDS, RECORD_DTYPE
+
+def record(kind, kernel_name, src_file, func_name, lines, n_calls, duration, n_bytes=0):
+  r = np.zeros((), dtype=RECORD_DTYPE)
+  r["kind"], r["kernel_name"], r["src_file"], r["func_name"] = kind, kernel_name, src_file, func_name
+  r["line_start"], r["line_end"], r["func_line_start"], r["func_line_end"] = lines
+  r["n_calls"], r["total_duration"], r["total_bytes"] = n_calls, duration, n_bytes
+  return r
+
+def synthetic_profiles(directory, n_ranks, n_sites, rng):
+  # Every rank calls most of the sites, with its own order of the string table.
+  # Returns the filenames and the expected totals of calls, durations and bytes per kind.
+  files = ["/src/solver_%d.f90" % i for i in range(max(1, n_sites // 40))]
+  site_names = [(files[s % len(files)], "solve_%d" % (s // 10),
+                 "solve_%d_%d_gpu" % (s // 10, s) if s % 3 == 0 else None) for s in range(n_sites)]
+  expected = {kind: np.zeros(3) for kind in KINDS}
+  filenames = []
+  for rank in range(n_ranks):
+    called = np.flatnonzero(rng.random(n_sites) < 0.9)
+    strings = sorted({name for s in called for name in site_names[s] if name is not None})
+    rng.shuffle(strings)
+    string_index = {s: i for i, s in enumerate(strings)}
+    records = np.zeros(len(called), dtype=RECORD_DTYPE)
+    for j, s in enumerate(called):
+      src_file, func_name, kernel_name = site_names[s]
+      kind = 0 if kernel_name is not None else 1 + s % 2
+      records[j] = record(kind, string_index[kernel_name] if kernel_name is not None else -1,
+                          string_index[src_file], string_index[func_name],
+                          (10 * s, 10 * s + 5, 100 * (s // 10), 100 * (s // 10) + 90), 0, 0)
+    records["n_calls"] = rng.integers(1, 1000, len(called))
+    records["total_duration"] = records["n_calls"] * rng.integers(1000, 100000, len(called)) * (1 + rank % 4)
+    records["total_bytes"] = np.where(records["kind"] == 1, records["n_calls"] * 8192, 0)
+    for code, kind in enumerate(KINDS):
+      mine = records[records["kind"] == code]
+      expected[kind] += [mine["n_calls"].sum(), mine["total_duration"].sum(), mine["total_bytes"].sum()]
+    filename = os.path.join(directory, "synthetic.%d.accprof" % rank)
+    acc_profile.write_profile(filename, rank, "node%d" % (rank // 4), strings, records)
+    filenames.append(filename)
+  return filenames, expected
+
+def test_round_trip(tmp_path):
+  filename = str(tmp_path / "p.0.accprof")
+  strings = ["gpu_kernel", "/src/a.f90", "main", "naïve \"name\""]
+  records = np.array([record(0, 0, 1, 2, (1, 2, 0, 10), 5, 1000), record(1, -1, 1, 3, (3, 4, 0, 10), 2, 50, 4096)])
+  acc_profile.write_profile(filename, 7, "node\\\"1", strings, records)
+  profile = acc_profile.accProfile(filename)
+  assert profile.mpi_rank == 7
+  assert profile.host == "node\\\"1"
+  assert profile.kinds == {"LAUNCH": 0, "DATA": 1, "OTHER": 2}
+  assert profile.strings == strings
+  assert profile.records.tobytes() == records.tobytes()
+
+def test_not_a_profile(tmp_path):
+  filename = tmp_path / "other.accprof"
+  filename.write_bytes(b"something else")
+  with pytest.raises(ValueError):
+    acc_profile.accProfile(str(filename))
+
+def test_merge_two_ranks(tmp_path):
+  # The same site with different string tables and kind numbers, and a site of one rank only.
+  first = str(tmp_path / "p.0.accprof")
+  acc_profile.write_profile(first, 0, "node0", ["k", "a.f90", "main"],
+                            [record(0, 0, 1, 2, (1, 2, 0, 9), 10, 3000)])
+  second = str(tmp_path / "p.1.accprof")
+  acc_profile.write_profile(second, 1, "node0", ["main", "a.f90", "k"],
+                            [record(5, 2, 1, 0, (1, 2, 0, 9), 20, 1000),
+                             record(6, -1, 1, 0, (3, 4, 0, 9), 1, 500, 8192)],
+                            kinds={"LAUNCH": 5, "DATA": 6, "OTHER": 7})
+  merged = acc_profile.merge_profiles([first, second], n_jobs=1)
+  assert list(merged.ranks) == [0, 1]
+  assert len(merged.sites) == 2
+  launch = [i for i in range(len(merged.sites)) if merged.kind(i) == "LAUNCH"][0]
+  data = [i for i in range(len(merged.sites)) if merged.kind(i) == "DATA"][0]
+  assert merged.name(launch, "kernel_name") == "k"
+  assert merged.name(launch, "func_name") == "main"
+  assert merged.name(data, "kernel_name") is None
+  assert merged.lines(launch) == (1, 2, 0, 9)
+  assert merged.n_calls[launch] == 30
+  assert list(merged.per_rank_duration[launch]) == [3000, 1000]
+  assert (merged.min_duration[launch], merged.mean_duration[launch], merged.max_duration[launch]) == (1000, 2000, 3000)
+  assert merged.imbalance[launch] == pytest.approx(1.5)
+  assert merged.n_ranks_called[data] == 1
+  assert merged.total_bytes[data] == 8192
+
+  out = io.StringIO()
+  acc_profile.report(merged, out=out)
+  assert "2 ranks, 2 event sites" in out.getvalue()
+  assert "k in main (a.f90:1-2)" in out.getvalue()
+  assert "on 1 ranks" in out.getvalue()
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_merge_synthetic_profiles(tmp_path, n_jobs):
+  n_ranks, n_sites = 16, 200
+  filenames, expected = synthetic_profiles(str(tmp_path), n_ranks, n_sites, np.random.default_rng(0))
+  merged = acc_profile.merge_profiles(filenames, n_jobs)
+  assert len(merged.ranks) == n_ranks
+  assert len(merged.sites) <= n_sites
+  for code, kind in enumerate(KINDS):
+    mine = merged.sites[:, 0] == code
+    totals = [merged.n_calls[mine].sum(), merged.total_duration[mine].sum(), merged.total_bytes[mine].sum()]
+    np.testing.assert_allclose(totals, expected[kind])
+  assert np.all(merged.min_duration <= merged.mean_duration) and np.all(merged.mean_duration <= merged.max_duration)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# The host backend of the benchmarks, which runs without CUDA.
+
+import math
+
+import pytest
+
+import benchmark_backend
+
+DGEMM_KEYS = ["Status", "Avg", "Min", "Max", "Stddev"]
+STREAM_KEYS = ["Status", "Copy", "Scale", "Add", "Triad"]
+
+@pytest.fixture
+def backend():
+  return benchmark_backend.get_backend("host")
+
+def test_get_backend():
+  assert benchmark_backend.get_backend("cuda").name == "cuda"
+  with pytest.raises(ValueError):
+    benchmark_backend.get_backend("opencl")
+
+def test_gflops_statistics():
+  # Running update as in dgemm.cpp: var = 1/2 + 9/6 = 2, normalized by n + 1.
+  assert benchmark_backend.gflops_statistics([1.0, 2.0, 3.0]) == pytest.approx(
+         {"Avg": 2.0, "Min": 1.0, "Max": 3.0, "Stddev": math.sqrt(0.5)})
+  assert benchmark_backend.gflops_statistics([5.0]) == {"Avg": 5.0, "Min": 5.0, "Max": 5.0, "Stddev": 0.0}
+  assert benchmark_backend.gflops_statistics([]) == {"Avg": 0.0, "Min": 0.0, "Max": 0.0, "Stddev": 0.0}
+
+def test_stream_expected():
+  assert benchmark_backend.stream_expected(0) == (2.0, 2.0, 0.0)
+  # c = a = 2, b = 3 * 2 = 6, c = 2 + 6 = 8, a = 6 + 3 * 8 = 30
+  assert benchmark_backend.stream_expected(1) == (30.0, 6.0, 8.0)
+  assert benchmark_backend.stream_expected(2) == (450.0, 90.0, 120.0)
+
+def test_sizes():
+  assert benchmark_backend.dgemm_flops(10) == 2200
+  assert benchmark_backend.dgemm_max_size(3 * 8 * 100**2) == 100
+  assert benchmark_backend.stream_max_size(80 * 1000) == 1000
+  assert benchmark_backend.stream_bytes(10) == {"Copy": 160, "Scale": 160, "Add": 240, "Triad": 240}
+
+def test_dgemm(backend):
+  result = backend.dgemm(0, 64, 3)
+  assert list(result) == DGEMM_KEYS
+  assert result["Status"] == "OK"
+  assert 0 < result["Min"] <= result["Avg"] <= result["Max"]
+  assert result["Stddev"] >= 0
+
+@pytest.mark.parametrize("n_threads", [1, 3])
+def test_stream(n_threads):
+  # A small block size, so that the triad runs on several blocks per slice.
+  backend = benchmark_backend.hostBackend(n_threads=n_threads, block_size=1000)
+  result = backend.stream(0, 10007, 3)
+  assert list(result) == STREAM_KEYS
+  assert result["Status"] == "OK"
+  assert all(result[key] > 0 for key in STREAM_KEYS[1:])
+
+def test_no_repeats(backend):
+  assert backend.dgemm(0, 16, 0) == {"Status": "INVALID_REPEATS", "Avg": 0.0, "Min": 0.0, "Max": 0.0, "Stddev": 0.0}
+  assert backend.stream(0, 1000, 0) == {"Status": "INVALID_REPEATS"}
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# The benchmark queue with the host backend, whose jobs run without CUDA.
+
+import time
+
+import pytest
+
+import benchmark_queue
+from benchmark_queue import CANCELLED, DONE, FAILED, QUEUED, RUNNING
+
+QUICK = {"matrix_size": 16, "n_repeats": 1}
+# Long enough to be cancelled while it runs, but it is only run to the end on one GPU.
+SLOW = {"matrix_size": 512, "n_repeats": 100000}
+
+def wait_for(condition, timeout=60.0):
+  t_end = time.monotonic() + timeout
+  while not condition():
+    if time.monotonic() > t_end:
+      raise TimeoutError
+    time.sleep(0.02)
+
+def jobs_by_id(queue):
+  return {job["id"]: job for job in queue.snapshot()[0]}
+
+def finished(queue, job_ids):
+  jobs = jobs_by_id(queue)
+  return all(jobs[job_id]["state"] not in (QUEUED, RUNNING) for job_id in job_ids)
+
+@pytest.fixture
+def queue():
+  return benchmark_queue.benchmarkQueue(2, poll_s=0.02, backend="host")
+
+def test_one_job_at_a_time_per_gpu(queue):
+  job_ids = [queue.submit("dgemm", QUICK, [0])[0] for _ in range(3)]
+  jobs = jobs_by_id(queue)
+  assert [jobs[job_id]["state"] for job_id in job_ids] == [RUNNING, QUEUED, QUEUED]
+  wait_for(lambda: finished(queue, job_ids))
+  jobs = jobs_by_id(queue)
+  assert all(jobs[job_id]["state"] == DONE for job_id in job_ids)
+  # In the order of submission, each one after the previous one has ended.
+  for previous, job_id in zip(job_ids, job_ids[1:]):
+    assert jobs[job_id]["started"] >= jobs[previous]["finished"]
+  assert queue.busy_gpus() == []
+
+def test_gpus_run_at_the_same_time(queue):
+  job_ids = queue.submit("stream", {"vector_size": 1000, "n_repeats": 2}, [0, 1])
+  jobs = jobs_by_id(queue)
+  assert [jobs[job_id]["state"] for job_id in job_ids] == [RUNNING, RUNNING]
+  assert jobs[job_ids[0]]["group"] == jobs[job_ids[1]]["group"]
+  assert queue.busy_gpus() == [0, 1]
+  wait_for(lambda: finished(queue, job_ids))
+  jobs = jobs_by_id(queue)
+  for job_id in job_ids:
+    assert jobs[job_id]["state"] == DONE
+    assert jobs[job_id]["result"]["Status"] == "OK"
+
+def test_cancel(queue):
+  running, queued, next_job = [queue.submit("dgemm", params, [0])[0] for params in (SLOW, QUICK, QUICK)]
+  assert queue.cancel(queued)
+  assert jobs_by_id(queue)[queued]["state"] == CANCELLED
+  assert jobs_by_id(queue)[queued]["started"] is None
+  assert queue.cancel(running)
+  assert jobs_by_id(queue)[running]["state"] == CANCELLED
+  assert not queue.cancel(running)
+  # The GPU takes the next job once the cancelled process has ended.
+  wait_for(lambda: finished(queue, [next_job]))
+  jobs = jobs_by_id(queue)
+  assert jobs[next_job]["state"] == DONE
+  assert jobs[next_job]["started"] >= jobs[running]["finished"]
+  assert jobs[running]["state"] == CANCELLED and jobs[running]["result"] is None
+  assert queue.busy_gpus() == []
+  assert not queue.cancel(12345)
+
+def test_failing_job(queue):
+  job_id, = queue.submit("dgemm", {"matrix_size": 16, "n_repeats": 0}, [1])
+  wait_for(lambda: finished(queue, [job_id]))
+  job = jobs_by_id(queue)[job_id]
+  assert job["state"] == FAILED
+  assert job["result"]["Status"] == "INVALID_REPEATS"
+
+def test_invalid_submissions(queue):
+  with pytest.raises(ValueError):
+    queue.submit("linpack", QUICK, [0])
+  with pytest.raises(ValueError):
+    queue.submit("dgemm", QUICK, [2])
+  assert queue.snapshot() == ([], 0)
+
+def test_job_rows():
+  def job(job_id, group, gpu, state, avg=None, status="OK"):
+    result = {"Status": status, "Avg": avg, "Max": avg} if state in (DONE, FAILED) else None
+    return {"id": job_id, "group": group, "kind": "dgemm", "gpu": gpu, "params": {"matrix_size": 100},
+            "state": state, "result": result, "started": time.time(), "finished": None}
+  jobs = [job(1, 1, 0, DONE, 500.0), job(2, 1, 1, DONE, 400.0), job(3, 1, 2, FAILED, status="OOM"),
+          job(4, 2, 0, DONE, 300.0),
+          {"id": 5, "group": 3, "kind": "stream", "gpu": 0, "params": {}, "state": QUEUED, "result": None}]
+  rows = benchmark_queue.job_rows(jobs, "dgemm", ["Avg", "Max"])
+  assert rows == [["4", "0", "matrix_size=100", "done", "300.0", "300.0", ""],
+                  ["3", "2", "matrix_size=100", "failed (OOM)", "", "", ""],
+                  ["2", "1", "matrix_size=100", "done", "400.0", "400.0", "80 %"],
+                  ["1", "0", "matrix_size=100", "done", "500.0", "500.0", "100 %"]]
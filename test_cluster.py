@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# Agents and an aggregator over loopback TCP.
+
+import time
+
+import numpy as np
+import pytest
+
+import cluster
+import sample_store
+
+KEYS = ["Power", "GPU-Util"]
+HOST_KEYS = ["CPU"]
+
+def wait_for(condition, timeout=10.0):
+  t_end = time.monotonic() + timeout
+  while not condition():
+    if time.monotonic() > t_end:
+      raise TimeoutError
+    time.sleep(0.01)
+
+def put_rows(state, n, offset):
+  # Rows stamped in the clock of the sampler, like sampleCollector.collect returns them.
+  t_now = time.clock_gettime(time.CLOCK_MONOTONIC)
+  t = t_now - 0.1 * np.arange(n)[::-1]
+  values = offset + np.arange(n * state.num_gpus * len(KEYS), dtype=np.float64).reshape(n, state.num_gpus, len(KEYS))
+  host_values = offset + np.arange(n, dtype=np.float64).reshape(n, 1)
+  state.put_rows(t, values, host_values)
+  return values, host_values
+
+@pytest.fixture
+def aggregator():
+  aggregator = cluster.clusterAggregator("127.0.0.1:0")
+  aggregator.start()
+  yield aggregator
+  aggregator.stop()
+
+def test_parse_address():
+  assert cluster.parse_address("node1:9460") == ("tcp", "node1", 9460)
+  assert cluster.parse_address(":9460") == ("tcp", "", 9460)
+  assert cluster.parse_address("[::1]:9460") == ("tcp", "::1", 9460)
+  assert cluster.parse_address("unix:/tmp/monitor.sock") == ("unix", "/tmp/monitor.sock")
+  with pytest.raises(ValueError):
+    cluster.parse_address("node1")
+
+def test_samples_roundtrip():
+  t = np.array([1.5, 2.5])
+  values = np.arange(12, dtype=np.float32).reshape(2, 3, 2)
+  host_values = np.arange(4, dtype=np.float32).reshape(2, 2)
+  message = cluster.encode_samples(t, values, host_values)
+  kind, length = cluster.FRAME_HEADER.unpack_from(message)
+  payload = message[cluster.FRAME_HEADER.size:]
+  assert kind == cluster.SAMPLES and length == len(payload)
+  for a, b in zip(cluster.decode_samples(payload), (t, values, host_values)):
+    np.testing.assert_array_equal(a, b)
+
+def test_several_agents(aggregator):
+  address = "127.0.0.1:%d" % aggregator.port()
+  states = {"node1": sample_store.multiProcState(KEYS, 64, 2, host_keys=HOST_KEYS),
+            "node2": sample_store.multiProcState(KEYS, 64, 1, host_keys=HOST_KEYS)}
+  sent = {name: put_rows(state, 5, 100 * i) for i, (name, state) in enumerate(states.items())}
+  agents = [cluster.clusterAgent(state, ["GPU %d" % i for i in range(state.num_gpus)], name, address, period=0.05)
+            for name, state in states.items()]
+  for agent in agents:
+    agent.start()
+  try:
+    wait_for(lambda: len(aggregator.nodes) == 2
+                     and all(node.state.n_written.value == 5 for node in aggregator.node_list()))
+    t_cluster = time.time() - aggregator.start_time.value
+    for node in aggregator.node_list():
+      t, values, host_values = node.state.get_all()
+      assert node.device_names == ["GPU %d" % i for i in range(states[node.name].num_gpus)]
+      np.testing.assert_array_equal(values, sent[node.name][0])
+      np.testing.assert_array_equal(host_values, sent[node.name][1])
+      # The rows are placed at their wall clock time on the time axis of the cluster.
+      np.testing.assert_allclose(np.diff(t), 0.1, atol=1e-3)
+      assert t[-1] == pytest.approx(t_cluster, abs=0.5)
+      assert node.connected
+
+    # Rows which are written later are sent in the next batches.
+    put_rows(states["node2"], 3, 1000)
+    node2 = aggregator.nodes["node2"]
+    wait_for(lambda: node2.state.n_written.value == 8)
+    assert node2.state.get_all()[1][-1, 0, 0] == 1000 + 4
+  finally:
+    for agent in agents:
+      agent.stop()
+  wait_for(lambda: not any(node.connected for node in aggregator.node_list()))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# hostReader on fake /proc trees.
+
+import numpy as np
+import pytest
+
+import host_reader
+
+MEMINFO = "MemTotal:       1000 kB\nMemFree:         200 kB\nMemAvailable:    750 kB\n"
+
+def write_stat(proc_dir, cores):
+  # cores maps the cpu number to its (busy, idle) jiffies. The line of all cores is their sum.
+  busy = sum(b for b, i in cores.values())
+  idle = sum(i for b, i in cores.values())
+  lines = ["cpu  %d 0 0 %d 0 0 0 0 0 0" % (busy, idle)]
+  lines += ["cpu%d %d 0 0 %d 0 0 0 0 0 0" % (cpu, b, i) for cpu, (b, i) in sorted(cores.items())]
+  lines += ["intr 12345", "ctxt 678", "btime 1700000000", ""]
+  (proc_dir / "stat").write_text("\n".join(lines))
+
+@pytest.fixture
+def proc_dir(tmp_path):
+  proc = tmp_path / "proc"
+  proc.mkdir()
+  (proc / "meminfo").write_text(MEMINFO)
+  (proc / "loadavg").write_text("1.50 1.00 0.50 2/300 4242\n")
+  return proc
+
+def test_read_out(proc_dir):
+  write_stat(proc_dir, {0: (0, 0), 1: (0, 0)})
+  reader = host_reader.hostReader(proc_dir=str(proc_dir))
+  assert reader.keys == ["CPU", "Host-Memory", "Load", "CPU0", "CPU1"]
+  reader.read_out()
+  write_stat(proc_dir, {0: (100, 0), 1: (25, 75)})
+  values = reader.read_out()
+  assert values == pytest.approx([62.5, 25.0, 1.5, 100.0, 25.0])
+
+def test_offline_cores_keep_their_numbers(proc_dir):
+  # cpu1 is offline and has no line, so cpu2 must not be taken for it.
+  write_stat(proc_dir, {0: (0, 0), 2: (0, 0), 3: (0, 0)})
+  reader = host_reader.hostReader(proc_dir=str(proc_dir))
+  assert reader.n_cores == 4
+  reader.read_out()
+  write_stat(proc_dir, {0: (50, 50), 2: (100, 0), 3: (0, 100)})
+  values = reader.read_out()
+  assert values[3:] == pytest.approx([50.0, 0.0, 100.0, 0.0])
+
+  # A core which comes back online is read again.
+  write_stat(proc_dir, {0: (50, 50), 1: (10, 10), 2: (100, 0), 3: (0, 100)})
+  reader.read_out()
+  write_stat(proc_dir, {0: (50, 50), 1: (40, 20), 2: (100, 0), 3: (0, 100)})
+  values = reader.read_out()
+  assert values[3:] == pytest.approx([0.0, 75.0, 0.0, 0.0])
+
+def write_sysfs(sys_dir, bus_id, cpulist, numa_node, node_meminfo=None):
+  device_dir = sys_dir / "bus" / "pci" / "devices" / bus_id
+  device_dir.mkdir(parents=True)
+  (device_dir / "local_cpulist").write_text(cpulist + "\n")
+  (device_dir / "numa_node").write_text("%d\n" % numa_node)
+  if node_meminfo is not None:
+    node_dir = sys_dir / "devices" / "system" / "node" / ("node%d" % numa_node)
+    node_dir.mkdir(parents=True)
+    (node_dir / "meminfo").write_text(node_meminfo)
+
+def test_parse_cpulist():
+  assert host_reader.parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+  assert host_reader.parse_cpulist("") == []
+
+def test_pci_locality(tmp_path):
+  write_sysfs(tmp_path, "0000:3b:00.0", "2-3", 1)
+  assert host_reader.pci_locality(str(tmp_path), "0000:3B:00.0") == ([2, 3], 1)
+  assert host_reader.pci_locality(str(tmp_path), "0000:af:00.0") == ([], -1)
+
+def test_read_gpus(proc_dir, tmp_path):
+  sys_dir = tmp_path / "sys"
+  node_meminfo = "Node 1 MemTotal:  1000 kB\nNode 1 MemFree:  100 kB\nNode 1 FilePages:  400 kB\n"
+  write_sysfs(sys_dir, "0000:3b:00.0", "2-3", 1, node_meminfo)
+  # Without a NUMA node, the GPU gets the memory of the host.
+  write_sysfs(sys_dir, "0000:5e:00.0", "0,8", -1)
+  write_stat(proc_dir, {0: (0, 0), 1: (0, 0), 2: (0, 0), 3: (0, 0)})
+  reader = host_reader.hostReader(proc_dir=str(proc_dir), sys_dir=str(sys_dir),
+                                  pci_bus_ids=["0000:3B:00.0", "0000:5E:00.0", ""])
+  reader.read_out()
+  write_stat(proc_dir, {0: (100, 0), 1: (100, 0), 2: (50, 50), 3: (0, 100)})
+  reader.read_out()
+  gpu_values = reader.read_gpus()
+  assert reader.gpu_keys == ["Local-CPU", "NUMA-Memory"]
+  # Core 8 does not exist, and an unknown device is local to all cores.
+  assert gpu_values == pytest.approx(np.array([[25.0, 50.0], [100.0, 25.0], [62.5, 25.0]]))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# The /metrics endpoint, scraped over HTTP from a local server.
+
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import metrics
+import metrics_exporter
+import sample_store
+
+@pytest.fixture
+def state():
+  return sample_store.multiProcState(["Power", "GPU-Util"], 16, 2, host_keys=["CPU", "Host-Memory", "CPU0"])
+
+@pytest.fixture
+def url(state):
+  exporter = metrics_exporter.metricsExporter(state, ["GPU \"A\"", "GPU B"], "node1", metrics.default_registry())
+  server = metrics_exporter.start_server(exporter, 0, "127.0.0.1")
+  yield "http://127.0.0.1:%d" % server.server_address[1]
+  server.shutdown()
+  server.server_close()
+
+def scrape(url, accept=None):
+  request = urllib.request.Request(url, headers={"Accept": accept} if accept else {})
+  with urllib.request.urlopen(request, timeout=5) as response:
+    return response.headers["Content-Type"], response.read().decode()
+
+def test_no_samples(url):
+  content_type, body = scrape(url + "/metrics")
+  assert content_type == metrics_exporter.PROMETHEUS_CONTENT_TYPE
+  assert body == ""
+
+def test_latest_row(state, url):
+  state.put_row(10.0, np.array([[61.0, 50.0], [70.0, 0.0]]), np.array([12.5, 40.0, 80.0]))
+  _, body = scrape(url + "/metrics")
+  assert "monitorgpu_power{host=\"node1\",gpu=\"1\",name=\"GPU B\"} 70\n" in body
+  state.put_row(11.0, np.array([[62.5, float("nan")], [71.0, 1.0]]), np.array([13.0, 41.0, 90.0]))
+  _, body = scrape(url + "/metrics")
+  lines = body.splitlines()
+  assert "# HELP monitorgpu_power Power draw [W]" in lines
+  assert "# TYPE monitorgpu_power gauge" in lines
+  assert "monitorgpu_power{host=\"node1\",gpu=\"0\",name=\"GPU \\\"A\\\"\"} 62.5" in lines
+  assert "monitorgpu_gpu_util{host=\"node1\",gpu=\"0\",name=\"GPU \\\"A\\\"\"} NaN" in lines
+  assert "monitorgpu_power{host=\"node1\",gpu=\"1\",name=\"GPU B\"} 71" in lines
+  assert "monitorgpu_host_cpu{host=\"node1\"} 13" in lines
+  assert "monitorgpu_host_memory{host=\"node1\"} 41" in lines
+  assert "monitorgpu_host_cpu_core{host=\"node1\",core=\"0\"} 90" in lines
+  assert "# EOF" not in lines
+
+def test_openmetrics(state, url):
+  state.put_row(10.0, np.zeros((2, 2)), np.zeros(3))
+  content_type, body = scrape(url + "/metrics", "application/openmetrics-text; version=1.0.0")
+  assert content_type == metrics_exporter.OPENMETRICS_CONTENT_TYPE
+  assert body.endswith("\n# EOF\n")
+
+def test_unknown_path(url):
+  with pytest.raises(urllib.error.HTTPError) as e:
+    scrape(url + "/other")
+  assert e.value.code == 404
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# processAccounting with stub process tables instead of NVML.
+
+import numpy as np
+
+import process_accounting
+from process_accounting import OTHER_PID
+
+MiB = 1 << 20
+
+class stubDevice():
+  # getProcessUsage returns the (pid, memory in bytes, SM utilization) of the current table.
+  def __init__(self, num_gpus):
+    self.tables = [[] for _ in range(num_gpus)]
+
+  def getProcessUsage(self, gpu_id):
+    return self.tables[gpu_id]
+
+def test_slots_are_kept_and_reused():
+  device = stubDevice(2)
+  accounting = process_accounting.processAccounting(device, 2, 16, n_slots=4)
+  device.tables[0] = [(100, 10 * MiB, 50), (101, 20 * MiB, 30)]
+  device.tables[1] = [(200, 5 * MiB, -1)]
+  accounting.sample(0.0)
+  # 101 exits, 102 gets its slot, and 100 keeps its own.
+  device.tables[0] = [(100, 12 * MiB, 60), (102, 1 * MiB, 5)]
+  device.tables[1] = []
+  accounting.sample(1.0)
+
+  t, values, n_written = accounting.get_since(0)
+  assert n_written == 2
+  assert list(t) == [0.0, 1.0]
+  assert values.shape == (2, 2, 4, len(process_accounting.PROCESS_KEYS))
+  assert values[0, 0, :2].tolist() == [[100, 10, 50], [101, 20, 30]]
+  assert values[1, 0, :2].tolist() == [[100, 12, 60], [102, 1, 5]]
+  # An unknown SM utilization counts as 0, and a free slot has PID 0.
+  assert values[0, 1, 0].tolist() == [200, 5, 0]
+  assert not values[1, 1].any()
+
+def test_processes_without_a_slot_are_summed_up():
+  device = stubDevice(1)
+  accounting = process_accounting.processAccounting(device, 1, 16, n_slots=3)
+  device.tables[0] = [(pid, MiB, 10) for pid in range(100, 105)]
+  accounting.sample(0.0)
+  _, values, _ = accounting.get_since(0)
+  assert values[0, 0].tolist() == [[100, 1, 10], [101, 1, 10], [OTHER_PID, 3, 30]]
+
+def test_process_series():
+  device = stubDevice(1)
+  accounting = process_accounting.processAccounting(device, 1, 16, n_slots=3)
+  for t, table in enumerate([[(7, MiB, 10)], [(7, MiB, 20), (9, 2 * MiB, 5)], [(9, 2 * MiB, 6)]]):
+    device.tables[0] = table
+    accounting.sample(float(t))
+  _, values, _ = accounting.get_since(0)
+  pids, series = process_accounting.process_series(values, 0, "SM-Util")
+  assert pids == [7, 9]
+  np.testing.assert_array_equal(series, [[10, 0], [20, 5], [0, 6]])
+  pids, series = process_accounting.process_series(values, 0, "Memory")
+  np.testing.assert_array_equal(series, [[1, 0], [1, 2], [0, 2]])
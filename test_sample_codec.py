@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Round trips of the delta-encoded sample blocks.
+
+import numpy as np
+import pytest
+
+import sample_codec
+
+def random_block(rng):
+  n = int(rng.integers(0, 300))
+  num_gpus, n_keys, n_host = int(rng.integers(1, 9)), int(rng.integers(0, 10)), int(rng.integers(0, 5))
+  t = np.cumsum(rng.uniform(0, 2, n)) + rng.uniform(0, 2e9)
+  values = rng.integers(-2**40, 2**40, (n, num_gpus, n_keys)).astype(np.float64)
+  mask = rng.random(values.shape)
+  values[mask < 0.3] = rng.normal(size=values.shape)[mask < 0.3]
+  values[mask > 0.98] = rng.choice([np.nan, np.inf, -np.inf, -0.0, 2.0**70, 5e-324])
+  host_values = rng.normal(size=(n, n_host)) * 100
+  return t, values, host_values
+
+def assert_restored(block, t, values, host_values):
+  t2, values2, host_values2 = sample_codec.decode_block(block)
+  assert values2.shape == values.shape and host_values2.shape == host_values.shape
+  # Bitwise, so that NaN and -0.0 count as well.
+  assert np.array_equal(values.view(np.uint64), values2.view(np.uint64))
+  assert np.array_equal(host_values.view(np.uint64), host_values2.view(np.uint64))
+  assert np.all(np.abs(t2 - t) <= 1e-6 + 1e-15 * np.abs(t))
+
+@pytest.mark.parametrize("seed", range(100))
+def test_random_blocks(seed):
+  t, values, host_values = random_block(np.random.default_rng(seed))
+  assert_restored(sample_codec.encode_block(t, values, host_values), t, values, host_values)
+
+def test_empty_block():
+  t, values, host_values = np.zeros(0), np.zeros((0, 2, 3)), np.zeros((0, 1))
+  assert_restored(sample_codec.encode_block(t, values, host_values), t, values, host_values)
+
+def test_constant_columns_are_small():
+  n = 1000
+  t = 1.7e9 + 0.1 * np.arange(n)
+  values = np.tile([45.0, 1410.0, 61.25], (n, 4, 1))
+  host_values = np.full((n, 3), 12.5)
+  block = sample_codec.encode_block(t, values, host_values)
+  assert len(block) < 0.01 * (t.nbytes + values.nbytes + host_values.nbytes)
+  assert_restored(block, t, values, host_values)
+
+def test_varints():
+  u = np.array([0, 1, 127, 128, 300, 2**32, 2**63, 2**64 - 1], dtype=np.uint64)
+  np.testing.assert_array_equal(sample_codec.decode_varints(sample_codec.encode_varints(u), len(u)), u)
+  x = np.array([0, -1, 1, -2**62, 2**62 - 1], dtype=np.int64)
+  np.testing.assert_array_equal(sample_codec.unzigzag(sample_codec.zigzag(x)), x)
+  with pytest.raises(ValueError):
+    sample_codec.decode_varints(sample_codec.encode_varints(u), len(u) + 1)
+
+def test_consecutive_blocks():
+  rng = np.random.default_rng(0)
+  blocks = [random_block(rng) for _ in range(3)]
+  stream = b"".join(sample_codec.encode_block(*block) for block in blocks)
+  offset = 0
+  for block in blocks:
+    size = sample_codec.block_size(stream[offset:])
+    assert_restored(stream[offset:offset + size], *block)
+    offset += size
+  assert offset == len(stream)
+
+def test_corrupt_blocks():
+  block = sample_codec.encode_block(np.zeros(2), np.ones((2, 1, 1)), np.zeros((2, 0)))
+  with pytest.raises(ValueError):
+    sample_codec.decode_block(b"XXXX" + block[4:])
+  with pytest.raises(ValueError):
+    sample_codec.decode_block(block[:-4] + b"\0\0\0\0")
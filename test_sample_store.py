@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# The sample store, its rollups and the sample collector with a fake device.
+
+import numpy as np
+import pytest
+
+import metrics
+import sample_store
+
+def test_rollup_buckets():
+  state = sample_store.multiProcState(["Power"], 64, 2, host_keys=["CPU"])
+  tier = sample_store.rollupTier(["Power"], 2, 10, 8, state.start_time, ["CPU"])
+  t = 100.0 + np.arange(25)
+  rows = np.stack([np.arange(25.0), 2 * np.arange(25.0)], axis=1)[:, :, None]
+  host_rows = np.arange(25.0)[:, None]
+  state.put_rows(t, rows, host_rows)
+  tier.add(t, rows, host_rows)
+  t_buckets, stats, host_stats, n_written = tier.get_since(0)
+  # The third bucket is not complete yet.
+  assert n_written == 2
+  assert list(t_buckets) == [0, 10]
+  np.testing.assert_array_equal(stats[:, 0, :, 0], [[0, 4.5, 9], [10, 14.5, 19]])
+  np.testing.assert_array_equal(stats[:, 1, :, 0], [[0, 9, 18], [20, 29, 38]])
+  np.testing.assert_array_equal(host_stats[:, :, 0], [[0, 4.5, 9], [10, 14.5, 19]])
+
+def test_rollup_leaves_out_nan():
+  # A counter rate is NaN in the first row, which must not spoil the statistics of its bucket.
+  state = sample_store.multiProcState(["NVLink-TX", "Power"], 64, 1)
+  tier = sample_store.rollupTier(["NVLink-TX", "Power"], 1, 10, 8, state.start_time)
+  t = np.arange(21.0)
+  rows = np.zeros((21, 1, 2))
+  rows[:, 0, 0] = np.arange(21.0)
+  rows[0, 0, 0] = np.nan
+  rows[10:20, 0, 1] = np.nan
+  state.put_rows(t, rows, np.zeros((21, 0)))
+  tier.add(t, rows, np.zeros((21, 0)))
+  _, stats, _, n_written = tier.get_since(0)
+  assert n_written == 2
+  np.testing.assert_array_equal(stats[0, 0, :, 0], [1, 5, 9])
+  np.testing.assert_array_equal(stats[0, 0, :, 1], [0, 0, 0])
+  np.testing.assert_array_equal(stats[1, 0, :, 0], [10, 14.5, 19])
+  # A column without any value in a bucket is NaN.
+  assert np.isnan(stats[1, 0, :, 1]).all()
+
+class fakeDevice():
+  # Hands out the rows which the test puts into self.pending, like the C sampler.
+  def __init__(self, num_devices):
+    self.num_devices = num_devices
+    self.pending = np.zeros((0, 0))
+
+  def getNumDevices(self):
+    return self.num_devices
+
+  def startSampler(self, period, buffer_size, items, divisors):
+    pass
+
+  def stopSampler(self):
+    pass
+
+  def drainSamples(self, buffer):
+    n = len(self.pending)
+    buffer[:n] = self.pending
+    self.pending = np.zeros((0, buffer.shape[1]))
+    return n
+
+class fakeHostReader():
+  keys = ["CPU"]
+  gpu_keys = []
+
+  def read_out(self):
+    return np.array([50.0])
+
+def test_counter_rates():
+  registry = metrics.default_registry()
+  gpu_metrics = [registry.get("Power"), registry.get("NVLink-TX")]
+  device = fakeDevice(1)
+  collector = sample_store.sampleCollector(device, fakeHostReader(), gpu_metrics, 1, 0.1, 0.1)
+  collector.start()
+  # Rows of timestamp, power and the NVLink counter.
+  device.pending = np.array([[1.0, 60, 1000], [2.0, 61, 1500], [2.0, 62, 1600]])
+  t, rows, host_rows = collector.collect()
+  assert list(t) == [1, 2, 2]
+  assert list(rows[:, 0, 0]) == [60, 61, 62]
+  np.testing.assert_array_equal(host_rows, [[50], [50], [50]])
+  # The first row has no earlier counter value, and the third has the same timestamp.
+  rates = rows[:, 0, 1]
+  assert np.isnan(rates[0]) and rates[1] == 500 and np.isnan(rates[2])
+  # The next call continues from the last row of this one.
+  device.pending = np.array([[4.0, 60, 2600]])
+  t, rows, host_rows = collector.collect()
+  assert rows[0, 0, 1] == pytest.approx(500)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# The native sampler thread, run against the stub NVML library:
+#   g++ -std=c++17 -shared -fPIC -o libnvidia-ml.so stub_nvml.cpp
+#   LD_LIBRARY_PATH=. python -m pytest test_sampler.py
+
+import time
+
+import numpy as np
+import pytest
+
+nvml = pytest.importorskip("nvml")
+
+ITEMS = ["Temperature", "Power"]
+PERIOD = 0.01
+
+@pytest.fixture
+def device():
+  try:
+    device = nvml.deviceManager()
+  except Exception as e:
+    pytest.skip("No NVML library: %s" % e)
+  # Without the library, the deviceManager only reports no devices.
+  if device.getNumDevices() == 0:
+    pytest.skip("NVML reports no devices, e.g. libnvidia-ml.so is not on LD_LIBRARY_PATH")
+  yield device
+  device.stopSampler()
+
+def drain(device):
+  buffer = np.zeros((1024, 1 + device.getNumDevices() * len(ITEMS)))
+  n = device.drainSamples(buffer)
+  return buffer[:n]
+
+def test_drain_before_start(device):
+  with pytest.raises(RuntimeError):
+    drain(device)
+
+def test_rows_are_stamped_with_time_monotonic(device):
+  t_start = time.monotonic()
+  device.startSampler(PERIOD, 1024, ITEMS, [1, 2])
+  time.sleep(20 * PERIOD)
+  device.stopSampler()
+  t_stop = time.monotonic()
+  rows = drain(device)
+  assert len(rows) > 1
+  # The stub reports nonzero values for all devices.
+  assert rows.shape[1] == 1 + device.getNumDevices() * len(ITEMS)
+  assert np.all(rows[:, 1:] > 0)
+  assert np.all(np.diff(rows[:, 0]) > 0)
+  assert t_start <= rows[0, 0] and rows[-1, 0] <= t_stop
+  # The ticks are a fixed period apart, whatever the readout costs.
+  assert np.median(np.diff(rows[:, 0])) == pytest.approx(PERIOD, rel=0.5)
+
+def test_stop_and_restart(device):
+  device.startSampler(PERIOD, 1024, ITEMS)
+  with pytest.raises(RuntimeError):
+    device.startSampler(PERIOD, 1024, ITEMS)
+  time.sleep(5 * PERIOD)
+  device.stopSampler()
+  first = drain(device)
+  assert len(first) > 0
+  time.sleep(5 * PERIOD)
+  assert len(drain(device)) == 0
+
+  device.startSampler(PERIOD, 1024, ITEMS)
+  time.sleep(5 * PERIOD)
+  device.stopSampler()
+  second = drain(device)
+  assert len(second) > 0
+  assert second[0, 0] > first[-1, 0]
+
+def test_full_buffer_keeps_the_newest_rows(device):
+  device.startSampler(PERIOD, 4, ITEMS)
+  time.sleep(20 * PERIOD)
+  device.stopSampler()
+  t_stop = time.monotonic()
+  rows = drain(device)
+  assert len(rows) == 4
+  assert t_stop - rows[-1, 0] < 5 * PERIOD
+
+def test_invalid_arguments(device):
+  for period in [0, 1e-10, float("nan"), float("inf"), 1e12]:
+    with pytest.raises(ValueError):
+      device.startSampler(period, 1024, ITEMS)
+  with pytest.raises(ValueError):
+    device.startSampler(PERIOD, 0, ITEMS)
+  with pytest.raises(ValueError):
+    device.startSampler(PERIOD, 1024, ITEMS, [1, 0])
+  with pytest.raises(ValueError):
+    device.startSampler(PERIOD, 1024, ITEMS, [1])
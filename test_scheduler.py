@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# tickScheduler with a fake clock.
+
+import pytest
+
+import scheduler
+
+class fakeClock():
+  def __init__(self, t=1000.0):
+    self.t = t
+
+  def __call__(self):
+    return self.t
+
+def test_divisor_rounding():
+  ticks = scheduler.tickScheduler(0.1)
+  assert ticks.divisor(None) == 1
+  assert ticks.divisor(0.01) == 1
+  assert ticks.divisor(0.1) == 1
+  assert ticks.divisor(0.14) == 1
+  assert ticks.divisor(0.16) == 2
+  assert ticks.divisor(1.0) == 10
+  assert ticks.divisor(2.5) == 25
+  assert ticks.add("slow", 0.96) == 10
+  with pytest.raises(ValueError):
+    scheduler.tickScheduler(0)
+
+def test_due_on_the_ticks_of_each_divisor():
+  clock = fakeClock()
+  ticks = scheduler.tickScheduler(0.1, clock=clock)
+  ticks.add("fast")
+  ticks.add("medium", 0.2)
+  ticks.add("slow", 0.3)
+  ticks.start()
+  due = []
+  for i in range(7):
+    clock.t = 1000.0 + i * 0.1
+    due.append(ticks.due())
+  assert due == [["fast", "medium", "slow"], ["fast"], ["fast", "medium"], ["fast", "slow"],
+                 ["fast", "medium"], ["fast"], ["fast", "medium", "slow"]]
+
+def test_due_after_a_stall():
+  # The missed ticks are not caught up: each task runs once and then at its next multiple.
+  clock = fakeClock()
+  ticks = scheduler.tickScheduler(0.1, clock=clock)
+  ticks.add("fast")
+  ticks.add("slow", 0.4)
+  ticks.start()
+  assert ticks.due() == ["fast", "slow"]
+  clock.t += 0.55
+  assert ticks.due() == ["fast", "slow"]
+  assert ticks.due() == []
+  assert ticks.time_to_next() == pytest.approx(0.05)
+  clock.t += 0.05
+  assert ticks.due() == ["fast"]
+  assert ticks.time_to_next() == pytest.approx(0.1)
+  clock.t += 0.2
+  assert ticks.due() == ["fast", "slow"]
+
+def test_start_resets_the_ticks():
+  clock = fakeClock()
+  ticks = scheduler.tickScheduler(0.5, clock=clock)
+  ticks.add("slow", 2.0)
+  ticks.start()
+  assert ticks.due() == ["slow"]
+  clock.t += 1.0
+  assert ticks.due() == []
+  # After a restart, the ticks count from the new start and every task is due at once.
+  ticks.start()
+  assert ticks.current_tick() == 0
+  assert ticks.due() == ["slow"]
+  clock.t += 1.5
+  assert ticks.due() == []
+  assert ticks.time_to_next() == pytest.approx(0.5)